@@ -1,43 +1,290 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
+from fastapi.responses import PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import threading
-import asyncio # Need asyncio to run send_text from a different thread
+import asyncio
 import json # To serialize Pydantic models/dicts to JSON
+import time
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
 
 import config
-from models import Product, ScanResultWebSocketMessage # Import models
+import metrics
+from models import Product, ScanResultWebSocketMessage, DecodeResponse # Import models
+from decode_service import DecodeService, DecodeServiceBusy, ImageTooLarge
+
+
+def _to_json(message) -> str:
+    """Serializes a Pydantic model (v1 or v2), dict or string to JSON text."""
+    if isinstance(message, str):
+        return message
+    if hasattr(message, "model_dump_json"):
+        return message.model_dump_json()
+    if hasattr(message, "json"):
+        return message.json()
+    return json.dumps(message)
+
+
+class MultipartImageReader:
+    """
+    Collects the files of one multipart/form-data field in memory while the body streams in.
+
+    Starlette's form parser spools every upload to a temporary file before the endpoint
+    runs; this reader enforces the per-request image count and per-image size limits
+    chunk by chunk instead, and never touches the disk.
+    """
+    def __init__(self, boundary: bytes, field_name: str, max_images: int, max_image_bytes: int):
+        self.field_name = field_name.encode('utf-8')
+        self.max_images = max_images
+        self.max_image_bytes = max_image_bytes
+        self.images = []          # (filename, bytes) in upload order
+        self._headers = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._data = None         # Bytes of the current file part, or None while skipping a part
+        self._filename = None
+        self._parser = multipart.MultipartParser(boundary, {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def write(self, chunk: bytes):
+        self._parser.write(chunk)
+
+    def finalize(self):
+        self._parser.finalize()
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        if options.get(b'name') != self.field_name:
+            return  # Other form fields are ignored
+        if len(self.images) >= self.max_images:
+            raise HTTPException(status_code=413, detail=f"At most {self.max_images} images per request")
+        filename = options.get(b'filename')
+        self._filename = filename.decode('utf-8', 'replace') if filename is not None else None
+        self._data = bytearray()
+
+    def _on_part_data(self, data, start, end):
+        if self._data is None:
+            return
+        self._data.extend(data[start:end])
+        if len(self._data) > self.max_image_bytes:
+            raise HTTPException(status_code=413,
+                                detail=f"Image '{self._filename}' exceeds {self.max_image_bytes} bytes")
+
+    def _on_part_end(self):
+        if self._data is not None:
+            self.images.append((self._filename, bytes(self._data)))
+        self._data = None
+
+
+def _check_content_length(request: Request, limit: int, detail: str):
+    """Rejects a request whose declared body size is over `limit` before any of it is read."""
+    content_length = request.headers.get('content-length')
+    if content_length is None:
+        return
+    try:
+        declared = int(content_length)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if declared > limit:
+        raise HTTPException(status_code=413, detail=detail)
+
+
+class WebSocketClient:
+    """One connected display with its own bounded queue of outgoing messages."""
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender_task: asyncio.Task | None = None
+        self.dropped = 0
+
+
+class BroadcastHub:
+    """
+    Fans scan results out to all WebSocket clients from the uvicorn event loop.
+
+    publish() may be called from any thread. Each message is serialized once and put
+    on every client's bounded send queue; a per-client task drains its queue, so one
+    slow display cannot hold up the others. When a client's queue is full the oldest
+    pending message is dropped ('drop_oldest') or the client is disconnected ('disconnect').
+    """
+    def __init__(self,
+                 queue_size: int = getattr(config, 'WS_CLIENT_QUEUE_SIZE', 32),
+                 overflow_policy: str = getattr(config, 'WS_OVERFLOW_POLICY', 'drop_oldest')):
+        if overflow_policy not in ('drop_oldest', 'disconnect'):
+            raise ValueError(f"Unknown WebSocket overflow policy: {overflow_policy}")
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.clients: list[WebSocketClient] = []  # Only touched on the event loop
+        self.messages_published = 0
+        self.messages_dropped = 0
+        self.slow_disconnects = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Remembers the event loop the server runs on (called at startup)."""
+        self.loop = loop
+
+    def publish(self, message) -> bool:
+        """Queues a message for every connected client. Safe to call from any thread."""
+        if self.loop is None or self.loop.is_closed():
+            return False
+        text = _to_json(message)  # Serialize once, not once per client
+        self.loop.call_soon_threadsafe(self._fan_out, text)
+        return True
+
+    def _fan_out(self, text: str):
+        self.messages_published += 1
+        for client in list(self.clients):
+            if client.queue.full():
+                if self.overflow_policy == 'disconnect':
+                    print(f"WebSocket client {client.websocket.client} is too slow; disconnecting.")
+                    self.slow_disconnects += 1
+                    self._drop_client(client)
+                    asyncio.ensure_future(self._close(client.websocket))
+                    continue
+                client.queue.get_nowait()
+                client.dropped += 1
+                self.messages_dropped += 1
+            client.queue.put_nowait(text)
 
-# This list will hold active WebSocket connections
-# We need to access this list from the main thread
-active_websockets: list[WebSocket] = []
+    async def register(self, websocket: WebSocket) -> WebSocketClient:
+        client = WebSocketClient(websocket, self.queue_size)
+        client.sender_task = asyncio.ensure_future(self._sender(client))
+        self.clients.append(client)
+        return client
 
-def create_api_app() -> FastAPI:
-    """Creates the FastAPI application instance with a WebSocket endpoint."""
+    def unregister(self, client: WebSocketClient):
+        self._drop_client(client)
+
+    def _drop_client(self, client: WebSocketClient):
+        if client in self.clients:
+            self.clients.remove(client)
+        if client.sender_task is not None and not client.sender_task.done():
+            client.sender_task.cancel()
+
+    async def _sender(self, client: WebSocketClient):
+        try:
+            while True:
+                text = await client.queue.get()
+                await client.websocket.send_text(text)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Failed to send to WebSocket client {client.websocket.client}: {e}")
+            self._drop_client(client)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # "Try again later"
+        except Exception:
+            pass
+
+    def get_stats(self) -> dict:
+        return {
+            "clients": len(self.clients),
+            "messages_published": self.messages_published,
+            "messages_dropped": self.messages_dropped,
+            "slow_disconnects": self.slow_disconnects,
+        }
+
+
+def create_api_app(db_handler=None, preview=None) -> FastAPI:
+    """
+    Creates the FastAPI application instance with a WebSocket endpoint and decode endpoints.
+
+    Args:
+        db_handler: Optional DBHandler used when a decode request asks for product lookup.
+        preview: Optional PreviewPublisher whose latest snapshot is served on /preview.jpg.
+    """
     app = FastAPI(
         title="Barcode Scanner WebSocket Server",
         description="Provides a WebSocket endpoint to push scanned product info.",
         version="1.0.0"
     )
+    hub = BroadcastHub()
+    app.state.hub = hub
+    decode_service = DecodeService()
+    app.state.decode_service = decode_service
+    max_images = getattr(config, 'DECODE_API_MAX_IMAGES', 16)
+    max_image_bytes = getattr(config, 'DECODE_API_MAX_IMAGE_BYTES', 8 * 1024 * 1024)
+    max_request_bytes = getattr(config, 'DECODE_API_MAX_REQUEST_BYTES', 32 * 1024 * 1024)
+
+    async def run_decode(images: list[tuple[str | None, bytes]], lookup: bool) -> dict:
+        """Decodes the images and optionally attaches product documents to each barcode."""
+        start_time = time.perf_counter()
+        try:
+            results = await decode_service.decode_images([data for _, data in images])
+        except DecodeServiceBusy as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        for (filename, _), result in zip(images, results):
+            result['filename'] = filename
+
+        lookup_ms = None
+        if lookup:
+            if db_handler is None:
+                raise HTTPException(status_code=400, detail="Product lookup is not available on this server")
+            barcodes = {b['data'] for result in results for b in result['barcodes']}
+            lookup_start = time.perf_counter()
+            # One bulk query for all images; DBHandler is blocking, so keep it off the loop.
+            products = await run_in_threadpool(db_handler.get_products_by_barcodes, barcodes) if barcodes else {}
+            lookup_ms = (time.perf_counter() - lookup_start) * 1000
+            for result in results:
+                for barcode in result['barcodes']:
+                    barcode['product_details'] = products.get(barcode['data'])
+
+        return {"results": results, "lookup_ms": lookup_ms,
+                "total_ms": (time.perf_counter() - start_time) * 1000}
+
+    @app.on_event("shutdown")
+    async def stop_decode_service():
+        decode_service.close()
+
+    @app.on_event("startup")
+    async def bind_hub_to_loop():
+        hub.bind_loop(asyncio.get_running_loop())
 
     @app.websocket("/ws")
     async def websocket_endpoint(websocket: WebSocket):
         """Handles incoming WebSocket connections."""
         await websocket.accept()
-        active_websockets.append(websocket)
-        print(f"WebSocket connection accepted from {websocket.client}. Total active: {len(active_websockets)}")
+        client = await hub.register(websocket)
+        print(f"WebSocket connection accepted from {websocket.client}. Total active: {len(hub.clients)}")
         try:
-            # Keep the connection alive. Listen for messages (optional for push-only).
-            # If the client sends data, process it here.
-            # If not expecting client messages, this loop mainly handles disconnects.
+            # Protocol-level pings are handled by uvicorn (ws_ping_interval). Here we only
+            # answer application keep-alives; receive_text() raises WebSocketDisconnect on close.
             while True:
-                # You can receive messages here if needed, e.g., keep-alives, commands
-                # data = await websocket.receive_text()
-                # print(f"Received message from {websocket.client}: {data}")
-                # For a simple push server, you might just wait or pass
-                await asyncio.sleep(60) # Keep the connection open, wait for pings/disconnects
-                # A better approach for just staying alive might involve handling pings
-                # or having the client send occasional keep-alives.
-                # receive_text() or receive_bytes() will automatically raise WebSocketDisconnect on close
+                data = await websocket.receive_text()
+                if data == "ping":
+                    await websocket.send_text("pong")
 
         except WebSocketDisconnect as e:
             # Handle client disconnect
@@ -47,32 +294,90 @@ def create_api_app() -> FastAPI:
             print(f"WebSocket error with client {websocket.client}: {e}")
         finally:
             # Clean up the connection
-            if websocket in active_websockets:
-                active_websockets.remove(websocket)
-                print(f"WebSocket connection closed for {websocket.client}. Total active: {len(active_websockets)}")
+            hub.unregister(client)
+            print(f"WebSocket connection closed for {websocket.client}. Total active: {len(hub.clients)}")
+
+    multipart_files_schema = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["files"],
+        "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}}}}}}}
 
+    @app.post("/decode", response_model=DecodeResponse, openapi_extra=multipart_files_schema)
+    async def decode_images(request: Request, lookup: bool = False):
+        """Decodes EAN-13 barcodes in one or more uploaded images (multipart form field `files`)."""
+        content_type, options = parse_options_header(request.headers.get('content-type', ''))
+        boundary = options.get(b'boundary')
+        if content_type != b'multipart/form-data' or not boundary:
+            raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+        too_large = f"Request exceeds {max_request_bytes} bytes"
+        _check_content_length(request, max_request_bytes, too_large)
+
+        # The body is counted and parsed as it streams in, so no limit is checked after the fact.
+        reader = MultipartImageReader(boundary, 'files', max_images, max_image_bytes)
+        total_bytes = 0
+        async for chunk in request.stream():
+            total_bytes += len(chunk)
+            if total_bytes > max_request_bytes:
+                raise HTTPException(status_code=413, detail=too_large)
+            reader.write(chunk)
+        reader.finalize()
+        if not reader.images:
+            raise HTTPException(status_code=422, detail="No images in form field 'files'")
+        return await run_decode(reader.images, lookup)
+
+    @app.post("/decode/raw", response_model=DecodeResponse)
+    async def decode_raw_image(request: Request, lookup: bool = False):
+        """Decodes EAN-13 barcodes in a single image sent as the raw request body."""
+        _check_content_length(request, max_image_bytes, f"Image exceeds {max_image_bytes} bytes")
+        data = bytearray()
+        async for chunk in request.stream():
+            data.extend(chunk)
+            if len(data) > max_image_bytes:
+                raise HTTPException(status_code=413, detail=f"Image exceeds {max_image_bytes} bytes")
+        return await run_decode([(None, bytes(data))], lookup)
+
+    metrics.register_callback('websocket_clients', 'Connected WebSocket displays', lambda: len(hub.clients))
+    metrics.register_callback('websocket_messages_dropped_total', 'Messages dropped for slow WebSocket clients',
+                              lambda: hub.messages_dropped, 'counter')
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics_endpoint():
+        """Pipeline metrics in the Prometheus text format."""
+        return PlainTextResponse(metrics.render_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get("/preview.jpg")
+    async def preview_image(stream: str | None = None):
+        """Latest downscaled camera snapshot with barcode boxes (headless debugging). `stream` picks the camera."""
+        jpeg, timestamp = preview.get_jpeg(stream) if preview is not None else (None, None)
+        if jpeg is None:
+            raise HTTPException(status_code=404, detail="No preview available")
+        return Response(content=jpeg, media_type="image/jpeg",
+                        headers={"Cache-Control": "no-store", "X-Preview-Timestamp": f"{timestamp:.3f}"})
 
     # Add a simple health check endpoint (optional, but good practice)
     @app.get("/health")
     async def health_check():
         """Basic health check."""
-        return {"status": "ok", "message": "API is running"}
+        return {"status": "ok", "message": "API is running", "websocket": hub.get_stats(),
+                "decode": decode_service.get_stats()}
 
     return app
 
 # Helper class to run the FastAPI application (including WebSocket) in a separate thread
 class APIServerThread(threading.Thread):
-    def __init__(self):
+    def __init__(self, db_handler=None, preview=None):
         super().__init__()
         # Create the FastAPI app
-        self.app = create_api_app()
+        self.app = create_api_app(db_handler, preview)
         # Configure uvicorn server
         # Need to explicitly create the config and server to access the loop later
         self.config = uvicorn.Config(
             self.app,
             host=config.API_HOST,
             port=config.API_PORT,
-            log_level="info"
+            log_level="info",
+            # uvicorn sends WebSocket pings and drops clients that stop answering.
+            ws_ping_interval=getattr(config, 'WS_PING_INTERVAL', 20.0),
+            ws_ping_timeout=getattr(config, 'WS_PING_TIMEOUT', 20.0),
             # Disable standard signal handlers as we're in a thread
             # https://github.com/encode/uvicorn/issues/742#issuecomment-645110915
             # log_config=None, # Optional: suppress uvicorn's logging if you manage it elsewhere
@@ -96,11 +401,15 @@ class APIServerThread(threading.Thread):
 
     # Method to get the list of active WebSocket connections
     def get_active_websockets(self) -> list[WebSocket]:
-        return active_websockets
+        return [client.websocket for client in self.app.state.hub.clients]
+
+    # Method to get the asyncio loop where the server is running (None until it has started)
+    def get_asyncio_loop(self) -> asyncio.AbstractEventLoop | None:
+         return self.app.state.hub.loop
 
-    # Method to get the asyncio loop where the server is running
-    def get_asyncio_loop(self) -> asyncio.AbstractEventLoop:
-         return self.server.config.loop
+    def broadcast(self, message: ScanResultWebSocketMessage):
+        """Pushes a scan result to all connected WebSocket clients. Safe to call from any thread."""
+        self.app.state.hub.publish(message)
 
     # Note: A robust stop method would involve signaling uvicorn's server object
     # and potentially joining the thread, but daemon=True simplifies exit for demos.
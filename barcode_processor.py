@@ -1,11 +1,21 @@
 from pyzbar import pyzbar
 from pyzbar.pyzbar import ZBarSymbol
+import itertools
+import threading
 import time
-import cv2 # Keep import in case future preprocessing is added
+import cv2
+import numpy as np
+import config
+import ean13
 
 def process_barcodes(gray_frame):
     """
-    Processes a grayscale frame to detect EAN-13 barcodes.
+    Processes a grayscale frame to detect EAN-13 barcodes with the configured decoder
+    chain (config.DECODER_CHAIN). Backends run in order and their results are merged;
+    the chain stops at the first backend that vouches for the whole frame. A full
+    decoder (pyzbar, OpenCV) vouches whenever it finds something; the cheap scanline
+    decoder only when nothing else on its scanlines looks like a barcode, so a second
+    item or a code it cannot read still reaches the next backend.
 
     Args:
         gray_frame: Grayscale image frame (NumPy array).
@@ -17,18 +27,336 @@ def process_barcodes(gray_frame):
             latency: Processing time in seconds.
     """
     start_time = time.perf_counter()
+    found = {}  # data -> barcode info; the first backend to report a code keeps its rect
+    for backend in get_decoder_chain():
+        barcodes, complete = backend.decode(gray_frame)
+        for barcode in barcodes:
+            found.setdefault(barcode['data'], barcode)
+        if complete:
+            break
+    processed_results = list(found.values())
+    return processed_results, time.perf_counter() - start_time
+
+
+# --- Decoder backends ---
+
+class DecoderBackend:
+    """
+    A decoder process_barcodes() can chain. Subclasses implement _decode(), returning
+    the same barcode dicts as process_barcodes() and whether they vouch for the frame;
+    this class counts calls, hits, frames it vouched for and time.
+
+    One instance is shared by every thread of the process (scan loop, decode service),
+    so _decode() keeps no per-frame state on the instance and the counters are locked.
+    """
+    name = None
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.complete = 0  # Calls that ended the chain
+        self.seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def available(cls):
+        """False if the backend's library is missing in this installation."""
+        return True
+
+    def decode(self, gray_frame):
+        """
+        Returns:
+            tuple: (barcodes, complete)
+                complete: True if the backend vouches that it found every barcode in the frame.
+        """
+        start_time = time.perf_counter()
+        barcodes, complete = self._decode(gray_frame) if gray_frame.size else ([], False)
+        complete = bool(barcodes) and complete
+        elapsed = time.perf_counter() - start_time
+        with self._stats_lock:
+            self.seconds += elapsed
+            self.calls += 1
+            if barcodes:
+                self.hits += 1
+            if complete:
+                self.complete += 1
+        return barcodes, complete
+
+    def _decode(self, gray_frame):
+        """
+        Returns:
+            tuple: (barcodes, complete) like decode(). Full decoders (pyzbar, OpenCV) are
+                trusted and always return complete=True.
+        """
+        raise NotImplementedError
+
+    def get_stats(self):
+        """Returns call and hit counts, the hit rate and the average time per call."""
+        with self._stats_lock:
+            calls, hits, complete, seconds = self.calls, self.hits, self.complete, self.seconds
+        return {
+            'calls': calls,
+            'hits': hits,
+            'hit_rate': hits / calls if calls else 0.0,
+            'complete': complete,
+            'seconds': seconds,
+            'avg_ms': seconds / calls * 1000 if calls else 0.0,
+        }
+
+
+def _digit_table(codes, offset=0):
+    """Maps the run widths of 7-module digit patterns (as _width_keys() keys) to digit + offset."""
+    table = np.full(5 ** 4, -1, dtype=np.int16)
+    for digit, pattern in enumerate(codes):
+        runs = [len(list(run)) for _, run in itertools.groupby(pattern)]
+        table[((runs[0] * 5 + runs[1]) * 5 + runs[2]) * 5 + runs[3]] = digit + offset
+    return table
+
+
+def _first_digit_table():
+    """Maps the L/G parity of the six left-hand digits (G = 1, as a 6-bit number) to the first digit."""
+    table = np.full(64, -1, dtype=np.int16)
+    for digit, parity in enumerate(ean13.PARITY_PATTERNS):
+        table[int(parity.replace('L', '0').replace('G', '1'), 2)] = digit
+    return table
+
+
+def _width_keys(widths):
+    widths = np.clip(widths, 0, 4)
+    return ((widths[..., 0] * 5 + widths[..., 1]) * 5 + widths[..., 2]) * 5 + widths[..., 3]
+
+
+class ScanlineEAN13Decoder(DecoderBackend):
+    """
+    Pure NumPy EAN-13 decoder for clean, roughly axis-aligned barcodes.
+
+    A few evenly spaced rows (and columns) are binarized at their mid-gray level and
+    turned into run lengths. Every window of 59 runs that starts with a bar is a
+    candidate symbol: its guard bars must be one module wide, each digit's four runs
+    are rounded to module widths and looked up in the L/G/R tables, and the parity
+    pattern and check digit must match. All candidates of all lines are checked at
+    once. Lines are also read backwards, for upside-down barcodes.
+
+    It vouches for a frame only if every dense stretch of bars and spaces on its lines
+    lies inside a reported symbol, and if no row or column of the whole frame, sampled
+    or not, has a dense stretch of strong edges outside the reported symbols. Anything
+    else (a second item between the lines or in the outer band, a tilted code, another
+    symbology) leaves the frame to the next backend.
+    """
+    name = 'scanline'
+
+    SYMBOL_RUNS = 59           # 3 + 6 * 4 + 5 + 6 * 4 + 3 bars and spaces
+    GUARD_RUNS = np.array([0, 1, 2, 27, 28, 29, 30, 31, 56, 57, 58])
+    DIGIT_RUNS = np.concatenate([np.arange(3, 27), np.arange(32, 56)])
+    LEFT_TABLE = np.maximum(_digit_table(ean13.L_CODES), _digit_table(ean13.G_CODES, offset=10))
+    RIGHT_TABLE = _digit_table(ean13.R_CODES)
+    FIRST_DIGIT = _first_digit_table()
+    CHECK_WEIGHTS = np.array([1, 3] * 6 + [1])
+    MIN_CONTRAST = 40          # Gray levels between the darkest and brightest pixel of a line
+    MIN_QUIET_MODULES = 3      # Blank space required next to the guards (unless the line ends there)
+    DENSE_RUNS = 20            # A stretch of this many runs ...
+    DENSE_SPAN_RATIO = 0.25    # ... within this fraction of the line looks like a barcode
+    DENSE_RELATIVE_CONTRAST = 0.35  # on lines with at least this share of the best line's contrast
+                                    # (and edges need a step of this share to count as strong)
+
+    def __init__(self,
+                 num_lines=getattr(config, 'SCANLINE_LINES', 12),
+                 min_agreement=getattr(config, 'SCANLINE_MIN_AGREEMENT', 2),
+                 vertical=getattr(config, 'SCANLINE_VERTICAL', True)):
+        super().__init__()
+        self.num_lines = num_lines
+        self.min_agreement = min_agreement
+        self.vertical = vertical
+
+    def _decode(self, gray_frame):
+        height, width = gray_frame.shape[:2]
+        found = {}  # code -> list of (vertical, line position, start, end)
+        dense = []  # (vertical, line positions, starts, ends) of barcode-like stretches
+        best_contrast = 0
+        orientations = [False, True] if self.vertical else [False]
+        for vertical in orientations:
+            length, across = (height, width) if vertical else (width, height)
+            positions = np.unique(np.linspace(across * 0.1, across * 0.9, self.num_lines).astype(np.intp))
+            lines = gray_frame[:, positions].T if vertical else gray_frame[positions, :]
+            # Reading a line backwards decodes a barcode that is upside down.
+            line_runs = self._line_runs(np.concatenate([lines, lines[:, ::-1]]))
+            best_contrast = max(best_contrast, int(line_runs[5].max()))
+            for line, start, end, code in self._decode_runs(line_runs):
+                if line >= len(positions):
+                    line, start, end = line - len(positions), length - end, length - start
+                found.setdefault(code, []).append((vertical, positions[line], start, end))
+            line, start, end = self._dense_stretches(line_runs, len(positions))
+            dense.append((vertical, positions[line], start, end))
+
+        results = []
+        reported = []
+        spacing = max(1, int(max(height, width) * 0.8 / max(1, self.num_lines)))
+        for code, hits in found.items():
+            if len(hits) < min(self.min_agreement, self.num_lines):
+                continue
+            reported.append(code)
+            vertical = max(set(h[0] for h in hits), key=lambda v: sum(h[0] == v for h in hits))
+            hits = [h for h in hits if h[0] == vertical]
+            along0, along1 = min(h[2] for h in hits), max(h[3] for h in hits)
+            across0 = max(0, min(h[1] for h in hits) - spacing // 2)
+            across1 = max(h[1] for h in hits) + spacing // 2
+            if vertical:
+                rect = (int(across0), int(along0), int(min(width, across1) - across0), int(along1 - along0))
+            else:
+                rect = (int(along0), int(across0), int(along1 - along0), int(min(height, across1) - across0))
+            results.append({'data': code, 'type': 'EAN13', 'rect': rect})
 
-    # Specify to only look for EAN-13 symbols
-    target_symbols = [ZBarSymbol.EAN13]
+        if not results:
+            return results, False
+        # Every barcode-like stretch must lie inside the span of a reported symbol ...
+        for vertical, line_positions, starts, ends in dense:
+            explained = np.zeros(len(starts), dtype=bool)
+            for code in reported:
+                for hit_vertical, position, start, end in found[code]:
+                    if hit_vertical == vertical:
+                        explained |= (line_positions == position) & (starts >= start) & (ends <= end)
+            if not explained.all():
+                return results, False
+        # ... and nothing between the sampled lines or outside them may look like one.
+        rects = [barcode['rect'] for barcode in results]
+        for vertical in orientations:
+            if self._dense_edges(gray_frame.T if vertical else gray_frame,
+                                 [(y, x, h, w) for x, y, w, h in rects] if vertical else rects,
+                                 spacing, best_contrast):
+                return results, False
+        return results, True
 
-    # Decode barcodes. Pass the grayscale frame directly.
-    # Add 'symbols' argument to restrict types.
-    barcodes = pyzbar.decode(gray_frame, symbols=target_symbols)
+    def _dense_edges(self, image, rects, spacing, contrast):
+        """
+        True if some row of `image` may have DENSE_RUNS strong horizontal edges within
+        DENSE_SPAN_RATIO of its width outside `rects` (x, y, w, h). The rects are widened
+        by `spacing` across the rows, since a symbol's bars reach past the lines that read it.
+        Edges are counted in blocks of that span, so two neighboring blocks together
+        cover every window (this errs on the side of not vouching).
+        """
+        length = image.shape[1]
+        step = max(self.MIN_CONTRAST // 2, int(self.DENSE_RELATIVE_CONTRAST * contrast))
+        left, right = image[:, :-1], image[:, 1:]
+        edges = (np.maximum(left, right) - np.minimum(left, right)) >= step
+        for x, y, w, h in rects:
+            edges[max(0, y - spacing):y + h + spacing, max(0, x - 1):x + w + 1] = False
+        span = max(self.DENSE_RUNS, int(self.DENSE_SPAN_RATIO * length))
+        blocks = -(-edges.shape[1] // span)
+        padded = np.zeros((edges.shape[0], blocks * span), dtype=bool)
+        padded[:, :edges.shape[1]] = edges
+        counts = padded.reshape(edges.shape[0], blocks, span).sum(axis=2, dtype=np.int32)
+        if blocks > 1:
+            counts = counts[:, 1:] + counts[:, :-1]
+        return bool((counts >= self.DENSE_RUNS - 1).any())
 
-    latency = time.perf_counter() - start_time
+    def _line_runs(self, lines):
+        """
+        Binarizes a stack of scanlines and splits them into runs of bars and spaces.
 
-    processed_results = []
-    if barcodes:
+        Returns:
+            tuple: (line_of_run, starts, ends, runs, is_bar, contrast, length), run arrays in line order
+                and each line's contrast (brightest minus darkest gray level).
+        """
+        lines = lines.astype(np.int16)
+        low = lines.min(axis=1)
+        high = lines.max(axis=1)
+        dark = lines < ((low + high) // 2)[:, None]
+        length = dark.shape[1]
+
+        # One run starts at the beginning of every line and at every color change.
+        run_start = np.ones_like(dark)
+        run_start[:, 1:] = dark[:, 1:] != dark[:, :-1]
+        line_of_run, starts = np.nonzero(run_start)
+        ends = np.empty_like(starts)
+        ends[:-1] = starts[1:]
+        ends[np.append(line_of_run[1:] != line_of_run[:-1], True)] = length
+        runs = (ends - starts).astype(np.float32)
+        is_bar = dark[line_of_run, starts]
+        return line_of_run, starts, ends, runs, is_bar, high - low, length
+
+    def _dense_stretches(self, line_runs, num_lines):
+        """
+        Finds stretches of DENSE_RUNS runs packed into a short span on the first `num_lines`
+        lines (the forward copies), i.e. anything that might be a barcode.
+
+        Returns:
+            tuple: (line_index, start, end) arrays, without the stretch's first and last run.
+        """
+        line_of_run, starts, ends, runs, _, contrast, length = line_runs
+        # Sensor noise on a blank line also binarizes into short runs; only lines with a
+        # good part of the strongest contrast count.
+        contrast_ok = contrast >= max(self.MIN_CONTRAST, self.DENSE_RELATIVE_CONTRAST * contrast.max())
+        last = self.DENSE_RUNS - 1
+        first = np.arange(max(0, len(runs) - last))
+        first = first[(line_of_run[first] < num_lines)
+                      & (line_of_run[first] == line_of_run[first + last])
+                      & contrast_ok[line_of_run[first]]
+                      & (ends[first + last] - starts[first] <= self.DENSE_SPAN_RATIO * length)]
+        # Inner edges only: the outer runs of a stretch may be a symbol's quiet zones.
+        return line_of_run[first], starts[first + 1], ends[first + last - 1]
+
+    def _decode_runs(self, line_runs):
+        """
+        Decodes every EAN-13 symbol in the runs of a stack of scanlines.
+
+        Returns:
+            List of (line_index, start, end, code) with the symbol's pixel span on its line.
+        """
+        line_of_run, starts, ends, runs, is_bar, contrast, length = line_runs
+        if len(starts) < self.SYMBOL_RUNS:
+            return []
+        last = self.SYMBOL_RUNS - 1
+        first_runs = np.arange(len(runs) - last)
+        first_runs = first_runs[is_bar[first_runs]
+                                & (line_of_run[first_runs] == line_of_run[first_runs + last])
+                                & (contrast >= self.MIN_CONTRAST)[line_of_run[first_runs]]]
+        if not first_runs.size:
+            return []
+        windows = np.lib.stride_tricks.sliding_window_view(runs, self.SYMBOL_RUNS)[first_runs]
+        module = windows.sum(axis=1) / ean13.TOTAL_MODULES
+
+        guards = windows[:, self.GUARD_RUNS] / module[:, None]
+        valid = np.all((guards > 0.5) & (guards < 1.75), axis=1)
+        quiet = self.MIN_QUIET_MODULES * module
+        valid &= (starts[first_runs] == 0) | (runs[first_runs - 1] >= quiet)
+        after = np.minimum(first_runs + self.SYMBOL_RUNS, len(runs) - 1)
+        valid &= (ends[first_runs + last] == length) | (runs[after] >= quiet)
+
+        digits = windows[:, self.DIGIT_RUNS].reshape(-1, 12, 4)
+        digit_modules = digits.sum(axis=2)
+        valid &= np.all(np.abs(digit_modules / module[:, None] - 7) < 1.5, axis=1)
+        widths = np.rint(digits / digit_modules[..., None] * 7).astype(np.intp)
+        valid &= np.all((widths >= 1).all(axis=2) & (widths.sum(axis=2) == 7), axis=1)
+        keys = _width_keys(widths)
+        left = self.LEFT_TABLE[keys[:, :6]]
+        right = self.RIGHT_TABLE[keys[:, 6:]]
+        valid &= (left >= 0).all(axis=1) & (right >= 0).all(axis=1)
+        first_digit = self.FIRST_DIGIT[((left >= 10) * (1 << np.arange(5, -1, -1))).sum(axis=1)]
+        valid &= first_digit >= 0
+        code_digits = np.column_stack([first_digit, left % 10, right])
+        valid &= (code_digits * self.CHECK_WEIGHTS).sum(axis=1) % 10 == 0
+
+        decoded = []
+        for index in np.flatnonzero(valid):
+            run = first_runs[index]
+            code = ''.join(str(d) for d in code_digits[index])
+            decoded.append((int(line_of_run[run]), int(starts[run]), int(ends[run + last]), code))
+        return decoded
+
+
+class PyzbarDecoder(DecoderBackend):
+    """ZBar through pyzbar, restricted to EAN-13. Robust to rotation, blur and noise."""
+    name = 'pyzbar'
+
+    def _decode(self, gray_frame):
+        # Specify to only look for EAN-13 symbols
+        target_symbols = [ZBarSymbol.EAN13]
+
+        # Decode barcodes. Pass the grayscale frame directly.
+        # Add 'symbols' argument to restrict types.
+        barcodes = pyzbar.decode(gray_frame, symbols=target_symbols)
+
+        processed_results = []
         for barcode in barcodes:
             # pyzbar returns bytes, decode to string
             try:
@@ -44,5 +372,270 @@ def process_barcodes(gray_frame):
                 'rect': barcode.rect # (x, y, width, height) tuple
             }
             processed_results.append(barcode_info)
+        return processed_results, True
+
+
+class OpenCVBarcodeDecoder(DecoderBackend):
+    """OpenCV's barcode detector (OpenCV >= 4.8, or opencv-contrib 4.5.3 to 4.7)."""
+    name = 'opencv'
+
+    def __init__(self):
+        super().__init__()
+        detector_class = getattr(getattr(cv2, 'barcode', None), 'BarcodeDetector', None) \
+            or getattr(cv2, 'barcode_BarcodeDetector')
+        self._detector = detector_class()
+
+    @classmethod
+    def available(cls):
+        return (hasattr(getattr(cv2, 'barcode', None), 'BarcodeDetector')
+                or hasattr(cv2, 'barcode_BarcodeDetector'))
+
+    def _decode(self, gray_frame):
+        if hasattr(self._detector, 'detectAndDecodeWithType'):
+            ok, decoded_info, _, points = self._detector.detectAndDecodeWithType(gray_frame)
+        else:
+            ok, decoded_info, _, points = self._detector.detectAndDecode(gray_frame)
+        if not ok or points is None:
+            return [], True
+        results = []
+        for data, corners in zip(decoded_info, points):
+            # The detector also reads EAN-8 and UPC; keep what pyzbar's EAN-13 filter would.
+            if not ean13.is_valid(data):
+                continue
+            rect = cv2.boundingRect(np.asarray(corners, dtype=np.float32).reshape(-1, 1, 2))
+            results.append({'data': data, 'type': 'EAN13', 'rect': tuple(int(v) for v in rect)})
+        return results, True
+
+
+DECODER_BACKENDS = {
+    ScanlineEAN13Decoder.name: ScanlineEAN13Decoder,
+    PyzbarDecoder.name: PyzbarDecoder,
+    OpenCVBarcodeDecoder.name: OpenCVBarcodeDecoder,
+}
+
+# Built on first use from config.DECODER_CHAIN (per process), rebuilt if the setting changes.
+_decoder_chain = None
+_decoder_chain_names = None
+
+
+def build_decoder_chain(names):
+    """
+    Instantiates the named backends in order. Backends whose library is missing are
+    skipped with a warning.
+
+    Raises:
+        ValueError: For an unknown backend name, or if no backend is usable.
+    """
+    chain = []
+    for name in names:
+        backend_class = DECODER_BACKENDS.get(name)
+        if backend_class is None:
+            raise ValueError(f"Unknown decoder backend '{name}' (choose from {', '.join(DECODER_BACKENDS)})")
+        if not backend_class.available():
+            print(f"[WARN] Decoder backend '{name}' is not available in this installation; skipping it.")
+            continue
+        chain.append(backend_class())
+    if not chain:
+        raise ValueError(f"None of the decoder backends {list(names)} is usable")
+    return chain
+
 
-    return processed_results, latency
\ No newline at end of file
+def get_decoder_chain():
+    """Returns the backends process_barcodes() runs, in order."""
+    global _decoder_chain, _decoder_chain_names
+    names = tuple(getattr(config, 'DECODER_CHAIN', ('scanline', 'pyzbar')))
+    if names != _decoder_chain_names:
+        _decoder_chain = build_decoder_chain(names)
+        _decoder_chain_names = names
+    return _decoder_chain
+
+
+def decoder_stats():
+    """Returns {backend name: stats} for the decoders this process has used."""
+    if _decoder_chain is None:
+        return {}
+    return {backend.name: backend.get_stats() for backend in _decoder_chain}
+
+
+def merge_decoder_stats(stats_list):
+    """Sums decoder_stats() dicts, e.g. from several worker processes."""
+    merged = {}
+    for stats in stats_list:
+        for name, backend in stats.items():
+            total = merged.setdefault(name, {'calls': 0, 'hits': 0, 'complete': 0, 'seconds': 0.0})
+            total['calls'] += backend['calls']
+            total['hits'] += backend['hits']
+            total['complete'] += backend['complete']
+            total['seconds'] += backend['seconds']
+    for total in merged.values():
+        total['hit_rate'] = total['hits'] / total['calls'] if total['calls'] else 0.0
+        total['avg_ms'] = total['seconds'] / total['calls'] * 1000 if total['calls'] else 0.0
+    return merged
+
+
+def offset_barcodes(barcodes, dx, dy):
+    """Shifts the rects of decoded barcodes by (dx, dy), e.g. from crop to frame coordinates."""
+    if dx == 0 and dy == 0:
+        return barcodes
+    for barcode in barcodes:
+        (x, y, w, h) = barcode['rect']
+        barcode['rect'] = (x + dx, y + dy, w, h)
+    return barcodes
+
+
+def scale_barcodes(barcodes, scale):
+    """Maps rects decoded on an image resized by `scale` back to the original image."""
+    if scale == 1.0:
+        return barcodes
+    for barcode in barcodes:
+        (x, y, w, h) = barcode['rect']
+        barcode['rect'] = (int(round(x / scale)), int(round(y / scale)),
+                           int(round(w / scale)), int(round(h / scale)))
+    return barcodes
+
+
+def process_barcodes_in_roi(gray_frame, roi, scale=1.0):
+    """
+    Decodes only a region of interest of a grayscale frame.
+
+    Args:
+        gray_frame: Grayscale image frame (NumPy array).
+        roi: (x, y, width, height) in frame coordinates, or None for the full frame.
+        scale: Working resolution; < 1.0 decodes a downscaled copy of the region.
+
+    Returns:
+        tuple: (list_of_barcodes_info, latency) like process_barcodes(), with rects
+               in full-frame coordinates.
+    """
+    if scale != 1.0:
+        start_time = time.perf_counter()
+        (x, y, w, h) = roi if roi is not None else (0, 0, gray_frame.shape[1], gray_frame.shape[0])
+        small = cv2.resize(gray_frame[y:y + h, x:x + w], None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        barcodes, _ = process_barcodes(small) if roi is not None else decode_full_frame(small)
+        return offset_barcodes(scale_barcodes(barcodes, scale), x, y), time.perf_counter() - start_time
+    if roi is None:
+        return decode_full_frame(gray_frame)
+    (x, y, w, h) = roi
+    # Slicing gives a view, so only the crop itself is handed to pyzbar.
+    barcodes, latency = process_barcodes(gray_frame[y:y + h, x:x + w])
+    return offset_barcodes(barcodes, x, y), latency
+
+
+
+# --- Coarse-to-fine (pyramid) decoding ---
+
+# Counters for tuning the candidate detector (per process; worker processes send theirs
+# back to the parent, see merge_pyramid_stats()).
+pyramid_stats = {'frames': 0, 'candidates_tried': 0, 'candidates_decoded': 0}
+
+
+def merge_pyramid_stats(stats_list):
+    """Sums pyramid_stats dicts, e.g. from several worker processes or tasks."""
+    merged = {'frames': 0, 'candidates_tried': 0, 'candidates_decoded': 0}
+    for stats in stats_list:
+        for key in merged:
+            merged[key] += stats.get(key, 0)
+    return merged
+
+
+def find_barcode_candidates(gray_frame,
+                            scale=getattr(config, 'PYRAMID_SCALE', 0.25),
+                            min_area_ratio=getattr(config, 'PYRAMID_MIN_AREA_RATIO', 0.002),
+                            max_candidates=getattr(config, 'PYRAMID_MAX_CANDIDATES', 4),
+                            padding_px=getattr(config, 'PYRAMID_CROP_PADDING_PX', 16)):
+    """
+    Locates regions that look like 1D barcodes on a downscaled copy of the frame.
+
+    Barcodes are areas with strong gradients in one direction only, so the difference
+    between the horizontal and vertical gradient magnitudes is smoothed, thresholded
+    and closed into blobs.
+
+    Args:
+        gray_frame: Full-resolution grayscale frame.
+        scale: Downscale factor for the detection image.
+        min_area_ratio: Smallest blob to keep, as a fraction of the frame area.
+        max_candidates: Keep at most this many regions, largest first.
+        padding_px: Padding added around each region, in full-resolution pixels.
+
+    Returns:
+        List of (x, y, w, h) regions in full-resolution coordinates.
+    """
+    frame_h, frame_w = gray_frame.shape[:2]
+    small = cv2.resize(gray_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    grad_x = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 1, 0, ksize=3))
+    grad_y = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 0, 1, ksize=3))
+    # High where bars run in one direction, for both vertical and horizontal barcodes.
+    gradient = cv2.absdiff(grad_x, grad_y)
+    gradient = cv2.blur(gradient, (5, 5))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.erode(mask, None, iterations=2)
+    mask = cv2.dilate(mask, None, iterations=2)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_ratio * small.shape[0] * small.shape[1]
+    boxes = [cv2.boundingRect(c) for c in contours]
+    boxes = [b for b in boxes if b[2] * b[3] >= min_area]
+    boxes.sort(key=lambda b: b[2] * b[3], reverse=True)
+
+    candidates = []
+    for (x, y, w, h) in boxes[:max_candidates]:
+        x0 = max(0, int(x / scale) - padding_px)
+        y0 = max(0, int(y / scale) - padding_px)
+        x1 = min(frame_w, int((x + w) / scale) + padding_px)
+        y1 = min(frame_h, int((y + h) / scale) + padding_px)
+        candidates.append((x0, y0, x1 - x0, y1 - y0))
+    return candidates
+
+
+def process_barcodes_pyramid(gray_frame):
+    """
+    Coarse-to-fine decode: find candidate regions on a downscaled frame, then run
+    pyzbar only on the full-resolution crops of those regions.
+
+    Returns:
+        tuple: (list_of_barcodes_info, latency, candidates_tried)
+            list_of_barcodes_info: Same dicts as process_barcodes(), rects in frame coordinates.
+            latency: Total processing time in seconds (detection + decoding).
+            candidates_tried: Number of crops handed to pyzbar.
+    """
+    start_time = time.perf_counter()
+    candidates = find_barcode_candidates(gray_frame)
+
+    results = []
+    seen = set()
+    decoded_candidates = 0
+    for roi in candidates:
+        barcodes, _ = process_barcodes_in_roi(gray_frame, roi)
+        if barcodes:
+            decoded_candidates += 1
+        for barcode in barcodes:
+            # Overlapping candidates can decode the same barcode twice.
+            if barcode['data'] not in seen:
+                seen.add(barcode['data'])
+                results.append(barcode)
+
+    if not results and getattr(config, 'PYRAMID_FALLBACK_FULL_SCAN', False):
+        results, _ = process_barcodes(gray_frame)
+
+    pyramid_stats['frames'] += 1
+    pyramid_stats['candidates_tried'] += len(candidates)
+    pyramid_stats['candidates_decoded'] += decoded_candidates
+    return results, time.perf_counter() - start_time, len(candidates)
+
+
+def decode_full_frame(gray_frame):
+    """
+    Decodes a whole frame with the strategy selected by config.DECODE_STRATEGY
+    ('full' runs pyzbar on the entire frame, 'pyramid' uses process_barcodes_pyramid()).
+
+    Returns:
+        tuple: (list_of_barcodes_info, latency)
+    """
+    if getattr(config, 'DECODE_STRATEGY', 'full') == 'pyramid':
+        results, latency, _ = process_barcodes_pyramid(gray_frame)
+        return results, latency
+    return process_barcodes(gray_frame)
@@ -0,0 +1,306 @@
+"""
+Offline batch scanning of recorded videos and image folders.
+
+Usage examples:
+    python batch_scan.py shelf_videos/*.mp4 -o results.jsonl
+    python batch_scan.py photos/ more_photos/**/*.jpg -o results.csv --workers 8
+    python batch_scan.py photos/ -o results.jsonl --resume   # continue an interrupted run
+
+Inputs may be files, directories (scanned recursively) or glob patterns. Frames are
+read lazily and decoded on all cores; each barcode is written once per source.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import config
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm', '.mpg', '.mpeg'}
+OUTPUT_FIELDS = ['source', 'frame_index', 'timestamp', 'data', 'type', 'x', 'y', 'width', 'height']
+
+
+def iter_source_files(inputs):
+    """Yields media files from paths, directories (recursive) and glob patterns, lazily and in sorted order."""
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if _media_kind(path):
+                        yield path
+        elif os.path.isfile(entry):
+            if _media_kind(entry):
+                yield entry
+            else:
+                print(f"[WARN] Skipping unsupported file: {entry}", file=sys.stderr)
+        else:
+            matches = sorted(glob.iglob(entry, recursive=True))
+            if not matches:
+                print(f"[WARN] No files match: {entry}", file=sys.stderr)
+            for path in matches:
+                if os.path.isfile(path) and _media_kind(path):
+                    yield path
+
+
+def _media_kind(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in VIDEO_EXTENSIONS:
+        return 'video'
+    return None
+
+
+def iter_tasks(paths, segment_frames):
+    """
+    Splits the sources into independent decode tasks: one per image, and one per
+    segment of `segment_frames` frames for videos so a long video uses every core.
+    Task tuples are (task_key, kind, path, start_frame, end_frame).
+    """
+    for path in paths:
+        if _media_kind(path) == 'image':
+            yield (path, 'image', path, 0, 1)
+            continue
+        cap = cv2.VideoCapture(path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        cap.release()
+        if frame_count <= 0:
+            # Unknown length (some containers): scan the whole video as one task.
+            yield (f"{path}#0", 'video', path, 0, None)
+            continue
+        for start in range(0, frame_count, segment_frames):
+            yield (f"{path}#{start}", 'video', path, start, min(start + segment_frames, frame_count))
+
+
+def scan_task(task, frame_step=1):
+    """
+    Worker: decodes one task.
+
+    Returns:
+        tuple: (task_key, source, frames_decoded, detections, pyramid_counts)
+            detections: list of (frame_index, timestamp, barcodes) for frames with barcodes.
+            pyramid_counts: This task's pyramid decode counters (the worker's pyramid_stats delta).
+    """
+    from barcode_processor import pyramid_stats
+
+    before = dict(pyramid_stats)
+    task_key, path, frames_decoded, detections = _scan_task(task, frame_step)
+    return task_key, path, frames_decoded, detections, {k: v - before[k] for k, v in pyramid_stats.items()}
+
+
+def _scan_task(task, frame_step):
+    from barcode_processor import decode_full_frame
+
+    task_key, kind, path, start, end = task
+    detections = []
+    if kind == 'image':
+        gray_frame = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray_frame is None:
+            print(f"[WARN] Could not read image: {path}", file=sys.stderr)
+            return task_key, path, 0, detections
+        barcodes, _ = decode_full_frame(gray_frame)
+        if barcodes:
+            detections.append((0, None, barcodes))
+        return task_key, path, 1, detections
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"[WARN] Could not open video: {path}", file=sys.stderr)
+        return task_key, path, 0, detections
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    frames_decoded = 0
+    gray_frame = None
+    frame_index = start
+    try:
+        while end is None or frame_index < end:
+            # grab() without retrieve() skips decoding the frames we are not going to scan.
+            if not cap.grab():
+                break
+            if (frame_index - start) % frame_step == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray_frame)
+                    barcodes, _ = decode_full_frame(gray_frame)
+                    frames_decoded += 1
+                    if barcodes:
+                        timestamp = frame_index / fps if fps else None
+                        detections.append((frame_index, timestamp, barcodes))
+            frame_index += 1
+    finally:
+        cap.release()
+    return task_key, path, frames_decoded, detections
+
+
+class ResultWriter:
+    """Streams detections to a JSON-lines or CSV file, flushing after every task."""
+    def __init__(self, path, fmt, append):
+        self.fmt = fmt
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+            if not exists:
+                self._csv.writeheader()
+
+    def write(self, source, frame_index, timestamp, barcode):
+        (x, y, w, h) = barcode['rect']
+        row = {'source': source, 'frame_index': frame_index, 'timestamp': timestamp,
+               'data': barcode['data'], 'type': barcode['type'],
+               'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)}
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + '\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ProgressLog:
+    """
+    Append-only record of finished tasks (and the barcodes emitted for them), so an
+    interrupted run can be resumed without duplicate output.
+    """
+    def __init__(self, path, resume):
+        self.path = path
+        self.done = set()
+        self.seen = {}  # source -> barcodes already written
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from an interrupted run
+                    self.done.add(record['task'])
+                    self.seen.setdefault(record['source'], set()).update(record['emitted'])
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def record(self, task_key, source, emitted):
+        self._file.write(json.dumps({'task': task_key, 'source': source, 'emitted': emitted}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(inputs, output, fmt=None, workers=None, frame_step=1, segment_frames=None,
+              resume=False, dedupe=True):
+    """
+    Scans all inputs and writes the detections to `output`.
+
+    Returns:
+        dict with totals: tasks, frames, detections, elapsed seconds, frames per second and
+        the summed pyramid decode counters ('pyramid').
+    """
+    from barcode_processor import merge_pyramid_stats
+
+    fmt = fmt or ('csv' if output.lower().endswith('.csv') else 'jsonl')
+    workers = workers or os.cpu_count() or 1
+    segment_frames = segment_frames or getattr(config, 'BATCH_VIDEO_SEGMENT_FRAMES', 300)
+    progress = ProgressLog(output + '.progress', resume)
+    writer = ResultWriter(output, fmt, append=resume)
+    if resume and progress.done:
+        print(f"Resuming: {len(progress.done)} task(s) already done.", file=sys.stderr)
+
+    tasks = (t for t in iter_tasks(iter_source_files(inputs), segment_frames) if t[0] not in progress.done)
+    # Keep only a bounded window of tasks in flight so memory stays flat for any input size,
+    # and collect them in submission order so per-source dedupe sees frames in order.
+    window = deque()
+    max_in_flight = workers * 4
+    totals = {'tasks': 0, 'frames': 0, 'detections': 0, 'pyramid': merge_pyramid_stats([])}
+    start_time = time.perf_counter()
+    last_report = start_time
+    current_source = None
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def fill_window():
+            while len(window) < max_in_flight:
+                task = next(tasks, None)
+                if task is None:
+                    return
+                window.append(executor.submit(scan_task, task, frame_step))
+
+        fill_window()
+        while window:
+            task_key, source, frames_decoded, detections, pyramid_counts = window.popleft().result()
+            fill_window()
+
+            if source != current_source:
+                # Sources are processed in order; earlier dedupe sets are no longer needed.
+                if current_source is not None:
+                    progress.seen.pop(current_source, None)
+                current_source = source
+            seen = progress.seen.setdefault(source, set())
+            emitted = []
+            for frame_index, timestamp, barcodes in detections:
+                for barcode in barcodes:
+                    if dedupe and barcode['data'] in seen:
+                        continue
+                    seen.add(barcode['data'])
+                    emitted.append(barcode['data'])
+                    writer.write(source, frame_index, timestamp, barcode)
+            writer.flush()
+            # Record progress only after the output for this task is on disk.
+            progress.record(task_key, source, emitted)
+
+            totals['tasks'] += 1
+            totals['frames'] += frames_decoded
+            totals['detections'] += len(emitted)
+            totals['pyramid'] = merge_pyramid_stats([totals['pyramid'], pyramid_counts])
+            now = time.perf_counter()
+            if now - last_report >= 5.0:
+                fps = totals['frames'] / (now - start_time)
+                print(f"{totals['tasks']} tasks, {totals['frames']} frames, {totals['detections']} barcodes, "
+                      f"{fps:.1f} frames/s", file=sys.stderr)
+                last_report = now
+
+    writer.close()
+    progress.close()
+    elapsed = time.perf_counter() - start_time
+    totals['elapsed'] = elapsed
+    totals['fps'] = totals['frames'] / elapsed if elapsed > 0 else 0.0
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan EAN-13 barcodes in video files and image folders.")
+    parser.add_argument('inputs', nargs='+', help="Video/image files, directories or glob patterns")
+    parser.add_argument('-o', '--output', required=True, help="Output file (.jsonl or .csv)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="Output format (default: from extension)")
+    parser.add_argument('--workers', type=int, default=None, help="Decode processes (default: all cores)")
+    parser.add_argument('--frame-step', type=int, default=1, help="Decode every Nth video frame")
+    parser.add_argument('--segment-frames', type=int, default=None,
+                        help="Video frames per task (default: config.BATCH_VIDEO_SEGMENT_FRAMES)")
+    parser.add_argument('--resume', action='store_true', help="Skip tasks finished by a previous run")
+    parser.add_argument('--no-dedupe', action='store_true', help="Write every detection, not one per barcode and source")
+    args = parser.parse_args(argv)
+
+    totals = run_batch(args.inputs, args.output, fmt=args.format, workers=args.workers,
+                       frame_step=max(1, args.frame_step), segment_frames=args.segment_frames,
+                       resume=args.resume, dedupe=not args.no_dedupe)
+    print(f"Done: {totals['tasks']} tasks, {totals['frames']} frames, {totals['detections']} barcodes "
+          f"in {totals['elapsed']:.1f}s ({totals['fps']:.1f} frames/s).", file=sys.stderr)
+    pyramid = totals['pyramid']
+    if pyramid['frames']:
+        print(f"Pyramid stats: {pyramid['candidates_tried']} candidates tried over "
+              f"{pyramid['frames']} frames, {pyramid['candidates_decoded']} decoded.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
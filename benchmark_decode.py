@@ -0,0 +1,189 @@
+"""
+Synthetic EAN-13 benchmark for the decode pipeline (no camera or network needed).
+
+Usage examples:
+    python benchmark_decode.py -o bench.json                       # run all scenarios
+    python benchmark_decode.py -o bench.json --save-baseline baseline.json
+    python benchmark_decode.py -o bench.json --baseline baseline.json   # exit 1 on regression
+    python benchmark_decode.py --strategy pyramid --scenarios clean,rotate_30 -o pyramid.json
+    python benchmark_decode.py --decoders pyzbar -o pyzbar_only.json        # without the scanline fast path
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import config
+from barcode_processor import decode_full_frame, decoder_stats
+from synthetic_barcodes import make_scene
+
+# Each scenario is a set of make_scene() arguments.
+SCENARIOS = {
+    'clean':          {},
+    'small_modules':  {'module_px': 2},
+    'large_modules':  {'module_px': 5},
+    'rotate_10':      {'angle': 10.0},
+    'rotate_30':      {'angle': 30.0},
+    'blur_1':         {'blur_sigma': 1.0},
+    'blur_2':         {'blur_sigma': 2.0},
+    'noise_10':       {'noise_sigma': 10.0},
+    'noise_25':       {'noise_sigma': 25.0},
+    'perspective':    {'perspective_strength': 0.08},
+    'low_contrast':   {'contrast': 0.3},
+    'multi_3':        {'num_codes': 3, 'module_px': 2},
+    'hd_1080p':       {'canvas_size': (1920, 1080), 'module_px': 4},
+    'hd_multi_4':     {'canvas_size': (1920, 1080), 'num_codes': 4, 'module_px': 3},
+}
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000) if latencies else 0.0
+
+
+def run_scenario(name, params, decode, frames, seed):
+    """
+    Decodes `frames` synthetic frames of one scenario.
+
+    Returns:
+        dict of metrics: throughput (frames/s of pure decode time), latency percentiles
+        in ms, decode_rate (fraction of rendered codes decoded correctly) and
+        false_positives (decoded codes that were not rendered).
+    """
+    rng = np.random.default_rng(seed)
+    # Render everything up front so only the decoder is timed.
+    scenes = [make_scene(rng, **params) for _ in range(frames)]
+
+    latencies = []
+    expected_total = 0
+    decoded_correct = 0
+    false_positives = 0
+    for gray_frame, expected in scenes:
+        start_time = time.perf_counter()
+        barcodes, _ = decode(gray_frame)
+        latencies.append(time.perf_counter() - start_time)
+        found = {b['data'] for b in barcodes}
+        expected_total += len(expected)
+        decoded_correct += len(found & set(expected))
+        false_positives += len(found - set(expected))
+
+    total_time = sum(latencies)
+    return {
+        'frames': frames,
+        'params': {k: list(v) if isinstance(v, tuple) else v for k, v in params.items()},
+        'throughput_fps': frames / total_time if total_time > 0 else 0.0,
+        'p50_ms': percentile_ms(latencies, 50),
+        'p95_ms': percentile_ms(latencies, 95),
+        'p99_ms': percentile_ms(latencies, 99),
+        'mean_ms': total_time / frames * 1000 if frames else 0.0,
+        'decode_rate': decoded_correct / expected_total if expected_total else 0.0,
+        'false_positives': false_positives,
+    }
+
+
+def compare_to_baseline(results, baseline, max_latency_regression, max_throughput_regression, max_decode_rate_drop):
+    """
+    Compares results with a stored baseline.
+
+    Returns:
+        List of human-readable regression descriptions (empty if none).
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        if base['p95_ms'] > 0 and current['p95_ms'] > base['p95_ms'] * (1 + max_latency_regression):
+            regressions.append(f"{name}: p95 latency {current['p95_ms']:.2f}ms vs baseline {base['p95_ms']:.2f}ms")
+        if base['throughput_fps'] > 0 and current['throughput_fps'] < base['throughput_fps'] * (1 - max_throughput_regression):
+            regressions.append(f"{name}: throughput {current['throughput_fps']:.1f} fps vs baseline {base['throughput_fps']:.1f} fps")
+        if current['decode_rate'] < base['decode_rate'] - max_decode_rate_drop:
+            regressions.append(f"{name}: decode rate {current['decode_rate']:.3f} vs baseline {base['decode_rate']:.3f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark barcode decoding on synthetic EAN-13 frames.")
+    parser.add_argument('-o', '--output', required=True, help="Write results as JSON to this file")
+    parser.add_argument('--frames', type=int, default=50, help="Frames per scenario")
+    parser.add_argument('--seed', type=int, default=1234, help="Random seed (same seed = same frames)")
+    parser.add_argument('--scenarios', default=None, help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--strategy', choices=['full', 'pyramid'], default=None,
+                        help="Override config.DECODE_STRATEGY for this run")
+    parser.add_argument('--decoders', default=None,
+                        help="Override config.DECODER_CHAIN, e.g. 'scanline,pyzbar' or 'pyzbar'")
+    parser.add_argument('--baseline', default=None, help="Compare against this results file; exit 1 on regression")
+    parser.add_argument('--save-baseline', default=None, help="Also write the results to this baseline file")
+    parser.add_argument('--max-latency-regression', type=float, default=0.20,
+                        help="Allowed relative p95 latency increase (default 0.20 = 20%%)")
+    parser.add_argument('--max-throughput-regression', type=float, default=0.20,
+                        help="Allowed relative throughput decrease (default 0.20 = 20%%)")
+    parser.add_argument('--max-decode-rate-drop', type=float, default=0.02,
+                        help="Allowed absolute decode rate decrease (default 0.02)")
+    args = parser.parse_args(argv)
+
+    if args.strategy:
+        # decode_full_frame() reads the strategy on every call.
+        config.DECODE_STRATEGY = args.strategy
+    if args.decoders:
+        # The decoder chain is rebuilt when the setting changes.
+        config.DECODER_CHAIN = args.decoders.split(',')
+
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    results = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'strategy': getattr(config, 'DECODE_STRATEGY', 'full'),
+            'decoders': list(getattr(config, 'DECODER_CHAIN', ['scanline', 'pyzbar'])),
+            'frames': args.frames,
+            'seed': args.seed,
+        },
+        'scenarios': {},
+    }
+    print(f"{'scenario':<15} {'fps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rate':>6} {'fp':>4}")
+    scenario_order = list(SCENARIOS)
+    for name in names:
+        # Every scenario gets its own deterministic frames, independent of which subset is run.
+        seed = args.seed + scenario_order.index(name)
+        metrics = run_scenario(name, SCENARIOS[name], decode_full_frame, args.frames, seed)
+        results['scenarios'][name] = metrics
+        print(f"{name:<15} {metrics['throughput_fps']:>8.1f} {metrics['p50_ms']:>8.2f} {metrics['p95_ms']:>8.2f} "
+              f"{metrics['p99_ms']:>8.2f} {metrics['decode_rate']:>6.2f} {metrics['false_positives']:>4}")
+
+    results['decoders'] = decoder_stats()
+    print()
+    for name, stats in results['decoders'].items():
+        print(f"decoder {name:<10} {stats['hit_rate']:>6.2f} hit rate {stats['avg_ms']:>8.2f} ms/call")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.max_latency_regression,
+                                          args.max_throughput_regression, args.max_decode_rate_drop)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
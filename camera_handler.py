@@ -1,40 +1,403 @@
+import threading
+import time
+
 import cv2
+import numpy as np
 import config
 
+
+class FrameLease:
+    """A borrowed view of one ring buffer slot. Call release() when done with the frame."""
+    def __init__(self, ring, slot_index, frame_id, timestamp, frame):
+        self._ring = ring
+        self._slot_index = slot_index
+        self.frame_id = frame_id
+        self.timestamp = timestamp  # time.perf_counter() when the frame was captured
+        self.frame = frame
+        self._released = False
+
+    def release(self):
+        """Returns the slot to the ring so the capture thread may overwrite it."""
+        if not self._released:
+            self._released = True
+            self._ring.release(self._slot_index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class FrameRingBuffer:
+    """
+    Small ring of preallocated frame slots that only keeps the newest frames.
+
+    A single producer (the capture thread) writes into free slots; consumers lease
+    the most recent frame. Leased slots are never overwritten, so a consumer can work
+    on the frame in place without copying it. Frames that are overwritten before any
+    consumer looked at them are counted as dropped.
+    """
+    def __init__(self, capacity, shape, dtype=np.uint8):
+        if capacity < 3:
+            # One slot being written, one published, one leased by the consumer.
+            raise ValueError("FrameRingBuffer needs at least 3 slots")
+        self.capacity = capacity
+        self._slots = [np.empty(shape, dtype=dtype) for _ in range(capacity)]
+        self._frame_ids = [0] * capacity
+        self._timestamps = [0.0] * capacity
+        self._leases = [0] * capacity
+        self._cond = threading.Condition()
+        self._write_index = -1
+        self._latest_index = -1
+        self._latest_consumed = True
+        self._next_frame_id = 1
+        self._closed = False
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+    def begin_write(self):
+        """Picks a slot the producer may fill. Returns (slot_index, slot_array)."""
+        with self._cond:
+            start = self._write_index
+            for step in range(1, self.capacity + 1):
+                index = (start + step) % self.capacity
+                if index != self._latest_index and self._leases[index] == 0:
+                    self._write_index = index
+                    return index, self._slots[index]
+        # Only reachable if consumers hold more than capacity - 2 leases.
+        raise RuntimeError("FrameRingBuffer has no free slot; release leased frames")
+
+    def commit_write(self, slot_index, timestamp, frame=None):
+        """
+        Publishes the slot filled by the producer as the newest frame.
+
+        If the capture backend returned a different array than the slot (for example
+        because the resolution changed), pass it as `frame` and it replaces the slot.
+        """
+        with self._cond:
+            if frame is not None and frame is not self._slots[slot_index]:
+                self._slots[slot_index] = frame
+            if not self._latest_consumed:
+                self.frames_dropped += 1
+            self._frame_ids[slot_index] = self._next_frame_id
+            self._timestamps[slot_index] = timestamp
+            self._next_frame_id += 1
+            self._latest_index = slot_index
+            self._latest_consumed = False
+            self.frames_written += 1
+            self._cond.notify_all()
+
+    def acquire_latest(self, after_frame_id=0, timeout=0.0):
+        """
+        Leases the newest frame if it is newer than `after_frame_id`.
+
+        Args:
+            after_frame_id: Only frames with a larger id are returned.
+            timeout: Seconds to wait for such a frame. 0 means do not block.
+
+        Returns:
+            FrameLease or None if no newer frame arrived in time (or the ring was closed).
+        """
+        deadline = time.perf_counter() + timeout if timeout else None
+        with self._cond:
+            while not self._has_newer(after_frame_id):
+                if self._closed or deadline is None:
+                    return None
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            index = self._latest_index
+            self._leases[index] += 1
+            self._latest_consumed = True
+            return FrameLease(self, index, self._frame_ids[index],
+                              self._timestamps[index], self._slots[index])
+
+    def _has_newer(self, after_frame_id):
+        return self._latest_index >= 0 and self._frame_ids[self._latest_index] > after_frame_id
+
+    def release(self, slot_index):
+        with self._cond:
+            if self._leases[slot_index] > 0:
+                self._leases[slot_index] -= 1
+
+    def close(self):
+        """Wakes up all waiting consumers; no more frames will be published."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class PooledBuffer:
+    """An array borrowed from a BufferPool. Call release() when done with it."""
+    def __init__(self, pool, array):
+        self._pool = pool
+        self.array = array
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._pool._give_back(self.array)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class BufferPool:
+    """
+    Preallocated arrays of one shape that are borrowed and returned explicitly, so
+    steady-state frame processing allocates nothing. When every buffer is in use a new
+    one is allocated (and counted in `extra_allocations`) instead of blocking.
+    """
+    def __init__(self, shape, dtype=np.uint8, size=3):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self._free = [np.empty(self.shape, dtype=dtype) for _ in range(size)]
+        self._lock = threading.Lock()
+        self.extra_allocations = 0
+
+    def acquire(self):
+        """Returns a PooledBuffer whose array has undefined contents."""
+        with self._lock:
+            array = self._free.pop() if self._free else None
+            if array is None:
+                self.extra_allocations += 1
+        if array is None:
+            array = np.empty(self.shape, dtype=self.dtype)
+        return PooledBuffer(self, array)
+
+    def _give_back(self, array):
+        with self._lock:
+            self._free.append(array)
+
+
+def to_gray(raw, gray_out):
+    """
+    Writes the luminance of a captured frame into the preallocated `gray_out` array.
+
+    Handles BGR frames, packed YUYV frames (as delivered with CAP_PROP_CONVERT_RGB off,
+    where the Y plane is taken directly instead of converting via BGR) and frames that
+    are already grayscale.
+
+    Returns:
+        False if the frame layout does not match `gray_out`.
+    """
+    h, w = gray_out.shape
+    if raw.ndim == 3 and raw.shape[2] == 3:
+        cv2.cvtColor(raw, cv2.COLOR_BGR2GRAY, dst=gray_out)
+    elif raw.size == h * w * 2:
+        cv2.cvtColor(raw.reshape(h, w, 2), cv2.COLOR_YUV2GRAY_YUY2, dst=gray_out)
+    elif raw.size == h * w:
+        np.copyto(gray_out, raw.reshape(h, w))
+    else:
+        return False
+    return True
+
+
 class CameraHandler:
     """Handles camera initialization, frame reading, and release."""
-    def __init__(self, camera_index=config.CAMERA_INDEX):
-        print(f"Initializing camera with index: {camera_index}...")
+    def __init__(self, camera_index=config.CAMERA_INDEX, stream_id=None,
+                 width=getattr(config, 'REQUESTED_WIDTH', None), height=getattr(config, 'REQUESTED_HEIGHT', None),
+                 gray_only=False):
+        self.stream_id = stream_id if stream_id is not None else str(camera_index)
+        self.gray_only = gray_only  # Capture luminance only; get_latest_frame() then yields 2D gray frames
+        print(f"Initializing camera '{self.stream_id}' with index: {camera_index}...")
         self.cap = cv2.VideoCapture(camera_index)
+        self._raw_buffer = None     # Reused by cap.read() in grayscale mode
+        self._raw_yuyv = False      # True while the backend's BGR conversion is off (packed YUYV frames)
+        self._ring = None
+        self._frame_ready = None
+        self._capture_thread = None
+        self._capture_running = threading.Event()
+        self._capture_ended = threading.Event()
+        self._last_frame_id = 0
 
         if not self.cap.isOpened():
             print(f"Error: Could not open camera with index {camera_index}")
             self.cap = None
             return
 
-        # Attempt to set resolution if specified in config
-        if hasattr(config, 'REQUESTED_WIDTH') and hasattr(config, 'REQUESTED_HEIGHT'):
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.REQUESTED_WIDTH)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.REQUESTED_HEIGHT)
+        if gray_only and getattr(config, 'CAPTURE_RAW_YUYV', True):
+            # Ask for packed YUYV without the backend's BGR conversion; the Y plane is the gray
+            # frame. Backends that ignore this keep delivering BGR, which to_gray() handles.
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUYV'))
+
+        # Attempt to set resolution if one was requested
+        if width and height:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
 
         # Get actual resolution
         self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        print(f"Camera opened successfully. Resolution: {self.width}x{self.height}")
+        if gray_only and getattr(config, 'CAPTURE_RAW_YUYV', True):
+            # Only skip the BGR conversion if the camera really switched to YUYV: an MJPG-only
+            # camera would otherwise hand out compressed buffers.
+            fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+            if fourcc in (cv2.VideoWriter_fourcc(*'YUYV'), cv2.VideoWriter_fourcc(*'YUY2')):
+                self._raw_yuyv = bool(self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+            else:
+                codec = fourcc.to_bytes(4, 'little').decode('ascii', 'replace') if fourcc else 'unknown'
+                print(f"[INFO] Camera '{self.stream_id}' did not switch to YUYV (format: {codec}); "
+                      f"converting its BGR frames to gray instead.")
+        print(f"Camera opened successfully. Resolution: {self.width}x{self.height}"
+              f"{' (grayscale capture)' if gray_only else ''}")
 
     def is_opened(self):
         """Checks if the camera is successfully opened."""
         return self.cap is not None and self.cap.isOpened()
 
-    def read_frame(self):
-        """Reads a frame from the camera."""
+    def read_frame(self, image=None):
+        """
+        Reads a frame from the camera.
+
+        In background capture mode this waits for the next captured frame and
+        returns a copy of it, so existing callers keep working unchanged.
+
+        Args:
+            image: Optional preallocated BGR array the frame is read into.
+        """
+        if self.is_capturing():
+            lease = self.get_latest_frame(timeout=1.0)
+            if lease is None:
+                return False, None
+            with lease:
+                return True, lease.frame.copy()
         if not self.is_opened():
             return False, None
-        ret, frame = self.cap.read()
+        ret, frame = self.cap.read(image=image)
         return ret, frame
 
+    def read_gray(self, gray_out):
+        """
+        Reads the next frame directly into the preallocated 2D array `gray_out`.
+
+        Returns:
+            True on success.
+        """
+        if not self.is_opened():
+            return False
+        ret, raw = self.cap.read(image=self._raw_buffer)
+        if not ret or raw is None:
+            return False
+        self._raw_buffer = raw
+        if to_gray(raw, gray_out):
+            return True
+        if self._raw_yuyv:
+            # The backend reported YUYV but delivers something else: use its BGR frames.
+            print(f"[WARN] Camera '{self.stream_id}' delivered a {raw.shape} frame instead of YUYV; "
+                  f"falling back to BGR capture.")
+            self._raw_yuyv = False
+            self._raw_buffer = None
+            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            return self.read_gray(gray_out)
+        print(f"[ERROR] Camera '{self.stream_id}' delivered a {raw.shape} frame that does not match "
+              f"{self.width}x{self.height}.")
+        return False
+
+    # --- Background capture mode ---
+
+    def start_capture(self, buffer_size=getattr(config, 'CAPTURE_BUFFER_SIZE', 3), frame_ready=None):
+        """
+        Starts a background thread that reads frames at full camera rate into a
+        preallocated ring buffer, so the driver queue never backs up behind a slow decoder.
+
+        Args:
+            buffer_size: Number of preallocated frame slots.
+            frame_ready: Optional threading.Event that is set after every captured frame
+                (and when capture ends), so one consumer can wait on several cameras.
+        """
+        if not self.is_opened():
+            return False
+        if self.is_capturing():
+            return True
+        self._frame_ready = frame_ready
+        shape = (self.height, self.width) if self.gray_only else (self.height, self.width, 3)
+        self._ring = FrameRingBuffer(buffer_size, shape)
+        self._capture_ended.clear()
+        self._capture_running.set()
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+        print(f"Background capture started for '{self.stream_id}' ({buffer_size} frame slots).")
+        return True
+
+    def _capture_loop(self):
+        max_failures = getattr(config, 'CAPTURE_MAX_READ_FAILURES', 30)
+        failures = 0
+        while self._capture_running.is_set():
+            slot_index, slot = self._ring.begin_write()
+            if self.gray_only:
+                ret = self.read_gray(slot)
+                frame = slot
+            else:
+                ret, frame = self.cap.read(image=slot)
+            if not ret or frame is None:
+                failures += 1
+                if failures >= max_failures:
+                    print("[WARN] Camera stopped delivering frames. Ending capture.")
+                    break
+                continue
+            failures = 0
+            self._ring.commit_write(slot_index, time.perf_counter(), frame)
+            if self._frame_ready is not None:
+                self._frame_ready.set()
+        self._capture_ended.set()
+        self._ring.close()
+        if self._frame_ready is not None:
+            self._frame_ready.set()
+
+    def is_capturing(self):
+        """True while the background capture thread is running."""
+        return self._capture_thread is not None and not self._capture_ended.is_set()
+
+    def capture_ended(self):
+        """True once background capture stopped (camera failure or stop_capture())."""
+        return self._capture_ended.is_set()
+
+    def get_latest_frame(self, timeout=0.0):
+        """
+        Leases the newest captured frame that this handler has not returned yet.
+
+        Args:
+            timeout: Seconds to wait for a new frame. 0 returns immediately.
+
+        Returns:
+            FrameLease or None. The caller must release() the lease (or use it as a
+            context manager) so the slot can be reused.
+        """
+        if self._ring is None:
+            return None
+        lease = self._ring.acquire_latest(self._last_frame_id, timeout)
+        if lease is not None:
+            self._last_frame_id = lease.frame_id
+        return lease
+
+    def get_capture_stats(self):
+        """Returns counters of the background capture stage."""
+        if self._ring is None:
+            return {'frames_captured': 0, 'frames_dropped': 0}
+        return {
+            'frames_captured': self._ring.frames_written,
+            'frames_dropped': self._ring.frames_dropped,
+        }
+
+    def stop_capture(self):
+        """Stops the background capture thread."""
+        if self._capture_thread is None:
+            return
+        self._capture_running.clear()
+        self._capture_thread.join(timeout=2.0)
+        self._capture_thread = None
+        self._capture_ended.set()
+
     def release(self):
         """Releases the camera resource."""
+        self.stop_capture()
         if self.cap is not None:
             print("Releasing camera...")
             self.cap.release()
@@ -43,4 +406,4 @@ class CameraHandler:
         """Returns the resolution of the camera."""
         if not self.is_opened():
             return None, None
-        return self.width, self.height
\ No newline at end of file
+        return self.width, self.height
@@ -0,0 +1,378 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import metrics
+
+# Status codes worth retrying; any other non-2xx answer means the payload itself was rejected.
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class DeliveryItem:
+    """One cart payload waiting to be POSTed."""
+    def __init__(self, item_id, payload_json, enqueued_at=None):
+        self.item_id = item_id
+        self.payload_json = payload_json
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+        self.attempts = 0
+
+
+class Outbox:
+    """
+    Append-only JSON-lines log of cart payloads that have not been delivered yet.
+
+    Every enqueued payload is written as an "add" record before it is queued, and an
+    "ack" (delivered) or "drop" (discarded) record is appended once it is settled.
+    On start-up the unsettled payloads are replayed and the file is compacted.
+    """
+    def __init__(self, path, fsync=getattr(config, 'DELIVERY_OUTBOX_FSYNC', False)):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load_pending(self):
+        """Returns the DeliveryItems that were never acked or dropped, and compacts the log."""
+        pending = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line after a crash; everything before it is intact.
+                        continue
+                    if record.get('op') == 'add':
+                        pending[record['id']] = DeliveryItem(record['id'], record['payload'], record.get('ts'))
+                    else:
+                        pending.pop(record.get('id'), None)
+
+        # Rewrite the log with only the pending items so it does not grow forever.
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for item in pending.values():
+                f.write(self._add_record(item))
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        return list(pending.values())
+
+    @staticmethod
+    def _add_record(item):
+        return json.dumps({'op': 'add', 'id': item.item_id, 'ts': item.enqueued_at, 'payload': item.payload_json}) + '\n'
+
+    def append_add(self, item):
+        self._write(self._add_record(item))
+
+    def append_ack(self, item_id):
+        self._write(json.dumps({'op': 'ack', 'id': item_id}) + '\n')
+
+    def append_drop(self, item_id):
+        self._write(json.dumps({'op': 'drop', 'id': item_id}) + '\n')
+
+    def _write(self, line):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CartDeliveryService:
+    """
+    Delivers cart payloads to the Flutter server over pooled keep-alive connections.
+
+    Payloads go through a bounded queue to a configurable number of worker threads.
+    Each worker owns a requests.Session. Failed POSTs are retried with exponential
+    backoff. Optionally several payloads are sent together as one JSON array. With an
+    outbox path set, payloads survive a restart until they were delivered.
+
+    Delivery is at-least-once: a POST that timed out may have reached the server, and
+    the outbox replays anything not acked before a crash. Every request therefore
+    carries an Idempotency-Key header with the ids of its payloads (one id, or a
+    comma-separated list for a batch, in array order). An id never changes across
+    retries or restarts, and the server must ignore a payload whose id it has already
+    added to the cart.
+    """
+    OVERFLOW_DROP_OLDEST = 'drop_oldest'
+    OVERFLOW_DROP_NEWEST = 'drop_newest'
+    OVERFLOW_BLOCK = 'block'
+
+    def __init__(self,
+                 target_url=config.TARGET_POST_URL,
+                 num_workers=getattr(config, 'DELIVERY_WORKERS', 2),
+                 batch_size=getattr(config, 'DELIVERY_BATCH_SIZE', 1),
+                 batch_wait=getattr(config, 'DELIVERY_BATCH_WAIT', 0.05),
+                 max_queue=getattr(config, 'DELIVERY_QUEUE_SIZE', 1000),
+                 overflow_policy=getattr(config, 'DELIVERY_OVERFLOW_POLICY', 'drop_oldest'),
+                 max_retries=getattr(config, 'DELIVERY_MAX_RETRIES', 5),
+                 backoff_base=getattr(config, 'DELIVERY_BACKOFF_BASE', 0.5),
+                 backoff_max=getattr(config, 'DELIVERY_BACKOFF_MAX', 10.0),
+                 timeout=getattr(config, 'POST_TIMEOUT', 10),
+                 outbox_path=getattr(config, 'DELIVERY_OUTBOX_PATH', None)):
+        if overflow_policy not in (self.OVERFLOW_DROP_OLDEST, self.OVERFLOW_DROP_NEWEST, self.OVERFLOW_BLOCK):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.target_url = target_url
+        self.num_workers = num_workers
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.outbox = Outbox(outbox_path) if outbox_path else None
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._workers = []
+        self._in_flight = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.replayed = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_last = 0.0
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Replays the outbox (if any) and starts the worker threads."""
+        if self.outbox is not None:
+            pending = self.outbox.load_pending()
+            if pending:
+                print(f"[INFO] Replaying {len(pending)} undelivered cart item(s) from {self.outbox.path}.")
+            overflow = len(pending) - self.max_queue
+            dropped = []
+            if overflow > 0:
+                # Same bound as enqueue(). Nothing consumes the queue yet, so 'block' drops
+                # the newest items like an enqueue that timed out waiting for room.
+                if self.overflow_policy == self.OVERFLOW_DROP_OLDEST:
+                    dropped, pending = pending[:overflow], pending[overflow:]
+                else:
+                    pending, dropped = pending[:self.max_queue], pending[self.max_queue:]
+                print(f"[WARN] Outbox holds more than the delivery queue ({self.max_queue}); dropped "
+                      f"{len(dropped)} {'oldest' if self.overflow_policy == self.OVERFLOW_DROP_OLDEST else 'newest'} "
+                      f"cart item(s).")
+                for item in dropped:
+                    self.outbox.append_drop(item.item_id)
+                metrics.CART_DROPPED.inc(len(dropped))
+            with self._cond:
+                self._queue.extend(pending)
+                self.replayed = len(pending)
+                self.dropped += len(dropped)
+        for index in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"cart-delivery-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"Cart delivery started: {self.num_workers} worker(s) posting to {self.target_url}.")
+
+    def stop(self, timeout=5.0):
+        """Lets the workers drain the queue for up to `timeout` seconds, then stops them."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._queue or self._in_flight) and time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=max(0.1, deadline - time.monotonic()))
+        if self.outbox is not None:
+            self.outbox.close()
+        with self._cond:
+            if self._queue:
+                print(f"[WARN] {len(self._queue)} cart item(s) not delivered before shutdown"
+                      f"{'; kept in the outbox' if self.outbox else ''}.")
+
+    # --- Producer side ---
+
+    def enqueue(self, payload_json):
+        """
+        Queues a cart payload (JSON string) for delivery.
+
+        Returns:
+            True if queued, False if it was dropped because the queue is full.
+        """
+        item = DeliveryItem(uuid.uuid4().hex, payload_json)
+        if self.outbox is not None:
+            # Persist first so a crash right after this call cannot lose the item.
+            self.outbox.append_add(item)
+
+        dropped_item = None
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.overflow_policy == self.OVERFLOW_BLOCK:
+                    self._cond.wait_for(lambda: len(self._queue) < self.max_queue or self._stopping,
+                                        timeout=getattr(config, 'DELIVERY_ENQUEUE_TIMEOUT', 1.0))
+                if len(self._queue) >= self.max_queue:
+                    if self.overflow_policy == self.OVERFLOW_DROP_OLDEST:
+                        dropped_item = self._queue.popleft()
+                    else:
+                        dropped_item = item
+                    self.dropped += 1
+                    metrics.CART_DROPPED.inc()
+            if dropped_item is not item:
+                self._queue.append(item)
+                self._cond.notify()
+
+        if dropped_item is not None:
+            print(f"[WARN] Cart delivery queue is full ({self.max_queue}). Dropped "
+                  f"{'oldest' if dropped_item is not item else 'new'} payload: {dropped_item.payload_json}")
+            if self.outbox is not None:
+                self.outbox.append_drop(dropped_item.item_id)
+        return dropped_item is not item
+
+    # --- Worker side ---
+
+    def _next_batch(self):
+        """Blocks until items are available; returns up to batch_size items, or None to stop."""
+        with self._cond:
+            while not self._queue:
+                if self._stopping:
+                    return None
+                self._cond.wait(0.5)
+            batch = [self._queue.popleft()]
+            if self.batch_size > 1:
+                # Give a burst of scans a moment to fill the batch.
+                deadline = time.monotonic() + self.batch_wait
+                while len(batch) < self.batch_size:
+                    if not self._queue:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or self._stopping:
+                            break
+                        self._cond.wait(remaining)
+                        continue
+                    batch.append(self._queue.popleft())
+            self._in_flight += len(batch)
+            # Room in the queue for producers blocked by the 'block' policy.
+            self._cond.notify_all()
+            return batch
+
+    def _worker_loop(self):
+        session = requests.Session()
+        # One keep-alive connection per worker; retries are handled here, not by urllib3.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Content-Type': 'application/json'})
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                try:
+                    self._deliver_batch(session, batch)
+                finally:
+                    with self._cond:
+                        self._in_flight -= len(batch)
+                        self._cond.notify_all()
+        finally:
+            session.close()
+
+    def _deliver_batch(self, session, batch):
+        if len(batch) == 1:
+            body = batch[0].payload_json
+        else:
+            # The payloads are already JSON; join them into an array without re-serializing.
+            body = '[' + ','.join(item.payload_json for item in batch) + ']'
+
+        # Lets the server recognize a payload it already received (see the class docstring).
+        headers = {'Idempotency-Key': ','.join(item.item_id for item in batch)}
+
+        attempt = 0
+        while True:
+            attempt += 1
+            retryable, error = self._post(session, body, headers)
+            if error is None:
+                self._settle(batch, delivered=True)
+                return
+            if not retryable or attempt > self.max_retries or self._stopping:
+                print(f"[ERROR] Giving up on {len(batch)} cart item(s) after {attempt} attempt(s): {error}")
+                self._settle(batch, delivered=False, permanent=not retryable)
+                return
+            with self._cond:
+                self.retries += 1
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+            delay *= random.uniform(0.5, 1.0)  # Jitter, so workers do not retry in lockstep
+            print(f"[WARN] POST to {self.target_url} failed ({error}); retry {attempt}/{self.max_retries} in {delay:.2f}s.")
+            time.sleep(delay)
+
+    def _post(self, session, body, headers=None):
+        """Sends one request. Returns (retryable, error); error is None on success."""
+        try:
+            with metrics.STAGE_SECONDS.labels('post').time():
+                response = session.post(self.target_url, data=body, headers=headers, timeout=self.timeout)
+        except requests.exceptions.Timeout:
+            metrics.POSTS.labels('timeout').inc()
+            return True, "timed out"
+        except requests.exceptions.ConnectionError:
+            metrics.POSTS.labels('connection_error').inc()
+            return True, "connection error"
+        except requests.exceptions.RequestException as e:
+            metrics.POSTS.labels('error').inc()
+            return False, str(e)
+        if 200 <= response.status_code < 300:
+            metrics.POSTS.labels('success').inc()
+            print(f"[INFO] POST request successful ({response.status_code}). Response: {response.text}")
+            return False, None
+        metrics.POSTS.labels('http_error').inc()
+        return response.status_code in RETRYABLE_STATUS_CODES, f"HTTP {response.status_code}: {response.text}"
+
+    def _settle(self, batch, delivered, permanent=False):
+        now = time.time()
+        with self._cond:
+            for item in batch:
+                if delivered:
+                    latency = now - item.enqueued_at
+                    self.delivered += 1
+                    self._latency_total += latency
+                    self._latency_last = latency
+                    self._latency_max = max(self._latency_max, latency)
+                    metrics.DELIVERY_SECONDS.observe(latency)
+                else:
+                    self.failed += 1
+        if self.outbox is None:
+            return
+        for item in batch:
+            if delivered:
+                self.outbox.append_ack(item.item_id)
+            elif permanent:
+                # The server rejected the payload; replaying it would fail again.
+                self.outbox.append_drop(item.item_id)
+            # Items that ran out of retries stay in the outbox and are replayed on restart.
+
+    def get_stats(self):
+        """Returns delivery counters, backlog and delivery latency (enqueue to 2xx, seconds)."""
+        with self._cond:
+            return {
+                'backlog': len(self._queue) + self._in_flight,
+                'queued': len(self._queue),
+                'in_flight': self._in_flight,
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'retries': self.retries,
+                'dropped': self.dropped,
+                'replayed': self.replayed,
+                'avg_latency': self._latency_total / self.delivered if self.delivered else 0.0,
+                'last_latency': self._latency_last,
+                'max_latency': self._latency_max,
+            }
@@ -0,0 +1,300 @@
+"""
+Local, memory-mapped snapshot of the product catalog with precomputed cart payloads.
+
+Usage examples:
+    python catalog_snapshot.py                 # incremental refresh of config.CATALOG_SNAPSHOT_PATH
+    python catalog_snapshot.py --full          # rebuild from the whole collection
+    python catalog_snapshot.py --info          # print what the current snapshot contains
+
+File layout (little endian):
+    header   magic, version, marker kind, product count, created/last-modified times, blob size
+    keys     uint64[count], sorted barcode keys (see barcode_key())
+    offsets  uint64[count + 1], start of each record in the blob (the last one is its end)
+    blob     records: cart payload JSON, log message (as a JSON string) and product JSON,
+             separated by newlines
+
+Opening a snapshot maps the file and reads nothing else; a lookup is a binary search in
+the key array plus one slice of the blob.
+"""
+import argparse
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+import config
+from product_lookup import build_cart_payload
+
+MAGIC = b'BCSNAP01'
+VERSION = 2  # 2: the message field is JSON-encoded
+# magic, version, marker kind, count, created_at, last_modified, blob size
+HEADER = struct.Struct('<8sIIQddQ')
+
+MARKER_NONE = 0       # Products carry no last-modified field; refreshes are always full
+MARKER_NUMERIC = 1    # Field holds Unix timestamps
+MARKER_DATETIME = 2   # Field holds BSON dates
+
+# EAN-13 and other numeric codes become one uint64: the digit count times 10**18 plus the
+# value, so codes that only differ in leading zeros stay distinct. 17 digits is the most
+# that fits (17 * 10**18 + 10**17 < 2**64); longer codes are left to MongoDB.
+_LENGTH_FACTOR = 10 ** 18
+MAX_KEY_DIGITS = 17
+
+
+def barcode_key(barcode):
+    """Returns the uint64 key of a numeric barcode of up to MAX_KEY_DIGITS digits, or None."""
+    if not barcode or len(barcode) > MAX_KEY_DIGITS or not barcode.isdigit():
+        return None
+    return len(barcode) * _LENGTH_FACTOR + int(barcode)
+
+
+def barcode_from_key(key):
+    length, value = divmod(int(key), _LENGTH_FACTOR)
+    return str(value).zfill(length)
+
+
+class SnapshotEntry:
+    """One product as stored in the snapshot."""
+    def __init__(self, payload_json, message, product_json):
+        self.payload_json = payload_json  # Cart payload, or None if the product cannot be priced
+        self.message = message            # Same message build_cart_payload() returns
+        self._product_json = product_json
+
+    @property
+    def product(self):
+        """The product document (decoded on access)."""
+        return json.loads(self._product_json)
+
+    def encode(self):
+        # Every field is JSON (the message is a free-form string that can hold newlines), and
+        # json.dumps never emits raw newlines, so they can separate the fields.
+        return b'\n'.join([(self.payload_json or '').encode('utf-8'),
+                           json.dumps(self.message, ensure_ascii=False).encode('utf-8'),
+                           self._product_json.encode('utf-8')])
+
+    @classmethod
+    def decode(cls, record):
+        payload, message, product_json = bytes(record).split(b'\n', 2)
+        return cls(payload.decode('utf-8') or None, json.loads(message), product_json.decode('utf-8'))
+
+    @classmethod
+    def from_product(cls, barcode, product):
+        """Normalizes a product document into a snapshot entry."""
+        product = {k: v for k, v in product.items() if k != '_id'}
+        payload_json, message = build_cart_payload(barcode, product)
+        return cls(payload_json, message, json.dumps(product, default=str, ensure_ascii=False))
+
+
+class CatalogSnapshot:
+    """A read-only, memory-mapped catalog snapshot. Safe to share between threads."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Catalog snapshot {path} is empty")
+        magic, version, self.marker_kind, self.count, self.created_at, self.last_modified, blob_size = \
+            HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} catalog snapshot")
+        keys_offset = HEADER.size
+        offsets_offset = keys_offset + 8 * self.count
+        self._blob_offset = offsets_offset + 8 * (self.count + 1)
+        if self._blob_offset + blob_size > len(self._mm):
+            self.close()
+            raise ValueError(f"Catalog snapshot {path} is truncated")
+        self._keys = np.frombuffer(self._mm, dtype='<u8', count=self.count, offset=keys_offset)
+        self._offsets = np.frombuffer(self._mm, dtype='<u8', count=self.count + 1, offset=offsets_offset)
+
+    @classmethod
+    def open_if_exists(cls, path):
+        """Opens the snapshot at `path`, or returns None (with a warning if it is unusable)."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"[WARN] Ignoring catalog snapshot {path}: {e}")
+            return None
+
+    def get(self, barcode):
+        """Returns the SnapshotEntry of `barcode`, or None if it is not in the snapshot."""
+        key = barcode_key(barcode)
+        if key is None or self.count == 0:
+            return None
+        index = int(np.searchsorted(self._keys, np.uint64(key)))
+        if index >= self.count or int(self._keys[index]) != key:
+            return None
+        return self._record(index)
+
+    def get_many(self, barcodes):
+        """Returns {barcode: SnapshotEntry} for the barcodes that are in the snapshot."""
+        barcodes = [b for b in dict.fromkeys(barcodes) if barcode_key(b) is not None]
+        if not barcodes or self.count == 0:
+            return {}
+        keys = np.array([barcode_key(b) for b in barcodes], dtype=np.uint64)
+        indexes = np.searchsorted(self._keys, keys)
+        found = {}
+        for barcode, key, index in zip(barcodes, keys, indexes):
+            if index < self.count and self._keys[index] == key:
+                found[barcode] = self._record(int(index))
+        return found
+
+    def _record(self, index):
+        start = self._blob_offset + int(self._offsets[index])
+        end = self._blob_offset + int(self._offsets[index + 1])
+        return SnapshotEntry.decode(self._mm[start:end])
+
+    def items(self):
+        """Yields (barcode, SnapshotEntry) for every product, in key order."""
+        for index in range(self.count):
+            yield barcode_from_key(self._keys[index]), self._record(index)
+
+    def marker(self):
+        """Returns the last-modified marker as a value for a Mongo `$gte` query, or None."""
+        if self.marker_kind == MARKER_NUMERIC:
+            return self.last_modified
+        if self.marker_kind == MARKER_DATETIME:
+            return datetime.datetime.fromtimestamp(self.last_modified, tz=datetime.timezone.utc)
+        return None
+
+    def close(self):
+        self._keys = self._offsets = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # Arrays handed out earlier still reference the map; it is freed with them.
+            pass
+        self._file.close()
+
+
+def write_snapshot(path, entries, marker_kind=MARKER_NONE, last_modified=0.0):
+    """
+    Writes {barcode: SnapshotEntry} atomically to `path` (a reader never sees a partial file).
+
+    Returns:
+        Number of products written.
+    """
+    keyed = sorted((barcode_key(b), entry) for b, entry in entries.items() if barcode_key(b) is not None)
+    records = [entry.encode() for _, entry in keyed]
+    offsets = np.zeros(len(records) + 1, dtype='<u8')
+    if records:
+        offsets[1:] = np.cumsum([len(r) for r in records])
+    keys = np.array([key for key, _ in keyed], dtype='<u8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, marker_kind, len(records), time.time(), last_modified, int(offsets[-1])))
+        f.write(keys.tobytes())
+        f.write(offsets.tobytes())
+        for record in records:
+            f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def _marker_value(value):
+    """Returns (marker_kind, unix_time) for a last-modified field value."""
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            # PyMongo returns naive datetimes in UTC.
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return MARKER_DATETIME, value.timestamp()
+    if isinstance(value, (int, float)):
+        return MARKER_NUMERIC, float(value)
+    return MARKER_NONE, 0.0
+
+
+def export_snapshot(collection, path, full=False,
+                    updated_field=getattr(config, 'CATALOG_UPDATED_FIELD', 'updated_at'),
+                    deleted_field=getattr(config, 'CATALOG_DELETED_FIELD', 'deleted')):
+    """
+    Builds or refreshes the snapshot at `path` from a products collection.
+
+    Without `full`, and if the existing snapshot has a last-modified marker, only products
+    whose `updated_field` is at or after the marker are fetched and merged in. The bound
+    is inclusive because a product written in the same instant as the newest one of the
+    last refresh may not have been visible then; re-merging those is harmless. Products
+    with a truthy `deleted_field` are removed. Products deleted from the collection
+    outright are only dropped by a full export.
+
+    Returns:
+        dict with 'products', 'changed', 'removed' and 'incremental'.
+    """
+    base = None if full else CatalogSnapshot.open_if_exists(path)
+    marker = base.marker() if base is not None else None
+    entries = {}
+    marker_kind, last_modified = (base.marker_kind, base.last_modified) if base is not None else (MARKER_NONE, 0.0)
+    if marker is not None:
+        entries = dict(base.items())
+        query = {updated_field: {'$gte': marker}}
+    else:
+        query = {}
+        marker_kind, last_modified = MARKER_NONE, 0.0
+    if base is not None:
+        base.close()
+
+    changed = removed = skipped = 0
+    for product in collection.find(query):
+        barcode = str(product.get('barcode', ''))
+        if barcode_key(barcode) is None:
+            skipped += 1
+            continue
+        kind, modified = _marker_value(product.get(updated_field))
+        if kind != MARKER_NONE and modified >= last_modified:
+            marker_kind, last_modified = kind, modified
+        if product.get(deleted_field):
+            removed += entries.pop(barcode, None) is not None
+            continue
+        entries[barcode] = SnapshotEntry.from_product(barcode, product)
+        changed += 1
+    if skipped:
+        print(f"[WARN] Skipped {skipped} product(s) without a numeric barcode of up to {MAX_KEY_DIGITS} digits "
+              f"(they are still looked up in MongoDB).")
+
+    count = write_snapshot(path, entries, marker_kind, last_modified)
+    return {'products': count, 'changed': changed, 'removed': removed, 'incremental': marker is not None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the products collection to a local catalog snapshot.")
+    parser.add_argument('-o', '--output', default=getattr(config, 'CATALOG_SNAPSHOT_PATH', 'catalog.snap'),
+                        help="Snapshot file (default: config.CATALOG_SNAPSHOT_PATH)")
+    parser.add_argument('--full', action='store_true', help="Rebuild from the whole collection")
+    parser.add_argument('--info', action='store_true', help="Only print information about the snapshot")
+    args = parser.parse_args(argv)
+
+    if args.info:
+        snapshot = CatalogSnapshot.open_if_exists(args.output)
+        if snapshot is None:
+            sys.exit(f"No catalog snapshot at {args.output}")
+        print(f"{args.output}: {snapshot.count} products, created {time.ctime(snapshot.created_at)}, "
+              f"last-modified marker {snapshot.marker()}")
+        snapshot.close()
+        return
+
+    from pymongo import MongoClient
+    client = MongoClient(config.MONGO_URI,
+                         serverSelectionTimeoutMS=getattr(config, 'MONGO_SERVER_SELECTION_TIMEOUT_MS', 2000))
+    try:
+        collection = client[config.MONGO_DATABASE][config.MONGO_COLLECTION]
+        start_time = time.perf_counter()
+        stats = export_snapshot(collection, args.output, full=args.full)
+    finally:
+        client.close()
+    print(f"{'Refreshed' if stats['incremental'] else 'Exported'} {args.output}: {stats['products']} products "
+          f"({stats['changed']} changed, {stats['removed']} removed) in {time.perf_counter() - start_time:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
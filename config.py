@@ -5,6 +5,94 @@ CAMERA_INDEX = 0  # Default camera index (usually 0 for built-in webcam)
 # Set desired resolution (may not be supported by all cameras)
 REQUESTED_WIDTH = 640
 REQUESTED_HEIGHT = 480
+# Camera sources scanned together (e.g. top and side view of one checkout lane). 'source' is
+# a device index, file path or stream URL; 'stream_id' names the camera in logs, WebSocket
+# messages and metrics. Optional 'width'/'height' override the requested resolution.
+# With more than one source, capture always runs in the background and all cameras share
+# one decode pool (sized to the CPU count when DECODE_WORKERS is 0).
+CAMERA_SOURCES = [
+    {'stream_id': 'cam0', 'source': CAMERA_INDEX},
+    # {'stream_id': 'side', 'source': 1},
+]
+# Background capture: read frames on a separate thread into a small ring buffer so the
+# decoder always works on the newest frame instead of a stale one from the driver queue.
+CAPTURE_THREADED = True
+CAPTURE_BUFFER_SIZE = 3          # Preallocated frame slots (minimum 3)
+CAPTURE_MAX_READ_FAILURES = 30   # Consecutive failed reads before capture is considered ended
+# In HEADLESS mode capture only the luminance plane into preallocated buffers. With
+# CAPTURE_RAW_YUYV the camera is asked for packed YUYV and the Y plane is used directly.
+CAPTURE_GRAYSCALE_WHEN_HEADLESS = True
+CAPTURE_RAW_YUYV = True
+GRAY_BUFFER_POOL_SIZE = 3        # Reusable gray frames per camera (one may wait for a decode slot)
+
+# Decoding
+# 0 = decode on the main thread. N > 0 = decode on a pool of N worker processes that
+# receive frames through shared memory (lets higher resolutions keep up with the camera).
+DECODE_WORKERS = 0
+DECODE_SHM_SLOTS = 8             # Shared memory frame slots; frames are skipped when all are busy
+DECODE_MAX_FRAME_WIDTH = 1920    # Each slot is sized for a grayscale frame of this size
+DECODE_MAX_FRAME_HEIGHT = 1080
+DECODE_RESULT_TIMEOUT = 5.0      # Seconds before a frame whose worker never answered is skipped
+# Full-frame decode strategy: 'full' runs pyzbar on the whole frame, 'pyramid' first finds
+# barcode-like regions on a downscaled frame and decodes only their full-resolution crops.
+DECODE_STRATEGY = 'full'
+PYRAMID_SCALE = 0.25             # Downscale factor for candidate detection
+PYRAMID_MIN_AREA_RATIO = 0.002   # Ignore candidate blobs smaller than this fraction of the frame
+PYRAMID_MAX_CANDIDATES = 4       # Decode at most this many candidate crops per frame
+PYRAMID_CROP_PADDING_PX = 16     # Padding around each candidate crop
+PYRAMID_FALLBACK_FULL_SCAN = False  # Run a full-frame decode when no candidate decodes
+# Decoder backends, run in order with their results merged until one vouches for the whole frame:
+# 'scanline' (NumPy EAN-13 reader for clean, axis-aligned codes; vouches only when nothing else on
+# its scanlines looks like a barcode), 'pyzbar' (ZBar) and 'opencv' (cv2 barcode detector, if built in)
+DECODER_CHAIN = ['scanline', 'pyzbar']
+SCANLINE_LINES = 12              # Rows (and columns) sampled by the scanline decoder
+SCANLINE_MIN_AGREEMENT = 2       # Lines that must read the same code before it is reported
+SCANLINE_VERTICAL = True         # Also scan columns, for barcodes rotated by 90 degrees
+
+# ROI tracking: after a detection, decode only a padded crop around the last barcode position
+ROI_TRACKING_ENABLED = True
+ROI_FULL_SCAN_INTERVAL = 15      # Force a full-frame scan at least every N frames
+ROI_PADDING = 0.5                # Padding on each side, as a fraction of the tracked box size
+ROI_MIN_PADDING_PX = 24          # Minimum padding on each side, in pixels
+ROI_HISTORY = 3                  # Number of recent detections used to predict the ROI
+ROI_MAX_AREA_RATIO = 0.6         # Scan the full frame if the ROI would cover more than this
+
+# Motion gating: skip decoding while the scene is unchanged (e.g. an empty counter)
+MOTION_GATING_ENABLED = True
+MOTION_THUMB_SIZE = (80, 60)     # (width, height) of the thumbnails that are compared
+MOTION_PIXEL_THRESHOLD = 18      # Gray level difference for a thumbnail pixel to count as changed
+MOTION_MIN_CHANGED_RATIO = 0.005 # Fraction of changed thumbnail pixels that counts as a scene change
+MOTION_HOLD_FRAMES = 10          # Keep decoding this many frames after the scene settles
+MOTION_REFRESH_INTERVAL = 2.0    # Decode at least once every N seconds even without change
+MOTION_ROI_PADDING_PX = 32       # Padding around the changed region handed to the decoder
+
+# Decode governor: holds a latency budget by lowering decode resolution, ROI size and rate
+# under load, and restoring them when there is headroom (levels: decode_governor.DEFAULT_LEVELS)
+GOVERNOR_ENABLED = True
+GOVERNOR_BUDGET_MS = 40.0        # Target decode latency per frame (submit to result with a pool)
+GOVERNOR_EWMA_ALPHA = 0.2        # Weight of the newest latency sample in the moving average
+GOVERNOR_RECOVER_RATIO = 0.6     # Step back up only while the average is below this fraction of the budget
+GOVERNOR_DEGRADE_DWELL = 0.5     # Seconds over budget before stepping down a level
+GOVERNOR_RECOVER_DWELL = 3.0     # Seconds with headroom before stepping up a level
+
+# Scan debouncing: turns per-frame detections into one "item entered" event per item
+SCAN_CONFIRM_FRAMES = 2          # Decoded frames a barcode must appear in before it is scanned
+SCAN_REARM_SECONDS = 1.5         # A scanned barcode must be missing this long before it can scan again
+
+# Offline batch scanning (batch_scan.py)
+BATCH_VIDEO_SEGMENT_FRAMES = 300 # Video frames per worker task; long videos are split so all cores help
+
+# Instrumentation: per-stage latency histograms and counters, served on the API's /metrics route
+METRICS_ENABLED = True
+
+# Headless mode: no window, no overlay drawing and no per-frame display copy. Stop with
+# Ctrl+C or SIGTERM instead of the exit key.
+HEADLESS = False
+# Remote preview: an occasional downscaled JPEG served on the API's /preview.jpg route
+PREVIEW_ENABLED = False
+PREVIEW_INTERVAL = 1.0           # Seconds between preview snapshots
+PREVIEW_MAX_WIDTH = 320          # Snapshots are downscaled to at most this width
+PREVIEW_JPEG_QUALITY = 70
 
 # Display
 WINDOW_NAME = 'Real-time Barcode Scanner (Modular Demo)'
@@ -23,9 +111,60 @@ EXIT_KEY = ord('q') # Press 'q' to exit
 MONGO_URI = "mongodb://localhost:27017/" # Your MongoDB connection string
 MONGO_DATABASE = "shopdb"          # Your database name
 MONGO_COLLECTION = "products"          # Your collection name
+MONGO_ENSURE_INDEXES = True            # Create the unique index on `barcode` on first connect
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 2000  # Give up on an unreachable server after this long
+MONGO_CONNECT_TIMEOUT_MS = 2000
+MONGO_SOCKET_TIMEOUT_MS = 2000
+# Background health monitor and circuit breaker around lookups
+DB_HEALTH_CHECK_INTERVAL = 5.0         # Seconds between pings while the DB is healthy
+DB_BREAKER_FAILURE_THRESHOLD = 3       # Consecutive failures before lookups fail fast
+DB_BREAKER_BASE_BACKOFF = 1.0          # First reconnect attempt after this many seconds
+DB_BREAKER_MAX_BACKOFF = 30.0          # Backoff doubles up to this limit
+# In-process product cache in front of MongoDB
+PRODUCT_CACHE_ENABLED = True
+PRODUCT_CACHE_SIZE = 5000              # Maximum number of cached barcodes (LRU eviction)
+PRODUCT_CACHE_TTL = 300.0              # Seconds a found product stays fresh
+PRODUCT_CACHE_NEGATIVE_TTL = 30.0      # Seconds a "not found" answer stays fresh
+# Local catalog snapshot (build with `python catalog_snapshot.py`): memory-mapped products
+# with precomputed cart payloads, checked before MongoDB and usable offline
+CATALOG_SNAPSHOT_ENABLED = False
+CATALOG_SNAPSHOT_PATH = "catalog.snap"
+CATALOG_REFRESH_INTERVAL = 300.0       # Seconds between incremental refreshes while connected (0 = never)
+CATALOG_UPDATED_FIELD = 'updated_at'   # Last-modified field on product documents (date or Unix time)
+CATALOG_DELETED_FIELD = 'deleted'      # Products with this field set are removed on refresh
 
 # API Server
 API_HOST = "127.0.0.1" # Host for the API server
 API_PORT = 8000        # Port for the API server
+API_SERVER_ENABLED = True # Start the WebSocket/API server alongside the scanner
+WS_CLIENT_QUEUE_SIZE = 32     # Pending messages per WebSocket client
+WS_OVERFLOW_POLICY = 'drop_oldest'  # Full client queue: 'drop_oldest' or 'disconnect'
+WS_PING_INTERVAL = 20.0       # Seconds between WebSocket pings
+WS_PING_TIMEOUT = 20.0        # Drop clients that do not answer a ping within this time
+# Image decode endpoints (/decode, /decode/raw)
+DECODE_API_WORKERS = 2        # Threads decoding uploaded images (kept low so the live scanner is not starved)
+DECODE_API_MAX_PENDING = 16   # Images queued or decoding at once across all requests
+DECODE_API_QUEUE_TIMEOUT = 5.0  # Seconds an image may wait for a slot before the request gets 503
+DECODE_API_MAX_IMAGES = 16    # Images per request
+DECODE_API_MAX_IMAGE_BYTES = 8 * 1024 * 1024
+DECODE_API_MAX_REQUEST_BYTES = 32 * 1024 * 1024
+DECODE_API_MAX_PIXELS = 40_000_000  # Decoded size limit per image (read from the header; 413 above it)
+# Product lookups run on this many background threads so the video loop never waits on the DB
+LOOKUP_WORKERS = 4
 # Target HTTP POST Endpoint
-TARGET_POST_URL = "http://localhost:8088/add_to_cart" # <-- Flutter Server
\ No newline at end of file
+TARGET_POST_URL = "http://localhost:8088/add_to_cart" # <-- Flutter Server
+POST_TIMEOUT = 10      # Seconds per POST attempt
+# Cart delivery
+# Delivery is at-least-once: every POST carries an Idempotency-Key header with its payload ids
+# (comma-separated for a batch), and the server must skip ids it has already added to the cart.
+DELIVERY_WORKERS = 2             # Threads posting to the cart, each with its own keep-alive connection
+DELIVERY_BATCH_SIZE = 1          # >1 sends up to N payloads as one JSON array (the server must accept arrays)
+DELIVERY_BATCH_WAIT = 0.05       # Seconds to wait for more payloads to fill a batch
+DELIVERY_QUEUE_SIZE = 1000       # Maximum payloads waiting for delivery
+DELIVERY_OVERFLOW_POLICY = 'drop_oldest'  # When full: 'drop_oldest', 'drop_newest' or 'block'
+DELIVERY_ENQUEUE_TIMEOUT = 1.0   # With 'block', wait this long for room before dropping the new payload
+DELIVERY_MAX_RETRIES = 5         # Retries per payload for timeouts, connection errors and 5xx/429
+DELIVERY_BACKOFF_BASE = 0.5      # First retry delay in seconds; doubles per attempt
+DELIVERY_BACKOFF_MAX = 10.0      # Upper bound for the retry delay
+DELIVERY_OUTBOX_PATH = "cart_outbox.jsonl"  # Undelivered payloads are replayed from here on restart (None disables)
+DELIVERY_OUTBOX_FSYNC = False    # fsync after every outbox write (safer on power loss, slower)
\ No newline at end of file
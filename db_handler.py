@@ -1,6 +1,166 @@
+import threading
+import time
+from collections import OrderedDict
+
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, PyMongoError
 import config
+from catalog_snapshot import CatalogSnapshot, export_snapshot
+
+
+class ProductCache:
+    """
+    Bounded in-process cache of product lookups with LRU eviction and TTL expiry.
+
+    "Not found" answers are cached too (as None) with a shorter TTL, so unknown
+    barcodes that are rescanned do not hit the database every time. Expired entries
+    are kept until they are evicted so they can be served as a stale fallback while
+    the database is unreachable.
+    """
+    def __init__(self,
+                 max_size=getattr(config, 'PRODUCT_CACHE_SIZE', 5000),
+                 ttl=getattr(config, 'PRODUCT_CACHE_TTL', 300.0),
+                 negative_ttl=getattr(config, 'PRODUCT_CACHE_NEGATIVE_TTL', 30.0)):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # barcode -> (expires_at, product or None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def get(self, barcode, allow_stale=False):
+        """
+        Looks up a barcode in the cache.
+
+        Args:
+            barcode: Barcode string.
+            allow_stale: Also return expired entries (used when the database is down).
+
+        Returns:
+            tuple: (cached, product)
+                cached: True if the cache had an answer for this barcode.
+                product: The product dict, or None for a cached "not found".
+        """
+        with self._lock:
+            entry = self._entries.get(barcode)
+            if entry is None:
+                if not allow_stale:
+                    self.misses += 1
+                return False, None
+            expires_at, product = entry
+            if expires_at < time.monotonic():
+                if not allow_stale:
+                    self.misses += 1
+                    return False, None
+                self.stale_hits += 1
+            elif product is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            self._entries.move_to_end(barcode)
+        # Callers get their own copy so they cannot modify the cached document.
+        return True, dict(product) if product is not None else None
+
+    def put(self, barcode, product):
+        """Caches a lookup result. Pass product=None to cache a "not found" answer."""
+        ttl = self.ttl if product is not None else self.negative_ttl
+        with self._lock:
+            self._entries[barcode] = (time.monotonic() + ttl, product)
+            self._entries.move_to_end(barcode)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, barcode=None):
+        """Drops one barcode from the cache, or everything if barcode is None."""
+        with self._lock:
+            if barcode is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(barcode, None)
+
+    def get_stats(self):
+        """Returns hit/miss/eviction counters and the current size."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class CircuitBreaker:
+    """
+    Fails database calls fast after repeated errors instead of waiting on timeouts.
+
+    closed:    calls go through; `failure_threshold` consecutive failures open the circuit.
+    open:      calls are refused until the backoff delay has passed.
+    half_open: one trial call is let through; success closes the circuit, failure
+               reopens it with a doubled backoff (capped at `max_backoff`).
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 failure_threshold=getattr(config, 'DB_BREAKER_FAILURE_THRESHOLD', 3),
+                 base_backoff=getattr(config, 'DB_BREAKER_BASE_BACKOFF', 1.0),
+                 max_backoff=getattr(config, 'DB_BREAKER_MAX_BACKOFF', 30.0)):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self._failures = 0
+        self._backoff = base_backoff
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """True if a call may be attempted now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self._retry_at:
+                self.state = self.HALF_OPEN
+                return True
+            # Open, or half-open with the trial call still in flight.
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print("MongoDB circuit closed; database reachable again.")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._backoff = self.base_backoff
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.CLOSED:
+                if self._failures < self.failure_threshold:
+                    return
+                print(f"MongoDB circuit open; failing fast for {self._backoff:.1f}s.")
+            else:
+                # A trial call or health probe failed while open: back off further.
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+            self.state = self.OPEN
+            self._retry_at = time.monotonic() + self._backoff
+
+    def seconds_until_retry(self):
+        """Seconds until an open circuit allows the next trial call (0 if not open)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._retry_at - time.monotonic())
+
 
 class DBHandler:
     """Handles database connection and product lookup."""
@@ -9,47 +169,97 @@ class DBHandler:
         self.client = None
         self.db = None
         self.collection = None
+        self.cache = ProductCache() if getattr(config, 'PRODUCT_CACHE_ENABLED', True) else None
+        # Local catalog snapshot: answers lookups from memory, also while MongoDB is down.
+        self.snapshot_path = getattr(config, 'CATALOG_SNAPSHOT_PATH', None) \
+            if getattr(config, 'CATALOG_SNAPSHOT_ENABLED', False) else None
+        self.snapshot = CatalogSnapshot.open_if_exists(self.snapshot_path)
+        if self.snapshot is not None:
+            print(f"Catalog snapshot loaded: {self.snapshot.count} products from {self.snapshot_path}.")
+        self._snapshot_lock = threading.Lock()
+        self._next_snapshot_refresh = time.monotonic() + getattr(config, 'CATALOG_REFRESH_INTERVAL', 0.0)
+        self.breaker = CircuitBreaker()
+        self._healthy = False
+        self._indexes_ensured = False
+        self._stop_event = threading.Event()
         self._connect()
+        self._check_health()
+
+        # Keeps the connection state current so lookups never need their own ping.
+        self._monitor_thread = threading.Thread(target=self._health_monitor, daemon=True)
+        self._monitor_thread.start()
 
     def _connect(self):
-        """Establishes the connection to MongoDB."""
+        """Creates the MongoDB client. The driver connects (and reconnects) in the background."""
         try:
-            # Connect to MongoDB server
-            self.client = MongoClient(config.MONGO_URI)
-            # The ismaster command is cheap and does not require auth.
-            self.client.admin.command('ismaster')
-            print("MongoDB connection successful.")
+            # Short timeouts so an unreachable server is noticed quickly instead of stalling a scan.
+            self.client = MongoClient(
+                config.MONGO_URI,
+                serverSelectionTimeoutMS=getattr(config, 'MONGO_SERVER_SELECTION_TIMEOUT_MS', 2000),
+                connectTimeoutMS=getattr(config, 'MONGO_CONNECT_TIMEOUT_MS', 2000),
+                socketTimeoutMS=getattr(config, 'MONGO_SOCKET_TIMEOUT_MS', 2000),
+            )
 
             # Get database and collection
             self.db = self.client[config.MONGO_DATABASE]
             self.collection = self.db[config.MONGO_COLLECTION]
             print(f"Using database: {config.MONGO_DATABASE}, collection: {config.MONGO_COLLECTION}")
 
-        except ConnectionFailure:
-            print(f"Error: Could not connect to MongoDB at {config.MONGO_URI}")
-            self.client = None
-            self.db = None
-            self.collection = None
         except Exception as e:
             print(f"An unexpected error occurred during MongoDB connection: {e}")
             self.client = None
             self.db = None
             self.collection = None
 
-
-    def is_connected(self):
-        """Checks if the database connection is active."""
-        # Check if client is initialized and can perform a simple operation
+    def _check_health(self):
+        """Pings the server once and updates the connection state and circuit breaker."""
         if self.client is None:
-            return False
+            self._connect()
+            if self.client is None:
+                self._set_healthy(False)
+                return
         try:
-            # Ping the database to check connection health
+            # The ping command is cheap and does not require auth.
             self.client.admin.command('ping')
-            return True
-        except:
-            # If ping fails, connection is likely down
-            print("MongoDB connection lost or failed ping.")
-            return False
+            self._set_healthy(True)
+            if not self._indexes_ensured and getattr(config, 'MONGO_ENSURE_INDEXES', True):
+                self.ensure_indexes()
+        except ConnectionFailure:
+            self._set_healthy(False)
+        except Exception as e:
+            print(f"MongoDB health check failed: {e}")
+            self._set_healthy(False)
+
+    def _set_healthy(self, healthy):
+        if healthy:
+            if not self._healthy:
+                print("MongoDB connection successful.")
+            self.breaker.record_success()
+        else:
+            if self._healthy:
+                print("MongoDB connection lost or failed ping.")
+            else:
+                print(f"Error: Could not connect to MongoDB at {config.MONGO_URI}")
+            self.breaker.record_failure()
+        self._healthy = healthy
+
+    def _health_monitor(self):
+        interval = getattr(config, 'DB_HEALTH_CHECK_INTERVAL', 5.0)
+        while True:
+            # While the circuit is open, probe again when its backoff expires.
+            delay = interval if self._healthy else max(self.breaker.seconds_until_retry(), 0.5)
+            if self._stop_event.wait(delay):
+                break
+            self._check_health()
+            try:
+                self._maybe_refresh_snapshot()
+            except Exception as e:
+                # A bad snapshot refresh must not end health monitoring.
+                print(f"[ERROR] Catalog snapshot refresh failed: {e}")
+
+    def is_connected(self):
+        """Returns the connection state kept up to date by the health monitor (no round trip)."""
+        return self.client is not None and self._healthy and self.breaker.state != CircuitBreaker.OPEN
 
     def get_product_by_barcode(self, barcode_data: str):
         """
@@ -61,27 +271,183 @@ class DBHandler:
         Returns:
             dict or None: The product document if found, otherwise None.
         """
-        if not self.is_connected():
-            print("Database not connected. Cannot perform lookup.")
-            return None
+        if self.cache is not None:
+            cached, product = self.cache.get(barcode_data)
+            if cached:
+                return product
+        snapshot = self.snapshot
+        if snapshot is not None:
+            entry = snapshot.get(barcode_data)
+            if entry is not None:
+                return entry.product
+
+        if self.collection is None or not self.breaker.allow_request():
+            # Fail fast while the database is known to be down.
+            return self._stale_product(barcode_data)
 
         try:
             # Query the collection for a document matching the barcode
             product = self.collection.find_one({"barcode": barcode_data})
+            self.breaker.record_success()
+            self._healthy = True
             # Remove MongoDB's ObjectId for easier handling in API response
             if product and "_id" in product:
                  product.pop("_id")
+            if self.cache is not None:
+                self.cache.put(barcode_data, product)
+                if product is not None:
+                    product = dict(product)
             return product
-        except PyMongoError as e:
+        except (ConnectionFailure, PyMongoError) as e:
             print(f"An error occurred during database lookup for barcode {barcode_data}: {e}")
-            return None
+            if isinstance(e, ConnectionFailure):
+                self._healthy = False
+                self.breaker.record_failure()
+            return self._stale_product(barcode_data)
         except Exception as e:
             print(f"An unexpected error occurred during database lookup for barcode {barcode_data}: {e}")
             return None
 
+    def get_products_by_barcodes(self, barcodes):
+        """
+        Looks up several barcodes with a single `$in` query.
+
+        Args:
+            barcodes: Iterable of barcode strings (duplicates are ignored).
+
+        Returns:
+            dict: barcode -> product document, or None for barcodes that were not found
+                  (or could not be looked up). Every requested barcode is a key.
+        """
+        results = {}
+        to_fetch = []
+        for barcode_data in dict.fromkeys(barcodes):
+            if self.cache is not None:
+                cached, product = self.cache.get(barcode_data)
+                if cached:
+                    results[barcode_data] = product
+                    continue
+            to_fetch.append(barcode_data)
+        if to_fetch:
+            for barcode_data, entry in self.get_snapshot_entries(to_fetch).items():
+                results[barcode_data] = entry.product
+            to_fetch = [b for b in to_fetch if b not in results]
+        if not to_fetch:
+            return results
+
+        if self.collection is None or not self.breaker.allow_request():
+            # Fail fast while the database is known to be down.
+            for barcode_data in to_fetch:
+                results[barcode_data] = self._stale_product(barcode_data)
+            return results
+
+        try:
+            found = {}
+            for product in self.collection.find({"barcode": {"$in": to_fetch}}):
+                product.pop("_id", None)
+                found[product["barcode"]] = product
+            self.breaker.record_success()
+            self._healthy = True
+        except (ConnectionFailure, PyMongoError) as e:
+            print(f"An error occurred during bulk database lookup of {len(to_fetch)} barcodes: {e}")
+            if isinstance(e, ConnectionFailure):
+                self._healthy = False
+                self.breaker.record_failure()
+            for barcode_data in to_fetch:
+                results[barcode_data] = self._stale_product(barcode_data)
+            return results
+
+        for barcode_data in to_fetch:
+            product = found.get(barcode_data)
+            if self.cache is not None:
+                self.cache.put(barcode_data, product)
+                if product is not None:
+                    product = dict(product)
+            results[barcode_data] = product
+        return results
+
+    def get_snapshot_entries(self, barcodes):
+        """
+        Looks barcodes up in the local catalog snapshot only (no network, no cache).
+
+        Returns:
+            dict: barcode -> SnapshotEntry (precomputed cart payload, message and product)
+                  for the barcodes in the snapshot. Empty without a snapshot.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        return snapshot.get_many(barcodes)
+
+    def refresh_snapshot(self, full=False):
+        """
+        Updates the catalog snapshot from MongoDB (incrementally from its last-modified
+        marker unless `full`) and switches lookups over to the new file.
+
+        Returns:
+            The exporter statistics, or None if the database is unavailable or the export failed.
+        """
+        if not self.snapshot_path or self.collection is None or not self.is_connected():
+            return None
+        with self._snapshot_lock:
+            try:
+                stats = export_snapshot(self.collection, self.snapshot_path, full=full)
+            except (ConnectionFailure, PyMongoError, OSError) as e:
+                print(f"[WARN] Catalog snapshot refresh failed: {e}")
+                return None
+            # Readers of the old snapshot keep their mapping until they drop it.
+            self.snapshot = CatalogSnapshot.open_if_exists(self.snapshot_path)
+        if stats['changed'] or stats['removed'] or not stats['incremental']:
+            print(f"[INFO] Catalog snapshot refreshed: {stats['products']} products "
+                  f"({stats['changed']} changed, {stats['removed']} removed).")
+        return stats
+
+    def _maybe_refresh_snapshot(self):
+        interval = getattr(config, 'CATALOG_REFRESH_INTERVAL', 0.0)
+        if not self.snapshot_path or not self._healthy:
+            return
+        # Build the first snapshot as soon as the database is reachable.
+        if self.snapshot is not None and (not interval or time.monotonic() < self._next_snapshot_refresh):
+            return
+        self._next_snapshot_refresh = time.monotonic() + (interval or float('inf'))
+        self.refresh_snapshot()
+
+    def ensure_indexes(self):
+        """Creates the unique index on `barcode` that single and bulk lookups rely on."""
+        if self.collection is None:
+            return False
+        try:
+            self.collection.create_index("barcode", unique=True, name="barcode_unique")
+            self._indexes_ensured = True
+            return True
+        except PyMongoError as e:
+            # Typically duplicate barcodes in the collection; lookups still work without it.
+            print(f"[WARN] Could not create unique index on 'barcode': {e}")
+            self._indexes_ensured = True
+            return False
+
+    def _stale_product(self, barcode_data):
+        """Returns an expired cache entry, if any, while the database cannot answer."""
+        if self.cache is None:
+            return None
+        cached, product = self.cache.get(barcode_data, allow_stale=True)
+        if cached and product is not None:
+            print(f"[WARN] Serving cached product for barcode {barcode_data} while the database is unavailable.")
+        return product
+
+    def invalidate_cache(self, barcode_data=None):
+        """Removes one barcode (or all barcodes if None) from the product cache."""
+        if self.cache is not None:
+            self.cache.invalidate(barcode_data)
+
+    def get_cache_stats(self):
+        """Returns the product cache statistics, or None if caching is disabled."""
+        return self.cache.get_stats() if self.cache is not None else None
+
 
     def close(self):
         """Closes the database connection."""
+        self._stop_event.set()
         if self.client:
             print("Closing MongoDB connection...")
             self.client.close()
@@ -0,0 +1,141 @@
+import time
+
+import config
+
+# From full quality to cheapest. scale: working resolution of the decoded region;
+# decode_every: decode one in N frames that passed the motion gate; roi_padding: factor
+# on the ROI tracker's padding (smaller crops).
+DEFAULT_LEVELS = [
+    {'name': 'full',             'scale': 1.0,  'decode_every': 1, 'roi_padding': 1.0},
+    {'name': 'tight_roi',        'scale': 1.0,  'decode_every': 1, 'roi_padding': 0.5},
+    {'name': 'scale_75',         'scale': 0.75, 'decode_every': 1, 'roi_padding': 0.5},
+    {'name': 'scale_50',         'scale': 0.5,  'decode_every': 1, 'roi_padding': 0.5},
+    {'name': 'scale_50_every_2', 'scale': 0.5,  'decode_every': 2, 'roi_padding': 0.5},
+    {'name': 'scale_50_every_3', 'scale': 0.5,  'decode_every': 3, 'roi_padding': 0.5},
+]
+
+
+class DecodeGovernor:
+    """
+    Keeps decode latency within a budget by trading decode quality for time.
+
+    Every decode reports its latency. The governor keeps an exponential moving average
+    and steps down one quality level (lower resolution, smaller ROI, fewer decoded
+    frames) when the average stays above the budget for `degrade_dwell` seconds. It
+    steps back up when the average stays below `recover_ratio` x budget for
+    `recover_dwell` seconds and the next better level is predicted to fit the budget.
+    """
+    def __init__(self,
+                 budget=getattr(config, 'GOVERNOR_BUDGET_MS', 40.0) / 1000.0,
+                 levels=getattr(config, 'GOVERNOR_LEVELS', DEFAULT_LEVELS),
+                 ewma_alpha=getattr(config, 'GOVERNOR_EWMA_ALPHA', 0.2),
+                 recover_ratio=getattr(config, 'GOVERNOR_RECOVER_RATIO', 0.6),
+                 degrade_dwell=getattr(config, 'GOVERNOR_DEGRADE_DWELL', 0.5),
+                 recover_dwell=getattr(config, 'GOVERNOR_RECOVER_DWELL', 3.0)):
+        if not levels:
+            raise ValueError("DecodeGovernor needs at least one level")
+        self.budget = budget
+        self.levels = levels
+        self.ewma_alpha = ewma_alpha
+        self.recover_ratio = recover_ratio
+        self.degrade_dwell = degrade_dwell
+        self.recover_dwell = recover_dwell
+        self.level_index = 0
+        self.ewma_latency = None
+        self._over_since = None
+        self._under_since = None
+        self._frame_counters = {}  # stream_id -> frames offered since the last decode
+        self.level_changes = 0
+        self.frames_thinned = 0
+
+    @property
+    def level(self):
+        return self.levels[self.level_index]
+
+    @property
+    def mode(self):
+        """Name of the current quality level."""
+        return self.level['name']
+
+    @property
+    def scale(self):
+        return self.level.get('scale', 1.0)
+
+    @property
+    def roi_padding(self):
+        return self.level.get('roi_padding', 1.0)
+
+    def allow_decode(self, stream_id=None):
+        """
+        Call for every frame that would be decoded. Returns False for the frames the
+        current level skips (decode one in `decode_every`).
+        """
+        decode_every = self.level.get('decode_every', 1)
+        count = self._frame_counters.get(stream_id, 0) + 1
+        if count >= decode_every:
+            self._frame_counters[stream_id] = 0
+            return True
+        self._frame_counters[stream_id] = count
+        self.frames_thinned += 1
+        return False
+
+    def observe(self, latency, now=None):
+        """
+        Feeds the latency (seconds) of one decode and adapts the level.
+
+        Returns:
+            True if the level changed.
+        """
+        now = time.monotonic() if now is None else now
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += self.ewma_alpha * (latency - self.ewma_latency)
+
+        if self.ewma_latency > self.budget:
+            self._under_since = None
+            if self._over_since is None:
+                self._over_since = now
+            if now - self._over_since >= self.degrade_dwell and self.level_index < len(self.levels) - 1:
+                return self._switch(self.level_index + 1, now, "over budget")
+        elif self.ewma_latency < self.recover_ratio * self.budget:
+            self._over_since = None
+            if self._under_since is None:
+                self._under_since = now
+            if (now - self._under_since >= self.recover_dwell and self.level_index > 0
+                    and self._predicted_latency(self.level_index - 1) < self.budget):
+                return self._switch(self.level_index - 1, now, "headroom")
+        else:
+            self._over_since = None
+            self._under_since = None
+        return False
+
+    def _predicted_latency(self, index):
+        """Rough latency estimate at another level: decode time scales with the pixel count."""
+        current, target = self.level, self.levels[index]
+        area_ratio = (target.get('scale', 1.0) / current.get('scale', 1.0)) ** 2
+        return self.ewma_latency * area_ratio
+
+    def _switch(self, index, now, reason):
+        previous = self.level
+        self.level_index = index
+        self.level_changes += 1
+        self._over_since = None
+        self._under_since = None
+        level = self.level
+        print(f"[INFO] Decode governor: {reason} (avg {self.ewma_latency * 1000:.1f} ms, budget "
+              f"{self.budget * 1000:.1f} ms), {previous['name']} -> {level['name']} "
+              f"(scale {level.get('scale', 1.0)}, decode 1/{level.get('decode_every', 1)} frames, "
+              f"ROI padding x{level.get('roi_padding', 1.0)}).")
+        return True
+
+    def get_stats(self):
+        """Returns the current mode, the latency average and counters."""
+        return {
+            'mode': self.mode,
+            'level': self.level_index,
+            'ewma_latency_ms': (self.ewma_latency or 0.0) * 1000,
+            'budget_ms': self.budget * 1000,
+            'level_changes': self.level_changes,
+            'frames_thinned': self.frames_thinned,
+        }
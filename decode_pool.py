@@ -0,0 +1,349 @@
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import config
+from barcode_processor import merge_decoder_stats, merge_pyramid_stats, offset_barcodes, scale_barcodes
+
+
+class DecodeResult:
+    """Decode output for one submitted frame."""
+    def __init__(self, frame_id, barcodes, latency, worker_id, queue_time, roi=None, stream_id=None, error=None):
+        self.frame_id = frame_id
+        self.stream_id = stream_id    # Camera the frame came from, as passed to submit()
+        self.roi = roi                # Region that was decoded, or None for the full frame
+        self.barcodes = barcodes      # Same list of dicts as process_barcodes() returns
+        self.latency = latency        # pyzbar time inside the worker, in seconds
+        self.worker_id = worker_id
+        self.queue_time = queue_time  # Seconds from submit() until the result was collected
+        self.error = error            # Why the frame was not decoded (barcodes is then empty), or None
+
+
+def _decode_worker(worker_id, slot_names, task_queue, result_queue, current_tasks, task_started):
+    """
+    Worker process: decodes frames that the parent placed in shared memory slots.
+
+    current_tasks[worker_id] and task_started[worker_id] (shared arrays) hold the
+    sequence number of the last frame this worker picked up and when (time.monotonic()),
+    so the parent can time decodes and knows which slot a dead worker was holding.
+    """
+    # The parent process handles Ctrl+C and shuts the pool down cleanly.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from barcode_processor import decode_full_frame, decoder_stats, process_barcodes, pyramid_stats
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            seq, frame_id, slot_index, shape, is_crop = task
+            task_started[worker_id] = time.monotonic()
+            current_tasks[worker_id] = seq
+            gray_frame = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot_index].buf)
+            error = None
+            try:
+                # ROI crops are already small; only whole frames go through the configured strategy.
+                decode = process_barcodes if is_crop else decode_full_frame
+                barcodes, latency = decode(gray_frame)
+            except Exception as e:
+                print(f"[ERROR] Decode worker {worker_id} failed on frame {frame_id}: {e}")
+                barcodes, latency, error = [], 0.0, str(e)
+            # Drop the view before the slot can be reused or closed.
+            del gray_frame
+            for barcode in barcodes:
+                barcode['rect'] = tuple(barcode['rect'])
+            # Backend and pyramid counters live in this process; the parent keeps the latest copy.
+            result_queue.put((seq, frame_id, slot_index, worker_id, barcodes, latency, error,
+                              decoder_stats(), dict(pyramid_stats)))
+    finally:
+        for shm in slots:
+            shm.close()
+
+
+class DecodePool:
+    """
+    Runs decode_full_frame() on a pool of worker processes.
+
+    Frames are copied once into preallocated shared memory slots and only the slot
+    index travels through the task queue, so no image data is pickled. Results are
+    delivered in submission order per stream and tagged with the caller's frame id, so
+    a slow frame from one camera never holds back the results of another.
+
+    A frame whose result does not arrive within `result_timeout` seconds after a worker
+    picked it up (e.g. a hung decode) is delivered as an error result so later frames
+    are not held back. Its slot stays reserved until the late result arrives or the
+    worker is known to be dead, because the worker may still be reading it. Dead workers
+    are restarted and the frame they held is delivered as an error.
+    """
+    def __init__(self, num_workers=None, num_slots=None, max_frame_shape=None,
+                 result_timeout=getattr(config, 'DECODE_RESULT_TIMEOUT', 5.0)):
+        self.num_workers = num_workers or getattr(config, 'DECODE_WORKERS', 0) or max(1, mp.cpu_count() - 1)
+        self.num_slots = num_slots or getattr(config, 'DECODE_SHM_SLOTS', self.num_workers * 2)
+        if max_frame_shape is None:
+            max_frame_shape = (getattr(config, 'DECODE_MAX_FRAME_HEIGHT', 1080),
+                               getattr(config, 'DECODE_MAX_FRAME_WIDTH', 1920))
+        self.slot_bytes = int(max_frame_shape[0]) * int(max_frame_shape[1])
+        self.result_timeout = result_timeout
+
+        self._slots = [shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+                       for _ in range(self.num_slots)]
+        self._free_slots = queue.Queue()
+        for index in range(self.num_slots):
+            self._free_slots.put(index)
+
+        ctx = mp.get_context('spawn')
+        self._task_queue = ctx.Queue()
+        self._result_queue = ctx.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._next_seq = 0
+        self._stream_next_seq = {}      # stream_id -> next per-stream sequence number
+        self._stream_next_deliver = {}  # stream_id -> per-stream sequence number to deliver next
+        self._reorder = {}              # (stream_id, stream_seq) -> DecodeResult waiting for earlier frames
+        self._submit_times = {}
+        self._expired = {}              # seq given up on -> its slot, reserved until the late result
+        self.frames_submitted = 0
+        self.frames_completed = 0
+        self.frames_rejected = 0
+        self.frames_lost = 0
+        self.workers_restarted = 0
+        self._worker_stats = [{'frames': 0, 'total_latency': 0.0, 'last_latency': 0.0, 'max_latency': 0.0}
+                              for _ in range(self.num_workers)]
+
+        self._ctx = ctx
+        self._current_tasks = ctx.RawArray('q', [-1] * self.num_workers)  # see _decode_worker()
+        self._task_started = ctx.RawArray('d', self.num_workers)
+        self._workers = [self._start_worker(worker_id) for worker_id in range(self.num_workers)]
+
+        self._stopping = False
+        self._running = True
+        self._collector = threading.Thread(target=self._collect_results, daemon=True)
+        self._collector.start()
+        print(f"Decode pool started: {self.num_workers} workers, {self.num_slots} shared memory slots "
+              f"of {self.slot_bytes // 1024} KiB.")
+
+    def _start_worker(self, worker_id):
+        self._current_tasks[worker_id] = -1
+        worker = self._ctx.Process(target=_decode_worker,
+                                   args=(worker_id, [shm.name for shm in self._slots],
+                                         self._task_queue, self._result_queue,
+                                         self._current_tasks, self._task_started),
+                                   daemon=True)
+        worker.start()
+        return worker
+
+    def submit(self, gray_frame, frame_id=None, timeout=0.0, roi=None, stream_id=None, scale=1.0):
+        """
+        Queues a grayscale frame for decoding.
+
+        Args:
+            gray_frame: 2D uint8 NumPy array.
+            frame_id: Identifier returned with the result. Defaults to the submission number.
+            timeout: Seconds to wait for a free slot. 0 means do not block.
+            roi: Optional (x, y, w, h) region. Only this crop is copied and decoded;
+                 result rects are still in full-frame coordinates.
+            stream_id: Camera the frame belongs to. Results keep submission order per stream.
+            scale: Working resolution; < 1.0 resizes the frame (or crop) straight into the
+                   slot. Result rects are mapped back to full resolution.
+
+        Returns:
+            The frame id, or None if every slot was busy (the frame is rejected and counted).
+        """
+        if roi is not None:
+            (x, y, w, h) = roi
+            gray_frame = gray_frame[y:y + h, x:x + w]
+        shape = gray_frame.shape
+        if scale != 1.0:
+            shape = (max(1, int(round(shape[0] * scale))), max(1, int(round(shape[1] * scale))))
+        if shape[0] * shape[1] > self.slot_bytes:
+            raise ValueError(f"Frame of {gray_frame.shape} does not fit in a {self.slot_bytes} byte decode slot; "
+                             f"raise DECODE_MAX_FRAME_WIDTH/HEIGHT in config.py")
+        try:
+            slot_index = self._free_slots.get(timeout=timeout) if timeout else self._free_slots.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.frames_rejected += 1
+            return None
+
+        target = np.ndarray(shape, dtype=np.uint8, buffer=self._slots[slot_index].buf)
+        if scale != 1.0:
+            cv2.resize(gray_frame, (shape[1], shape[0]), dst=target, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(target, gray_frame)
+        del target
+
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            if frame_id is None:
+                frame_id = seq
+            stream_seq = self._stream_next_seq.get(stream_id, 0)
+            self._stream_next_seq[stream_id] = stream_seq + 1
+            self._stream_next_deliver.setdefault(stream_id, 0)
+            self._submit_times[seq] = (time.perf_counter(), roi, stream_id, stream_seq, scale, slot_index, frame_id)
+            self.frames_submitted += 1
+        self._task_queue.put((seq, frame_id, slot_index, shape, roi is not None))
+        return frame_id
+
+    def _collect_results(self):
+        while self._running:
+            try:
+                item = self._result_queue.get(timeout=0.2)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+            self._check_workers()
+            seq, frame_id, slot_index, worker_id, barcodes, latency, error, backend_stats, worker_pyramid_stats = item
+            with self._lock:
+                if seq in self._expired:
+                    # Given up on already; the worker is done with the slot now.
+                    self._free_slots.put(self._expired.pop(seq))
+                    continue
+                if seq not in self._submit_times:
+                    # Its worker was found dead before this result was read; the frame
+                    # was delivered as lost and its slot freed then.
+                    continue
+                self._free_slots.put(slot_index)
+                submit_time, roi, stream_id, stream_seq, scale, _, _ = self._submit_times.pop(seq)
+                queue_time = time.perf_counter() - submit_time
+                scale_barcodes(barcodes, scale)
+                if roi is not None:
+                    offset_barcodes(barcodes, roi[0], roi[1])
+                stats = self._worker_stats[worker_id]
+                stats['frames'] += 1
+                stats['total_latency'] += latency
+                stats['last_latency'] = latency
+                stats['max_latency'] = max(stats['max_latency'], latency)
+                stats['decoders'] = backend_stats
+                stats['pyramid'] = worker_pyramid_stats
+                self.frames_completed += 1
+                self._reorder[(stream_id, stream_seq)] = DecodeResult(
+                    frame_id, barcodes, latency, worker_id, queue_time, roi, stream_id, error)
+                self._deliver_in_order(stream_id)
+
+    def _deliver_in_order(self, stream_id):
+        """Hands results out strictly in submission order within each stream. Call with the lock held."""
+        next_seq = self._stream_next_deliver[stream_id]
+        while (stream_id, next_seq) in self._reorder:
+            self._results.put(self._reorder.pop((stream_id, next_seq)))
+            next_seq += 1
+        self._stream_next_deliver[stream_id] = next_seq
+
+    def _check_workers(self):
+        """Restarts dead workers and gives up on frames whose decode is overdue."""
+        for worker_id, worker in enumerate(self._workers):
+            if not self._stopping and not worker.is_alive():
+                print(f"[ERROR] Decode worker {worker_id} died (exit code {worker.exitcode}); restarting it.")
+                seq = self._current_tasks[worker_id]
+                with self._lock:
+                    # Its result may have been sent already; then the frame is no longer pending.
+                    if seq in self._expired:
+                        self._free_slots.put(self._expired.pop(seq))
+                    elif seq in self._submit_times:
+                        self._free_slots.put(self._give_up(seq, 'decode worker died'))
+                self._workers[worker_id] = self._start_worker(worker_id)
+                self.workers_restarted += 1
+
+        now = time.monotonic()
+        with self._lock:
+            for worker_id in range(self.num_workers):
+                seq = self._current_tasks[worker_id]
+                started = self._task_started[worker_id]
+                # Re-reading the seq skips a worker that picked up its next frame meanwhile.
+                if (seq == self._current_tasks[worker_id] and seq in self._submit_times
+                        and now - started > self.result_timeout):
+                    print(f"[WARN] No decode result for frame {self._submit_times[seq][6]} "
+                          f"{self.result_timeout:.1f}s after worker {worker_id} picked it up; skipping it.")
+                    # The worker may still be reading the slot; it is freed with the late result.
+                    self._expired[seq] = self._give_up(seq, 'decode result timed out')
+
+    def _give_up(self, seq, error):
+        """
+        Delivers a frame that will not get a result as an empty error result. Call with
+        the lock held.
+
+        Returns:
+            The frame's slot index, which the caller frees when no worker can read it anymore.
+        """
+        submit_time, roi, stream_id, stream_seq, _, slot_index, frame_id = self._submit_times.pop(seq)
+        self.frames_completed += 1
+        self.frames_lost += 1
+        self._reorder[(stream_id, stream_seq)] = DecodeResult(
+            frame_id, [], 0.0, None, time.perf_counter() - submit_time, roi, stream_id, error=error)
+        self._deliver_in_order(stream_id)
+        return slot_index
+
+    def get_result(self, timeout=0.0):
+        """Returns the next DecodeResult in submission order, or None if none is ready."""
+        try:
+            if timeout:
+                return self._results.get(timeout=timeout)
+            return self._results.get_nowait()
+        except queue.Empty:
+            return None
+
+    def get_ready_results(self):
+        """Returns all DecodeResults that are ready now, oldest first."""
+        results = []
+        while True:
+            result = self.get_result()
+            if result is None:
+                return results
+            results.append(result)
+
+    def queue_depth(self):
+        """Number of frames submitted but not yet decoded."""
+        with self._lock:
+            return self.frames_submitted - self.frames_completed
+
+    def get_stats(self):
+        """Returns counters, queue depth and per-worker latency statistics."""
+        with self._lock:
+            workers = []
+            for worker_id, stats in enumerate(self._worker_stats):
+                frames = stats['frames']
+                workers.append({
+                    'worker_id': worker_id,
+                    'frames': frames,
+                    'avg_latency': stats['total_latency'] / frames if frames else 0.0,
+                    'last_latency': stats['last_latency'],
+                    'max_latency': stats['max_latency'],
+                })
+            return {
+                'workers': workers,
+                'queue_depth': self.frames_submitted - self.frames_completed,
+                'free_slots': self._free_slots.qsize(),
+                'frames_submitted': self.frames_submitted,
+                'frames_completed': self.frames_completed,
+                'frames_rejected': self.frames_rejected,
+                'frames_lost': self.frames_lost,
+                'workers_restarted': self.workers_restarted,
+                'decoders': merge_decoder_stats(stats.get('decoders', {}) for stats in self._worker_stats),
+                'pyramid': merge_pyramid_stats(stats.get('pyramid', {}) for stats in self._worker_stats),
+            }
+
+    def close(self):
+        """Stops the workers and frees the shared memory slots."""
+        if not self._running:
+            return
+        print("Stopping decode pool...")
+        self._stopping = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=2.0)
+            if worker.is_alive():
+                worker.terminate()
+        self._running = False
+        self._collector.join(timeout=1.0)
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,92 @@
+import threading
+
+
+class FairDecodeScheduler:
+    """
+    Shares one DecodePool between several camera streams.
+
+    Each stream has at most one frame waiting to be submitted; a newer frame from the
+    same camera replaces it, so a busy pool never decodes stale frames. Waiting frames
+    are handed to the pool round-robin, and no stream may have more than its share of
+    the pool's slots in flight, so a high-frame-rate camera cannot starve the others.
+    """
+    def __init__(self, decode_pool, stream_ids, max_in_flight_per_stream=None):
+        self.pool = decode_pool
+        self.stream_ids = list(stream_ids)
+        if max_in_flight_per_stream is None:
+            max_in_flight_per_stream = max(1, decode_pool.num_slots // max(1, len(self.stream_ids)))
+        self.max_in_flight_per_stream = max_in_flight_per_stream
+        self._lock = threading.Lock()
+        self._pending = {}                               # stream_id -> (gray_frame, roi, frame_id, release, scale)
+        self._in_flight = {s: 0 for s in self.stream_ids}
+        self._next_index = 0                             # Stream that is served first on the next dispatch
+        self._stats = {s: {'offered': 0, 'submitted': 0, 'superseded': 0, 'completed': 0}
+                       for s in self.stream_ids}
+
+    def offer(self, stream_id, gray_frame, roi=None, frame_id=None, release=None, scale=1.0):
+        """
+        Queues a frame of one stream for decoding, replacing that stream's waiting frame.
+
+        The frame must not be modified afterwards; it is copied into shared memory only
+        when it is dispatched. If the frame is a borrowed buffer, pass its `release`
+        callable: it is called once the frame was copied or replaced by a newer one.
+        """
+        with self._lock:
+            stats = self._stats[stream_id]
+            stats['offered'] += 1
+            replaced = self._pending.get(stream_id)
+            if replaced is not None:
+                stats['superseded'] += 1
+            self._pending[stream_id] = (gray_frame, roi, frame_id, release, scale)
+        if replaced is not None and replaced[3] is not None:
+            replaced[3]()
+
+    def dispatch(self):
+        """
+        Submits waiting frames to the pool, one stream at a time in rotating order,
+        until every stream is served, at its limit, or the pool has no free slot.
+
+        Returns:
+            Number of frames submitted.
+        """
+        submitted = 0
+        released = []
+        with self._lock:
+            count = len(self.stream_ids)
+            start = self._next_index
+            for offset in range(count):
+                stream_id = self.stream_ids[(start + offset) % count]
+                if stream_id not in self._pending or self._in_flight[stream_id] >= self.max_in_flight_per_stream:
+                    continue
+                gray_frame, roi, frame_id, release, scale = self._pending[stream_id]
+                if self.pool.submit(gray_frame, frame_id=frame_id, roi=roi, stream_id=stream_id, scale=scale) is None:
+                    # Pool is full; resume with this stream next time.
+                    self._next_index = (start + offset) % count
+                    break
+                del self._pending[stream_id]
+                if release is not None:
+                    released.append(release)
+                self._in_flight[stream_id] += 1
+                self._stats[stream_id]['submitted'] += 1
+                submitted += 1
+            else:
+                self._next_index = (start + 1) % count
+        # The frames are in shared memory now; hand the source buffers back.
+        for release in released:
+            release()
+        return submitted
+
+    def get_ready_results(self):
+        """Returns all finished DecodeResults (in order within each stream)."""
+        results = self.pool.get_ready_results()
+        with self._lock:
+            for result in results:
+                self._in_flight[result.stream_id] -= 1
+                self._stats[result.stream_id]['completed'] += 1
+        return results
+
+    def get_stats(self):
+        """Returns per-stream counters of offered, submitted, superseded and completed frames."""
+        with self._lock:
+            return {stream_id: dict(stats, in_flight=self._in_flight[stream_id])
+                    for stream_id, stats in self._stats.items()}
@@ -0,0 +1,206 @@
+import asyncio
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import config
+from barcode_processor import decode_full_frame
+
+
+class DecodeServiceBusy(Exception):
+    """Raised when no decode capacity became free within the queue timeout."""
+
+
+class ImageTooLarge(Exception):
+    """Raised when an uploaded image has more pixels than the service decodes."""
+
+
+# JPEG start-of-frame markers (all except DHT, JPG and DAC, which share the range)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def read_image_size(image_bytes):
+    """
+    Reads (width, height) from the header of a JPEG, PNG, BMP or WebP image without
+    decoding it, so a small file that expands to a huge bitmap can be refused first.
+
+    Returns:
+        tuple: (width, height), or None if the format is not one of these or the header is damaged.
+    """
+    data = bytes(image_bytes[:32])
+    try:
+        if data.startswith(b'\x89PNG\r\n\x1a\n') and data[12:16] == b'IHDR':
+            return struct.unpack('>II', data[16:24])
+        if data.startswith(b'BM'):
+            if struct.unpack('<I', data[14:18])[0] == 12:
+                return struct.unpack('<HH', data[18:22])
+            width, height = struct.unpack('<ii', data[18:26])
+            return abs(width), abs(height)  # A negative height means a top-down bitmap
+        if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+            chunk = data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = struct.unpack('<I', data[21:25])[0]
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return (int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1)
+            return None
+        if data.startswith(b'\xff\xd8'):
+            return _jpeg_size(image_bytes)
+    except struct.error:
+        return None
+    return None
+
+
+def _jpeg_size(image_bytes):
+    """Walks the JPEG segments up to the start-of-frame marker (metadata may be large)."""
+    data = memoryview(image_bytes)
+    index = 2
+    while index + 4 <= len(data):
+        if data[index] != 0xFF:
+            return None
+        marker = data[index + 1]
+        if marker == 0xFF:  # Fill byte
+            index += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+            index += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if index + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[index + 5:index + 9])
+            return width, height
+        if marker == 0xDA:  # Start of scan before any frame header
+            return None
+        index += 2 + struct.unpack('>H', data[index + 2:index + 4])[0]
+    return None
+
+
+def check_image_pixels(image_bytes, max_pixels):
+    """
+    Raises:
+        ImageTooLarge: If the image header declares more than `max_pixels` pixels.
+    """
+    size = read_image_size(image_bytes)
+    if size is not None and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Image of {size[0]}x{size[1]} pixels exceeds the limit of {max_pixels} pixels")
+
+
+def decode_image_bytes(image_bytes):
+    """
+    Decodes barcodes from an encoded image (JPEG, PNG, BMP or WebP) entirely in memory.
+
+    Other formats are refused without decoding, since their size cannot be checked first
+    (see check_image_pixels()).
+
+    Returns:
+        dict with 'ok', 'error', 'width', 'height', 'barcodes' and 'timings' (milliseconds).
+    """
+    start_time = time.perf_counter()
+    if read_image_size(image_bytes) is None:
+        return {'ok': False, 'error': 'Unsupported or damaged image (expected JPEG, PNG, BMP or WebP)',
+                'width': None, 'height': None, 'barcodes': [], 'timings': {'imdecode_ms': 0.0, 'scan_ms': 0.0}}
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    # The decoder only needs luminance, so let imdecode produce grayscale directly.
+    gray_frame = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+    imdecode_ms = (time.perf_counter() - start_time) * 1000
+    if gray_frame is None:
+        return {'ok': False, 'error': 'Could not decode image data', 'width': None, 'height': None,
+                'barcodes': [], 'timings': {'imdecode_ms': imdecode_ms, 'scan_ms': 0.0}}
+
+    barcodes, latency = decode_full_frame(gray_frame)
+    return {
+        'ok': True,
+        'error': None,
+        'width': int(gray_frame.shape[1]),
+        'height': int(gray_frame.shape[0]),
+        'barcodes': [{'data': b['data'], 'type': b['type'], 'rect': [int(v) for v in b['rect']]}
+                     for b in barcodes],
+        'timings': {'imdecode_ms': imdecode_ms, 'scan_ms': latency * 1000},
+    }
+
+
+class DecodeService:
+    """
+    Decodes uploaded images off the event loop with bounded concurrency.
+
+    Images run on a small dedicated thread pool (pyzbar and OpenCV release the GIL),
+    so the API can never use more than `max_workers` cores and starve the live
+    scanner. Requests that cannot get a slot within `queue_timeout` seconds fail
+    with DecodeServiceBusy instead of piling up, and requests with an image of more
+    than `max_pixels` pixels fail with ImageTooLarge before anything is decoded.
+    """
+    def __init__(self,
+                 max_workers=getattr(config, 'DECODE_API_WORKERS', 2),
+                 max_pending=getattr(config, 'DECODE_API_MAX_PENDING', 16),
+                 queue_timeout=getattr(config, 'DECODE_API_QUEUE_TIMEOUT', 5.0),
+                 max_pixels=getattr(config, 'DECODE_API_MAX_PIXELS', 40_000_000)):
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout
+        self.max_pixels = max_pixels
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='decode-api')
+        self._slots = None
+        self._max_pending = max_pending
+        self.images_decoded = 0
+        self.images_rejected = 0
+        self.images_too_large = 0
+
+    def _get_slots(self):
+        # Created lazily so the semaphore belongs to the server's running event loop.
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+        return self._slots
+
+    async def decode_images(self, images):
+        """
+        Decodes a list of encoded images.
+
+        Args:
+            images: List of bytes objects.
+
+        Returns:
+            List of result dicts from decode_image_bytes(), in input order.
+
+        Raises:
+            ImageTooLarge: If any image exceeds max_pixels (checked from the headers).
+            DecodeServiceBusy: If an image waited longer than queue_timeout for a slot.
+        """
+        try:
+            for image_bytes in images:
+                check_image_pixels(image_bytes, self.max_pixels)
+        except ImageTooLarge:
+            self.images_too_large += 1
+            raise
+        slots = self._get_slots()
+        loop = asyncio.get_running_loop()
+
+        async def decode_one(image_bytes):
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.images_rejected += 1
+                raise DecodeServiceBusy("Decode service is busy, try again later")
+            try:
+                return await loop.run_in_executor(self._executor, decode_image_bytes, image_bytes)
+            finally:
+                slots.release()
+
+        results = await asyncio.gather(*(decode_one(image) for image in images))
+        self.images_decoded += len(results)
+        return results
+
+    def get_stats(self):
+        return {
+            'workers': self.max_workers,
+            'images_decoded': self.images_decoded,
+            'images_rejected': self.images_rejected,
+            'images_too_large': self.images_too_large,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
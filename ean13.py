@@ -0,0 +1,47 @@
+# EAN-13 symbology tables and helpers shared by the synthetic test images and decoders.
+
+# 7-module patterns per digit (1 = bar, 0 = space)
+L_CODES = ['0001101', '0011001', '0010011', '0111101', '0100011',
+           '0110001', '0101111', '0111011', '0110111', '0001011']
+G_CODES = ['0100111', '0110011', '0011011', '0100001', '0011101',
+           '0111001', '0000101', '0010001', '0001001', '0010111']
+R_CODES = ['1110010', '1100110', '1101100', '1000010', '1011100',
+           '1001110', '1010000', '1000100', '1001000', '1110100']
+
+# The first digit is not drawn; it selects L/G parity for the six left-hand digits.
+PARITY_PATTERNS = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+                   'LGGLLG', 'LGGGLG', 'LGGLGL', 'LGLGLG', 'LGLGGL']
+
+START_GUARD = '101'
+CENTER_GUARD = '01010'
+END_GUARD = '101'
+TOTAL_MODULES = 95
+QUIET_ZONE_MODULES = 11  # Minimum blank margin on each side
+
+
+def checksum_digit(first12: str) -> int:
+    """Computes the EAN-13 check digit for the first 12 digits."""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(first12))
+    return (10 - total % 10) % 10
+
+
+def is_valid(code: str) -> bool:
+    """True if `code` is 13 digits with a correct check digit."""
+    return len(code) == 13 and code.isdigit() and checksum_digit(code[:12]) == int(code[12])
+
+
+def with_checksum(first12: str) -> str:
+    """Appends the check digit to a 12-digit string."""
+    return first12 + str(checksum_digit(first12))
+
+
+def encode_modules(code: str) -> str:
+    """
+    Returns the 95-module bar pattern (string of '0'/'1') for a 13-digit EAN-13 code.
+    """
+    if not is_valid(code):
+        raise ValueError(f"Not a valid EAN-13 code: {code}")
+    parity = PARITY_PATTERNS[int(code[0])]
+    left = ''.join((L_CODES if p == 'L' else G_CODES)[int(d)] for p, d in zip(parity, code[1:7]))
+    right = ''.join(R_CODES[int(d)] for d in code[7:13])
+    return START_GUARD + left + CENTER_GUARD + right + END_GUARD
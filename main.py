@@ -3,178 +3,353 @@
 import cv2
 import time
 import config
-import requests
+import json
+import signal
 import threading
-import queue
-import json # For creating the JSON string for Flutter
-import re   # For parsing price from string
+import metrics
 
-from camera_handler import CameraHandler
-from barcode_processor import process_barcodes
+from barcode_processor import decoder_stats, merge_pyramid_stats, process_barcodes_in_roi, pyramid_stats
+from decode_pool import DecodePool
+from decode_scheduler import FairDecodeScheduler
+from decode_governor import DecodeGovernor
+from scan_stream import open_streams
 from display_utils import draw_all_barcodes, draw_fps
 from db_handler import DBHandler
+from product_lookup import LookupResult, ProductLookupService
+from cart_delivery import CartDeliveryService
+from api_server import APIServerThread
+from preview import PreviewPublisher
+from models import ScanResultWebSocketMessage
 # from models import ScanResultPayload # We are NOT sending this complex payload to Flutter anymore
 
-# --- Global Queue for sending POST requests ---
-post_queue = queue.Queue()
+# --- Lookup result outputs (called from the lookup service, in scan order) ---
+def make_cart_sink(cart_delivery: CartDeliveryService):
+    """Returns a sink that logs lookup results and queues cart payloads for delivery."""
+    def queue_cart_payload(result: LookupResult):
+        level = 'INFO' if result.status in ('success', 'not_found') else 'WARN'
+        print(f"[{level}] [{result.stream_id}] {result.message}")
 
-# --- Worker Thread Function for Sending POST Requests (largely unchanged, ensure it sends raw JSON) ---
-def http_post_worker(post_queue: queue.Queue, target_url: str):
+        # Queue the simplified payload for Flutter if it was created
+        if result.payload_json and cart_delivery.enqueue(result.payload_json):
+            print(f"Queued for Flutter: {result.payload_json}")
+    return queue_cart_payload
+
+def make_websocket_sink(api_server: APIServerThread):
+    """Returns a sink that pushes lookup results to the WebSocket clients."""
+    def push_to_websockets(result: LookupResult):
+        message = ScanResultWebSocketMessage(
+            status=result.status,
+            message=result.message,
+            scanned_barcode=result.barcode_data,
+            product_details=result.product,
+            cart_item=json.loads(result.payload_json) if result.payload_json else None,
+            timestamp=result.scanned_at,
+            stream_id=result.stream_id,
+        )
+        api_server.broadcast(message)
+    return push_to_websockets
+
+# --- Per-frame detection handling ---
+def handle_detected_barcodes(detected_barcodes, debouncer, lookup_service, stream_id=None, roi=None):
     """
-    Worker thread function that continuously checks the queue for data
-    and sends it via HTTP POST.
+    Feeds one decoded frame into the camera's debouncer and hands the items that just
+    entered the scene to the lookup service, as one batch, without waiting for the result.
+
+    Returns:
+        List of barcodes that entered with this frame.
     """
-    print("HTTP POST worker thread started.")
-    while True:
-        payload_json_string = post_queue.get() # Expecting a JSON string directly
+    new_barcodes = debouncer.update(detected_barcodes, roi)
 
-        if payload_json_string is None:
-            print("HTTP POST worker thread received stop signal. Exiting.")
-            break
+    if new_barcodes:
+        print(f"[INFO] [{stream_id}] New barcode(s) detected: {', '.join(new_barcodes)}. Looking up...")
+        metrics.SCANS.inc(len(new_barcodes))
+        lookup_service.submit_many(new_barcodes, stream_id)
+    return new_barcodes
 
-        print(f"Worker thread received payload. Attempting to POST to {target_url}...")
-        try:
-            response = requests.post(
-                target_url,
-                data=payload_json_string, # Send the pre-formatted JSON string
-                headers={'Content-Type': 'application/json'},
-                timeout=getattr(config, 'POST_TIMEOUT', 10) # Add a default timeout
-            )
-            if 200 <= response.status_code < 300:
-                print(f"[INFO] POST request successful ({response.status_code}). Response: {response.json()}")
-            else:
-                print(f"[ERROR] POST request failed ({response.status_code}). Response: {response.text}")
-        except requests.exceptions.Timeout:
-             print(f"[ERROR] POST request to {target_url} timed out.")
-        except requests.exceptions.ConnectionError:
-            print(f"[ERROR] POST request to {target_url} failed: Connection Error.")
-        except requests.exceptions.RequestException as e:
-            print(f"[ERROR] An unexpected error occurred during POST request to {target_url}: {e}")
-        except Exception as e:
-            print(f"[ERROR] An unexpected error in POST worker: {e}")
+def on_barcodes_decoded(stream, barcodes, roi, lookup_service):
+    """Feeds one decode result of a camera into its ROI tracker and de-duplication."""
+    metrics.BARCODES_DETECTED.inc(len(barcodes))
+    if stream.roi_tracker:
+        stream.roi_tracker.update(barcodes, roi)
+    stream.last_decoded_barcodes = barcodes
+    handle_detected_barcodes(barcodes, stream.debouncer, lookup_service, stream.stream_id, roi)
+
+# --- Instrumentation ---
+def metrics_stage(stage, stage_start):
+    """Records the time since `stage_start` for a pipeline stage and returns the new start time."""
+    now = time.perf_counter()
+    metrics.STAGE_SECONDS.labels(stage).observe(now - stage_start)
+    return now
+
+def register_pipeline_metrics(streams, decode_pool, lookup_service, db_handler, cart_delivery, governor=None):
+    """Exposes queue depths and counters the components already keep, read at scrape time."""
+    metrics.register_callback('capture_frames_dropped_total', 'Captured frames overwritten before they were decoded',
+                              lambda: _per_stream(streams, lambda s: s.camera.get_capture_stats()['frames_dropped']),
+                              'counter')
+    metrics.register_callback('stream_frames_total', 'Frames taken from each camera by the scan loop',
+                              lambda: _per_stream(streams, lambda s: s.frames), 'counter')
+    metrics.register_callback('scan_detections_suppressed_total', 'Repeat detections absorbed by the scan debouncer',
+                              lambda: _per_stream(streams, lambda s: s.debouncer.detections_suppressed), 'counter')
+    if decode_pool is not None:
+        metrics.register_callback('decode_pool_queue_depth', 'Frames waiting in or being decoded by the pool',
+                                  decode_pool.queue_depth)
+        metrics.register_callback('decode_pool_frames_rejected_total', 'Frames skipped because all decode slots were busy',
+                                  lambda: decode_pool.get_stats()['frames_rejected'], 'counter')
+    # Decoder backends run in the pool's worker processes when there is a pool.
+    backend_stats = (lambda: decode_pool.get_stats()['decoders']) if decode_pool is not None else decoder_stats
+    metrics.register_callback('decoder_calls_total', 'Decode attempts per decoder backend',
+                              lambda: _per_backend(backend_stats(), 'calls'), 'counter')
+    metrics.register_callback('decoder_hits_total', 'Decode attempts that found a barcode, per decoder backend',
+                              lambda: _per_backend(backend_stats(), 'hits'), 'counter')
+    metrics.register_callback('decoder_seconds_total', 'Time spent in each decoder backend',
+                              lambda: _per_backend(backend_stats(), 'seconds'), 'counter')
+    if governor is not None:
+        metrics.register_callback('decode_governor_level', 'Decode quality level (0 = full quality)',
+                                  lambda: governor.level_index)
+        metrics.register_callback('decode_governor_mode', '1 for the decode quality level currently in use',
+                                  lambda: _governor_modes(governor))
+        metrics.register_callback('decode_latency_ewma_seconds', 'Moving average of the decode latency the governor sees',
+                                  lambda: governor.ewma_latency or 0.0)
+    metrics.register_callback('lookup_pending', 'Scans waiting for a product lookup result',
+                              lambda: lookup_service.get_stats()['pending'])
+    if db_handler.cache is not None:
+        metrics.register_callback('product_cache_requests_total', 'Product cache lookups by result',
+                                  lambda: _cache_results(db_handler.get_cache_stats()), 'counter')
+        metrics.register_callback('product_cache_evictions_total', 'Entries evicted from the product cache',
+                                  lambda: db_handler.get_cache_stats()['evictions'], 'counter')
+    metrics.register_callback('db_connected', '1 if MongoDB is reachable', lambda: int(db_handler.is_connected()))
+    metrics.register_callback('cart_delivery_backlog', 'Cart items queued or being posted',
+                              lambda: cart_delivery.get_stats()['backlog'])
+
+def _per_stream(streams, fn):
+    values = {'labelname': 'stream'}
+    for stream in streams:
+        values[stream.stream_id] = fn(stream)
+    return values
+
+def _per_backend(stats, key):
+    values = {'labelname': 'backend'}
+    for name, backend in stats.items():
+        values[name] = backend[key]
+    return values
+
+def _governor_modes(governor):
+    values = {'labelname': 'mode'}
+    for level in governor.levels:
+        values[level['name']] = int(level is governor.level)
+    return values
+
+def _cache_results(stats):
+    return {'labelname': 'result', 'hit': stats['hits'], 'negative_hit': stats['negative_hits'],
+            'stale_hit': stats['stale_hits'], 'miss': stats['misses']}
+
+# --- Shutdown ---
+def install_stop_handlers(stop_event):
+    """Makes SIGINT (Ctrl+C) and SIGTERM end the scan loop cleanly instead of killing it mid-frame."""
+    def request_stop(signum, frame):
+        print(f"[INFO] Received signal {signum}, stopping...")
+        stop_event.set()
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, request_stop)
 
 # --- Main Scanner Function ---
 def run_scanner():
+    headless = getattr(config, 'HEADLESS', False)
+    stop_event = threading.Event()
+    install_stop_handlers(stop_event)
+
     print("Starting barcode scanner application...")
-    print(f"Press '{chr(config.EXIT_KEY)}' to exit.")
+    if headless:
+        print("Running headless. Press Ctrl+C or send SIGTERM to exit.")
+    else:
+        print(f"Press '{chr(config.EXIT_KEY)}' to exit.")
     print(f"Scanned product data will be POSTed to: {config.TARGET_POST_URL}")
 
-    post_worker_thread = threading.Thread(
-        target=http_post_worker,
-        args=(post_queue, config.TARGET_POST_URL),
-        daemon=True
-    )
-    post_worker_thread.start()
-    print("Background HTTP POST worker thread started.")
+    cart_delivery = CartDeliveryService()
+    cart_delivery.start()
 
+    # One database connection pool and product cache, shared by all cameras.
     db_handler = DBHandler()
-    db_connected = db_handler.is_connected()
-    if not db_connected:
-        print("Warning: Database not connected.")
+    if not db_handler.is_connected():
+        print("Warning: Database not connected. Lookups resume automatically when it comes back.")
+
+    # Product resolution runs off the video loop; results go to the cart and the WebSocket clients.
+    lookup_service = ProductLookupService(db_handler, sinks=[make_cart_sink(cart_delivery)])
+    preview = None
+    if getattr(config, 'API_SERVER_ENABLED', False):
+        if getattr(config, 'PREVIEW_ENABLED', False):
+            preview = PreviewPublisher()
+            print(f"Preview snapshots on http://{config.API_HOST}:{config.API_PORT}/preview.jpg")
+        api_server = APIServerThread(db_handler, preview)
+        api_server.daemon = True
+        api_server.start()
+        lookup_service.add_sink(make_websocket_sink(api_server))
 
-    camera = CameraHandler()
-    if not camera.is_opened():
+    # Headless units never need color: capture luminance only, straight from YUYV where possible.
+    streams = open_streams(gray_only=headless and getattr(config, 'CAPTURE_GRAYSCALE_WHEN_HEADLESS', True))
+    if not streams:
         print("Failed to open camera. Exiting.")
+        lookup_service.close()
         db_handler.close()
+        cart_delivery.stop()
         return
+    multi_camera = len(streams) > 1
+    streams_by_id = {stream.stream_id: stream for stream in streams}
+
+    # Several cameras are always captured in the background, so a slow camera cannot
+    # hold up the others. One event wakes the loop when any of them has a new frame.
+    frame_ready = threading.Event()
+    if multi_camera or getattr(config, 'CAPTURE_THREADED', False):
+        for stream in streams:
+            stream.start_capture(frame_ready)
+    wait_for_frames = all(stream.threaded for stream in streams)
 
-    last_time = time.perf_counter()
-    frame_count = 0
-    display_fps = 0
-    last_scanned_barcode_data = None
+    # All cameras share one decode pool; the scheduler keeps it fair between them.
+    decode_pool = None
+    scheduler = None
+    decode_workers = getattr(config, 'DECODE_WORKERS', 0)
+    if decode_workers > 0 or multi_camera:
+        if decode_workers == 0:
+            print(f"[INFO] {len(streams)} cameras configured; decoding on a worker pool sized to the CPU count.")
+        decode_pool = DecodePool(num_workers=decode_workers or None)
+        scheduler = FairDecodeScheduler(decode_pool, list(streams_by_id))
 
-    print("Starting video stream...")
-    while True:
-        ret, frame = camera.read_frame()
-        if not ret:
+    # One governor for all cameras: they share the CPU the latency budget depends on.
+    governor = DecodeGovernor() if getattr(config, 'GOVERNOR_ENABLED', False) else None
+    if governor is not None:
+        print(f"[INFO] Decode governor holding a {governor.budget * 1000:.0f} ms latency budget.")
+
+    register_pipeline_metrics(streams, decode_pool, lookup_service, db_handler, cart_delivery, governor)
+
+    print(f"Starting video stream ({', '.join(streams_by_id)})...")
+    while not stop_event.is_set():
+        active_streams = [stream for stream in streams if not stream.ended]
+        if not active_streams:
             break
+        if wait_for_frames:
+            frame_ready.wait(timeout=0.1)
+            frame_ready.clear()
+
+        fresh_frames = []
+        for stream in active_streams:
+            stage_start = time.perf_counter()
+            frame, frame_lease, gray_frame, gray_holder = stream.grab(timeout=0.0 if wait_for_frames else 1.0)
+            if gray_frame is None:
+                continue
+            stage_start = metrics_stage('capture', stage_start)
+            display_frame = preview_frame = preview_scale = None
+            if not headless:
+                # Leased frames go back to the capture ring; directly read frames are ours to draw on.
+                display_frame = stream.display_copy(frame) if frame_lease is not None else frame
+            if preview is not None:
+                preview_frame, preview_scale = preview.capture(frame if frame is not None else gray_frame,
+                                                               stream.stream_id)
+            if frame_lease is not None:
+                frame_lease.release()
+            metrics.FRAMES.inc()
+            stage_start = metrics_stage('convert', stage_start)
+
+            # The governor is only asked about frames the gate wants, and a frame it thins out
+            # leaves the gate's state alone, so the motion is still decoded on a later frame.
+            allow_decode = (lambda: governor.allow_decode(stream.stream_id)) if governor is not None else None
+            if stream.motion_gate:
+                should_decode, roi = stream.motion_gate.check(gray_frame, allow_decode=allow_decode)
+            else:
+                should_decode, roi = (allow_decode() if allow_decode else True), None
+            scale = 1.0
+            if should_decode and governor is not None:
+                scale = governor.scale
+                if stream.roi_tracker:
+                    stream.roi_tracker.padding_scale = governor.roi_padding
+            if should_decode and stream.roi_tracker:
+                # A tracked barcode position is more precise than the changed region, and the
+                # tracker's periodic and after-miss full scans must not be narrowed to it.
+                roi = stream.roi_tracker.next_roi(gray_frame.shape, motion_roi=roi)
+            if should_decode:
+                metrics.FRAMES_DECODED.inc()
+            else:
+                metrics.FRAMES_SKIPPED.inc()
+            stage_start = metrics_stage('gate', stage_start)
+
+            if should_decode and scheduler is not None:
+                # Pipelined decode: the newest frame of each camera waits for a pool slot and
+                # keeps its buffer until it was copied into shared memory.
+                scheduler.offer(stream.stream_id, gray_frame, roi, release=gray_holder.release, scale=scale)
+            else:
+                if should_decode:
+                    barcodes, latency = process_barcodes_in_roi(gray_frame, roi, scale)
+                    if governor is not None:
+                        governor.observe(latency)
+                    on_barcodes_decoded(stream, barcodes, roi, lookup_service)
+                    metrics_stage('decode', stage_start)
+                gray_holder.release()
+            fresh_frames.append((stream, display_frame, preview_frame, preview_scale))
+
+        if scheduler is not None:
+            stage_start = time.perf_counter()
+            scheduler.dispatch()
+            for result in scheduler.get_ready_results():
+                if governor is not None:
+                    # Time from submission to result, so pool backlog counts against the budget too.
+                    governor.observe(result.queue_time)
+                on_barcodes_decoded(streams_by_id[result.stream_id], result.barcodes, result.roi, lookup_service)
+            metrics_stage('decode', stage_start)
 
-        display_frame = frame.copy()
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        detected_barcodes, latency = process_barcodes(gray_frame)
-        current_scanned_barcode_data = None
-
-        if detected_barcodes:
-            first_barcode = detected_barcodes[0]
-            current_scanned_barcode_data = first_barcode['data']
-
-            if current_scanned_barcode_data != last_scanned_barcode_data:
-                print(f"[INFO] New barcode detected: {current_scanned_barcode_data}. Looking up...")
-
-                flutter_payload_json = None # Initialize to None
-
-                if db_connected:
-                    product_details_from_db = db_handler.get_product_by_barcode(current_scanned_barcode_data)
-                    if product_details_from_db:
-                        product_name = product_details_from_db.get('ten_san_pham') or product_details_from_db.get('ten') # Adjust field name as per your DB
-                        price_str = product_details_from_db.get('gia_ban') or product_details_from_db.get('gia') # Adjust field name
-
-                        if product_name and price_str:
-                            try:
-                                # Attempt to parse price (e.g., "30,000 VND" or "30000")
-                                price_match = re.search(r'([\d,]+(?:\.\d+)?)', str(price_str))
-                                if price_match:
-                                    numeric_price_str = price_match.group(1).replace(',', '')
-                                    numeric_price = float(numeric_price_str) # Use float for price
-
-                                    # Prepare the SIMPLIFIED payload for Flutter
-                                    flutter_payload_dict = {
-                                        "name": product_name,
-                                        "price": numeric_price,
-                                        "quantity": 1 # Default quantity to 1
-                                    }
-                                    flutter_payload_json = json.dumps(flutter_payload_dict)
-                                    print(f"[INFO] Product for Flutter: {product_name}, Price: {numeric_price}")
-                                else:
-                                    print(f"[WARN] Could not parse price from '{price_str}' for '{product_name}'.")
-
-                            except ValueError as e:
-                                print(f"[WARN] Error parsing price for '{product_name}': {e}")
-                            except Exception as e:
-                                print(f"[ERROR] Unexpected error preparing Flutter payload: {e}")
-                        else:
-                            print(f"[WARN] Product '{current_scanned_barcode_data}' found in DB but missing 'name' or 'price' for Flutter.")
-                    else:
-                        print(f"[INFO] Barcode '{current_scanned_barcode_data}' not found in DB.")
-                else:
-                     print(f"[WARN] Barcode '{current_scanned_barcode_data}' detected, but DB not connected.")
-
-                # Queue the simplified payload for Flutter if it was created
-                if flutter_payload_json:
-                    try:
-                        post_queue.put_nowait(flutter_payload_json)
-                        print(f"Queued for Flutter: {flutter_payload_json}")
-                    except queue.Full:
-                        print("[WARN] POST queue is full. Dropping payload.")
-                    except Exception as e:
-                         print(f"[ERROR] An unexpected error occurred during queuing for Flutter: {e}")
-
-                last_scanned_barcode_data = current_scanned_barcode_data
-        else:
-             last_scanned_barcode_data = None
-
-        draw_all_barcodes(display_frame, detected_barcodes)
-        frame_count += 1
-        current_time = time.perf_counter()
-        elapsed_time = current_time - last_time
-        if elapsed_time >= 1.0:
-            display_fps = frame_count / elapsed_time
-            frame_count = 0
-            last_time = current_time
-        draw_fps(display_frame, display_fps)
-        cv2.imshow(config.WINDOW_NAME, display_frame)
+        stage_start = time.perf_counter()
+        for stream, display_frame, preview_frame, preview_scale in fresh_frames:
+            # Skipped frames show an unchanged scene, so the last boxes are still valid.
+            detected_barcodes = stream.last_decoded_barcodes
+            if preview_frame is not None:
+                preview.publish(preview_frame, preview_scale, detected_barcodes, stream.stream_id)
+            if display_frame is not None:
+                draw_all_barcodes(display_frame, detected_barcodes)
+                draw_fps(display_frame, stream.tick_fps())
+                cv2.imshow(stream.window_name, display_frame)
+        if headless:
+            continue
 
         key = cv2.waitKey(1) & 0xFF
+        metrics_stage('display', stage_start)
         if key == config.EXIT_KEY:
             break
 
-    camera.release()
-    cv2.destroyAllWindows()
+    for stream in streams:
+        stream.print_stats(f"[{stream.stream_id}] " if multi_camera else '')
+    # With a pool the pyramid decodes run in the workers; count those and any inline decodes.
+    pyramid = merge_pyramid_stats([pyramid_stats] + ([decode_pool.get_stats()['pyramid']] if decode_pool else []))
+    if pyramid['frames']:
+        print(f"Pyramid stats: {pyramid['candidates_tried']} candidates tried over "
+              f"{pyramid['frames']} frames, {pyramid['candidates_decoded']} decoded.")
+    backends = decode_pool.get_stats()['decoders'] if decode_pool is not None else decoder_stats()
+    for name, stats in backends.items():
+        print(f"Decoder '{name}': {stats['hits']}/{stats['calls']} hits ({stats['hit_rate']:.0%}), "
+              f"{stats['complete']} frames settled without the next backend, {stats['avg_ms']:.2f} ms per call.")
+    if scheduler is not None and multi_camera:
+        print(f"Decode scheduler stats: {scheduler.get_stats()}")
+    if governor is not None:
+        stats = governor.get_stats()
+        print(f"Decode governor stats: ended in mode '{stats['mode']}' after {stats['level_changes']} level "
+              f"change(s), {stats['frames_thinned']} frames thinned out.")
+    if decode_pool is not None:
+        stats = decode_pool.get_stats()
+        print(f"Decode pool stats: {stats['frames_completed']} frames decoded, "
+              f"{stats['frames_rejected']} skipped while all workers were busy.")
+        decode_pool.close()
+    for stream in streams:
+        stream.release()
+    if not headless:
+        cv2.destroyAllWindows()
+    # Let lookups that are still in flight reach the cart before shutting down.
+    lookup_service.close()
+    cache_stats = db_handler.get_cache_stats()
+    if cache_stats:
+        print(f"Product cache stats: {cache_stats}")
     db_handler.close()
-    print("Signaling POST worker thread to stop...")
-    post_queue.put(None)
-    # post_worker_thread.join() # Wait for worker if not daemon or for graceful shutdown
+    print("Stopping cart delivery...")
+    cart_delivery.stop()
+    print(f"Cart delivery stats: {cart_delivery.get_stats()}")
     print("Application terminated.")
 
 if __name__ == "__main__":
-    run_scanner()
\ No newline at end of file
+    run_scanner()
@@ -0,0 +1,293 @@
+# Lightweight Prometheus-style instrumentation for the scanner pipeline.
+#
+# Metrics are module-level objects that other modules import and update. With
+# config.METRICS_ENABLED = False every factory returns a shared no-op object, so
+# instrumented code costs one attribute lookup and an empty call.
+
+import threading
+import time
+
+import config
+
+ENABLED = getattr(config, 'METRICS_ENABLED', True)
+
+# Latency buckets in seconds, from sub-millisecond decode crops up to slow HTTP calls.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []           # Metric families in registration order
+_callbacks = []          # (name, type, help, fn) evaluated at scrape time
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return '{' + inner + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _NoopMetric:
+    """Stands in for every metric type while metrics are disabled."""
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return _NOOP_TIMER
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopMetric()
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _Family:
+    """A named metric with optional labels; each label combination is a child."""
+    type_name = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+
+    def labels(self, *values, **kwargs):
+        """Returns the child for one combination of label values."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self):
+        if not self.labelnames:
+            yield (), self._default
+        for key, child in list(self._children.items()):
+            yield tuple(zip(self.labelnames, key)), child
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} {self.type_name}")
+        for labels, child in self._samples():
+            child.render(self.name, labels, lines)
+
+    # Unlabelled families forward to their single child.
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def render(self, name, labels, lines):
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(self._value)}")
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self._value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for index, bound in enumerate(self._buckets):
+                if value <= bound:
+                    self._counts[index] += 1
+                    break
+
+    def time(self):
+        """Context manager that observes the duration of the block."""
+        return _Timer(self)
+
+    def render(self, name, labels, lines):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = 0
+        for bound, bucket_count in zip(self._buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(float(bound))),))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+
+class Counter(_Family):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Family):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Family):
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def counter(name, help_text, labelnames=()):
+    """Creates a monotonically increasing counter (or a no-op when disabled)."""
+    return _register(Counter(name, help_text, labelnames)) if ENABLED else _NOOP
+
+
+def gauge(name, help_text, labelnames=()):
+    """Creates a gauge that can go up and down (or a no-op when disabled)."""
+    return _register(Gauge(name, help_text, labelnames)) if ENABLED else _NOOP
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Creates a latency histogram in seconds (or a no-op when disabled)."""
+    return _register(Histogram(name, help_text, labelnames, buckets)) if ENABLED else _NOOP
+
+
+def register_callback(name, help_text, fn, type_name='gauge'):
+    """
+    Registers a value that is read only when /metrics is scraped, e.g. a queue depth
+    or counters another component already keeps. `fn` returns a number, or a dict of
+    {label_value: number} plus a 'labelname' key naming the label.
+    """
+    if ENABLED:
+        with _registry_lock:
+            _callbacks[:] = [c for c in _callbacks if c[0] != name]
+            _callbacks.append((name, type_name, help_text, fn))
+
+
+def render_text():
+    """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _registry_lock:
+        families = list(_registry)
+        callbacks = list(_callbacks)
+    for family in families:
+        family.render(lines)
+    for name, type_name, help_text, fn in callbacks:
+        try:
+            value = fn()
+        except Exception as e:
+            lines.append(f"# {name} unavailable: {e}")
+            continue
+        if value is None:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {type_name}")
+        if isinstance(value, dict):
+            labelname = value.get('labelname', 'name')
+            for label_value, sample in value.items():
+                if label_value == 'labelname':
+                    continue
+                lines.append(f"{name}{_format_labels(((labelname, label_value),))} {_format_value(sample)}")
+        else:
+            lines.append(f"{name} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# --- Pipeline metrics ---
+
+STAGE_SECONDS = histogram('scanner_stage_seconds',
+                          'Time spent per pipeline stage (capture, convert, gate, decode, display, lookup, post)',
+                          ['stage'])
+FRAMES = counter('scanner_frames_total', 'Frames taken from the camera by the scan loop')
+FRAMES_DECODED = counter('scanner_frames_decoded_total', 'Frames handed to the decoder')
+FRAMES_SKIPPED = counter('scanner_frames_skipped_total', 'Frames skipped by the motion gate')
+BARCODES_DETECTED = counter('scanner_barcodes_detected_total', 'Barcodes found by the decoder (before de-duplication)')
+SCANS = counter('scanner_scans_total', 'New scans handed to product lookup')
+LOOKUPS = counter('scanner_lookups_total', 'Product lookup results by status', ['status'])
+POSTS = counter('cart_posts_total', 'Cart POST attempts by outcome', ['outcome'])
+DELIVERY_SECONDS = histogram('cart_delivery_seconds', 'Time from queuing a cart item until the server accepted it')
+CART_DROPPED = counter('cart_items_dropped_total', 'Cart items dropped because the delivery queue was full')
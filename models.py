@@ -18,4 +18,35 @@ class ScanResultPayload(BaseModel):
     status: str # "success", "not_found", "db_error"
     message: str
     scanned_barcode: str # The barcode that was scanned
-    product_details: Optional[Product] = None # The product data from DB (matches Product model)
\ No newline at end of file
+    product_details: Optional[Product] = None # The product data from DB (matches Product model)
+
+# Define Pydantic model for the scan results pushed to WebSocket clients
+class ScanResultWebSocketMessage(BaseModel):
+    status: str # "success", "not_found", "invalid_product", "db_error"
+    message: str
+    scanned_barcode: str
+    product_details: Optional[Dict[str, Any]] = None # Raw product document from DB
+    cart_item: Optional[Dict[str, Any]] = None # The payload that was sent to the cart
+    timestamp: float # Unix time of the scan
+    stream_id: Optional[str] = None # Camera that saw the item
+
+# Define Pydantic models for the /decode endpoints
+class DecodedBarcode(BaseModel):
+    data: str
+    type: str
+    rect: List[int] # [x, y, width, height] in image coordinates
+    product_details: Optional[Dict[str, Any]] = None # Only when a product lookup was requested
+
+class ImageDecodeResult(BaseModel):
+    filename: Optional[str] = None
+    ok: bool # False if the image could not be decoded
+    error: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    barcodes: List[DecodedBarcode] = []
+    timings: Dict[str, float] = {} # imdecode_ms, scan_ms
+
+class DecodeResponse(BaseModel):
+    results: List[ImageDecodeResult] # One entry per uploaded image, in upload order
+    lookup_ms: Optional[float] = None # Time spent resolving products, if requested
+    total_ms: float
\ No newline at end of file
@@ -0,0 +1,123 @@
+import time
+
+import cv2
+import numpy as np
+import config
+
+
+class MotionGate:
+    """
+    Cheap change detector that decides whether a frame is worth decoding.
+
+    Each frame is shrunk to a small thumbnail and compared with the thumbnail of the
+    last decoded frame. If the scene has not changed the decode is skipped; if it has,
+    the bounding box of the changed cells is returned so the decoder can focus there.
+    For a few frames after a change the gate keeps decoding even when the scene is
+    still, so an item that was put down and held steady is not missed.
+    """
+    def __init__(self,
+                 thumb_size=getattr(config, 'MOTION_THUMB_SIZE', (80, 60)),
+                 pixel_threshold=getattr(config, 'MOTION_PIXEL_THRESHOLD', 18),
+                 min_changed_ratio=getattr(config, 'MOTION_MIN_CHANGED_RATIO', 0.005),
+                 hold_frames=getattr(config, 'MOTION_HOLD_FRAMES', 10),
+                 refresh_interval=getattr(config, 'MOTION_REFRESH_INTERVAL', 2.0),
+                 roi_padding_px=getattr(config, 'MOTION_ROI_PADDING_PX', 32)):
+        self.thumb_size = thumb_size  # (width, height)
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio
+        self.hold_frames = hold_frames
+        self.refresh_interval = refresh_interval
+        self.roi_padding_px = roi_padding_px
+        self._reference = None
+        self._thumb = np.empty((thumb_size[1], thumb_size[0]), dtype=np.uint8)
+        self._diff = np.empty_like(self._thumb)   # Reused every frame
+        self._mask = np.empty_like(self._thumb)
+        self._hold_remaining = 0
+        self._hold_roi = None
+        self._last_decode_time = 0.0
+        self.frames_skipped = 0
+        self.frames_decoded = 0
+
+    def check(self, gray_frame, allow_decode=None):
+        """
+        Decides whether to decode this frame.
+
+        Args:
+            gray_frame: Full-resolution grayscale frame.
+            allow_decode: Optional callable asked only when the gate wants to decode (e.g. the
+                decode governor thinning frames). If it returns False the frame is skipped and
+                the gate's state (reference, hold counter, refresh timer) is left untouched, so
+                the change is still decoded on a later frame.
+
+        Returns:
+            tuple: (should_decode, roi)
+                should_decode: False if the scene is unchanged and the decode can be skipped.
+                roi: (x, y, w, h) around the changed area, or None to decode the full frame.
+        """
+        cv2.resize(gray_frame, self.thumb_size, dst=self._thumb, interpolation=cv2.INTER_AREA)
+        now = time.perf_counter()
+
+        if self._reference is None:
+            return self._decode(now, None) if self._allowed(allow_decode) else self._skip()
+
+        cv2.absdiff(self._thumb, self._reference, dst=self._diff)
+        cv2.threshold(self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self._mask)
+        if cv2.countNonZero(self._mask) >= self.min_changed_ratio * self._mask.size:
+            if not self._allowed(allow_decode):
+                return self._skip()
+            roi = self._changed_region(self._mask, gray_frame.shape)
+            self._hold_remaining = self.hold_frames
+            self._hold_roi = roi
+            return self._decode(now, roi)
+
+        if self._hold_remaining > 0:
+            if not self._allowed(allow_decode):
+                return self._skip()
+            self._hold_remaining -= 1
+            return self._decode(now, self._hold_roi)
+
+        # Decode now and then anyway, e.g. to catch slow lighting drift.
+        if now - self._last_decode_time >= self.refresh_interval:
+            return self._decode(now, None) if self._allowed(allow_decode) else self._skip()
+
+        return self._skip()
+
+    @staticmethod
+    def _allowed(allow_decode):
+        return allow_decode is None or allow_decode()
+
+    def _skip(self):
+        self.frames_skipped += 1
+        return False, None
+
+    def _decode(self, now, roi):
+        # The reference is the last frame that was actually decoded.
+        if self._reference is None:
+            self._reference = self._thumb.copy()
+        else:
+            np.copyto(self._reference, self._thumb)
+        self._last_decode_time = now
+        self.frames_decoded += 1
+        return True, roi
+
+    def _changed_region(self, diff, frame_shape):
+        """Scales the bounding box of the changed thumbnail cells back to frame coordinates."""
+        frame_h, frame_w = frame_shape[:2]
+        rows = np.flatnonzero(diff.any(axis=1))
+        cols = np.flatnonzero(diff.any(axis=0))
+        scale_x = frame_w / diff.shape[1]
+        scale_y = frame_h / diff.shape[0]
+        x0 = max(0, int(cols[0] * scale_x) - self.roi_padding_px)
+        y0 = max(0, int(rows[0] * scale_y) - self.roi_padding_px)
+        x1 = min(frame_w, int((cols[-1] + 1) * scale_x) + self.roi_padding_px)
+        y1 = min(frame_h, int((rows[-1] + 1) * scale_y) + self.roi_padding_px)
+        if (x1 - x0) * (y1 - y0) >= getattr(config, 'ROI_MAX_AREA_RATIO', 0.6) * frame_w * frame_h:
+            return None
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def get_stats(self):
+        """Returns the number of skipped and decoded frames."""
+        return {
+            'frames_skipped': self.frames_skipped,
+            'frames_decoded': self.frames_decoded,
+        }
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import cv2
+
+import config
+from display_utils import draw_all_barcodes
+
+
+class PreviewPublisher:
+    """
+    Keeps an occasional, downscaled JPEG snapshot of the camera view for remote debugging.
+
+    The scan loop calls capture() on every frame; it returns a small copy of the frame only
+    when the next preview of that camera is due, so most frames cost nothing. publish()
+    draws the barcode boxes on that copy and encodes it. The API serves the latest JPEG
+    per camera from get_jpeg().
+    """
+    def __init__(self,
+                 interval=getattr(config, 'PREVIEW_INTERVAL', 1.0),
+                 max_width=getattr(config, 'PREVIEW_MAX_WIDTH', 320),
+                 jpeg_quality=getattr(config, 'PREVIEW_JPEG_QUALITY', 70)):
+        self.interval = interval
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        self._jpegs = {}        # stream_id -> (jpeg_bytes, unix_timestamp)
+        self._next_due = {}     # stream_id -> time.monotonic() of the next snapshot
+        self.previews_published = 0
+
+    def capture(self, frame, stream_id=None):
+        """
+        Returns a downscaled copy of `frame` if a preview of `stream_id` is due, otherwise None.
+
+        Returns:
+            tuple: (small_frame, scale) or (None, None)
+        """
+        now = time.monotonic()
+        if now < self._next_due.get(stream_id, 0.0):
+            return None, None
+        self._next_due[stream_id] = now + self.interval
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.max_width / w)
+        if scale < 1.0:
+            small = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()
+        return small, scale
+
+    def publish(self, small_frame, scale, barcodes, stream_id=None):
+        """Draws `barcodes` (full-frame coordinates) onto the preview and stores it as JPEG."""
+        scaled = []
+        for barcode in barcodes:
+            x, y, w, h = barcode['rect']
+            scaled.append({**barcode, 'rect': (int(x * scale), int(y * scale), int(w * scale), int(h * scale))})
+        draw_all_barcodes(small_frame, scaled)
+        ok, encoded = cv2.imencode('.jpg', small_frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            print("[WARN] Could not encode preview frame.")
+            return
+        with self._lock:
+            self._jpegs[stream_id] = (encoded.tobytes(), time.time())
+            self.previews_published += 1
+
+    def get_jpeg(self, stream_id=None):
+        """
+        Args:
+            stream_id: Camera to return; None returns the first camera that has a preview.
+
+        Returns:
+            tuple: (jpeg_bytes, unix_timestamp) of the latest preview, or (None, None).
+        """
+        with self._lock:
+            if stream_id is None:
+                return next(iter(self._jpegs.values()), (None, None))
+            return self._jpegs.get(stream_id, (None, None))
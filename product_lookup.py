@@ -0,0 +1,206 @@
+import collections
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+
+# Matches prices like "30,000 VND", "30000" or "12.5"
+PRICE_PATTERN = re.compile(r'([\d,]+(?:\.\d+)?)')
+
+
+def build_cart_payload(barcode_data, product):
+    """
+    Builds the simplified JSON payload the Flutter cart expects from a product document.
+
+    Args:
+        barcode_data: The scanned barcode (used for log messages).
+        product: Product document from the database.
+
+    Returns:
+        tuple: (payload_json, message)
+            payload_json: JSON string for the cart, or None if the product has no usable name/price.
+            message: Human-readable description of the outcome.
+    """
+    product_name = product.get('ten_san_pham') or product.get('ten') # Adjust field name as per your DB
+    price_str = product.get('gia_ban') or product.get('gia') # Adjust field name
+
+    if not (product_name and price_str):
+        return None, f"Product '{barcode_data}' found in DB but missing 'name' or 'price' for Flutter."
+
+    try:
+        # Attempt to parse price (e.g., "30,000 VND" or "30000")
+        price_match = PRICE_PATTERN.search(str(price_str))
+        if not price_match:
+            return None, f"Could not parse price from '{price_str}' for '{product_name}'."
+        numeric_price = float(price_match.group(1).replace(',', '')) # Use float for price
+    except ValueError as e:
+        return None, f"Error parsing price for '{product_name}': {e}"
+
+    # Prepare the SIMPLIFIED payload for Flutter
+    flutter_payload_dict = {
+        "name": product_name,
+        "price": numeric_price,
+        "quantity": 1 # Default quantity to 1
+    }
+    return json.dumps(flutter_payload_dict), f"Product for Flutter: {product_name}, Price: {numeric_price}"
+
+
+class LookupResult:
+    """Outcome of resolving one scan."""
+    def __init__(self, seq, barcode_data, status, message, product=None, payload_json=None, scanned_at=None,
+                 stream_id=None):
+        self.seq = seq                    # Scan order, results are delivered in this order
+        self.barcode_data = barcode_data
+        self.stream_id = stream_id        # Camera that saw the barcode
+        self.status = status              # "success", "not_found", "invalid_product" or "db_error"
+        self.message = message
+        self.product = product            # Product document, if found
+        self.payload_json = payload_json  # Cart payload, if the product could be priced
+        self.scanned_at = scanned_at      # time.time() when the scan was submitted
+        self.lookup_time = 0.0            # Seconds from submit() until the result was ready
+
+
+class ProductLookupService:
+    """
+    Resolves scanned barcodes into cart payloads on a thread pool, so the video loop
+    never waits on the database.
+
+    Results are handed to the sinks (callables taking a LookupResult) strictly in scan
+    order, always on a pool thread, never on the thread that submitted the scan. Scans
+    of a barcode whose lookup is still in flight share that lookup instead of issuing
+    another query.
+    """
+    def __init__(self, db_handler, sinks=(), max_workers=getattr(config, 'LOOKUP_WORKERS', 4)):
+        self.db_handler = db_handler
+        self.sinks = list(sinks)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lookup')
+        self._lock = threading.Lock()
+        self._in_flight = {}      # barcode -> scans waiting for its lookup: (seq, stream_id, scanned_at, submitted)
+        self._reorder = {}        # seq -> LookupResult waiting for earlier scans
+        self._next_seq = 0
+        self._next_deliver_seq = 0
+        self._ready = collections.deque()  # Results in scan order, waiting for the sinks
+        self._delivering = False            # True while a thread is calling the sinks
+        self.lookups_started = 0
+        self.lookups_coalesced = 0
+
+    def add_sink(self, sink):
+        """Registers another callable that receives every LookupResult."""
+        self.sinks.append(sink)
+
+    def submit(self, barcode_data, stream_id=None):
+        """Queues a scanned barcode for lookup and returns its scan sequence number immediately."""
+        return self.submit_many([barcode_data], stream_id)[0]
+
+    def submit_many(self, barcodes, stream_id=None):
+        """
+        Queues several barcodes scanned together. The ones that are not already in
+        flight are resolved with one bulk database query. `stream_id` names the camera
+        and is passed through to the LookupResults.
+
+        Returns:
+            List of scan sequence numbers, one per barcode.
+        """
+        scanned_at = time.time()
+        submitted = time.perf_counter()
+        seqs = []
+        with self._lock:
+            to_fetch = [b for b in dict.fromkeys(barcodes) if b not in self._in_flight]
+            for barcode_data in to_fetch:
+                self._in_flight[barcode_data] = []
+            for barcode_data in barcodes:
+                if barcode_data not in to_fetch:
+                    self.lookups_coalesced += 1
+                self._in_flight[barcode_data].append((self._next_seq, stream_id, scanned_at, submitted))
+                seqs.append(self._next_seq)
+                self._next_seq += 1
+            if to_fetch:
+                # Submitted under the lock, so the lookup finds every waiter registered.
+                self._executor.submit(self._lookup, to_fetch)
+                self.lookups_started += 1
+        return seqs
+
+    def _lookup(self, barcodes):
+        """Runs on a pool thread: resolves the barcodes and delivers the results of every scan waiting for them."""
+        try:
+            outcomes = self._resolve_many(barcodes)
+        except Exception as e:
+            outcomes = {b: ('db_error', f"Unexpected error during lookup: {e}", None, None) for b in barcodes}
+        done = time.perf_counter()
+
+        with self._lock:
+            for barcode_data in barcodes:
+                status, message, product, payload_json = outcomes[barcode_data]
+                for seq, stream_id, scanned_at, submitted in self._in_flight.pop(barcode_data):
+                    result = LookupResult(seq, barcode_data, status, message, product, payload_json,
+                                          scanned_at, stream_id)
+                    result.lookup_time = done - submitted
+                    self._reorder[seq] = result
+            while self._next_deliver_seq in self._reorder:
+                self._ready.append(self._reorder.pop(self._next_deliver_seq))
+                self._next_deliver_seq += 1
+            # Only one thread calls the sinks at a time, which keeps results in order; the
+            # others just queue theirs and return, so a slow sink never blocks a completion.
+            if self._delivering:
+                return
+            self._delivering = True
+        while True:
+            with self._lock:
+                if not self._ready:
+                    self._delivering = False
+                    return
+                ready = list(self._ready)
+                self._ready.clear()
+            for ready_result in ready:
+                self._deliver(ready_result)
+
+    def _resolve_many(self, barcodes):
+        """
+        Runs on a pool thread. Barcodes in the catalog snapshot come with a ready cart
+        payload; the rest cost one database round trip and payload building each.
+        """
+        outcomes = {}
+        with metrics.STAGE_SECONDS.labels('lookup').time():
+            for barcode_data, entry in self.db_handler.get_snapshot_entries(barcodes).items():
+                status = 'success' if entry.payload_json else 'invalid_product'
+                outcomes[barcode_data] = (status, entry.message, entry.product, entry.payload_json)
+            barcodes = [b for b in barcodes if b not in outcomes]
+            products = self.db_handler.get_products_by_barcodes(barcodes) if barcodes else {}
+        connected = self.db_handler.is_connected()
+        for barcode_data in barcodes:
+            product = products.get(barcode_data)
+            if not product:
+                if not connected:
+                    outcomes[barcode_data] = ('db_error', f"Barcode '{barcode_data}' detected, but DB not connected.", None, None)
+                else:
+                    outcomes[barcode_data] = ('not_found', f"Barcode '{barcode_data}' not found in DB.", None, None)
+                continue
+            payload_json, message = build_cart_payload(barcode_data, product)
+            status = 'success' if payload_json else 'invalid_product'
+            outcomes[barcode_data] = (status, message, product, payload_json)
+        return outcomes
+
+    def _deliver(self, result):
+        metrics.LOOKUPS.labels(result.status).inc()
+        for sink in self.sinks:
+            try:
+                sink(result)
+            except Exception as e:
+                print(f"[ERROR] Lookup result sink failed for '{result.barcode_data}': {e}")
+
+    def get_stats(self):
+        """Returns lookup counters and how many scans are waiting for a result."""
+        with self._lock:
+            return {
+                'lookups_started': self.lookups_started,
+                'lookups_coalesced': self.lookups_coalesced,
+                'pending': self._next_seq - self._next_deliver_seq + len(self._ready),
+            }
+
+    def close(self, wait=True):
+        """Stops accepting scans; with wait=True, finishes and delivers pending lookups."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,118 @@
+from collections import deque
+
+import config
+from barcode_processor import process_barcodes_in_roi
+
+
+def _union_rect(rects):
+    """Smallest (x, y, w, h) rect covering all given rects."""
+    x0 = min(r[0] for r in rects)
+    y0 = min(r[1] for r in rects)
+    x1 = max(r[0] + r[2] for r in rects)
+    y1 = max(r[1] + r[3] for r in rects)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+class RoiTracker:
+    """
+    Predicts where the barcode will be in the next frame and decodes only that region.
+
+    While a product is held in front of the camera the barcode moves only a few pixels
+    per frame, so a padded crop around the recent rects is enough. The tracker falls
+    back to a full-frame scan on a miss and every `full_scan_interval` frames, so new
+    barcodes elsewhere in the frame are still picked up.
+    """
+    def __init__(self,
+                 full_scan_interval=getattr(config, 'ROI_FULL_SCAN_INTERVAL', 15),
+                 padding=getattr(config, 'ROI_PADDING', 0.5),
+                 min_padding_px=getattr(config, 'ROI_MIN_PADDING_PX', 24),
+                 history=getattr(config, 'ROI_HISTORY', 3),
+                 max_area_ratio=getattr(config, 'ROI_MAX_AREA_RATIO', 0.6)):
+        self.full_scan_interval = full_scan_interval
+        self.padding = padding
+        self.min_padding_px = min_padding_px
+        self.max_area_ratio = max_area_ratio
+        self.padding_scale = 1.0  # Lowered by the decode governor for smaller crops
+        self._rects = deque(maxlen=history)
+        self._frames_since_full_scan = 0
+        self._full_scan_requested = False  # Set after an ROI scan missed
+        self.full_scans = 0
+        self.roi_scans = 0
+        self.roi_misses = 0
+
+    def next_roi(self, frame_shape, motion_roi=None):
+        """
+        Returns the (x, y, w, h) region to decode in the next frame, or None for a full scan.
+
+        Args:
+            frame_shape: Shape of the frame.
+            motion_roi: Changed region reported by the motion gate, if any. It is only used
+                while no barcode is tracked and no full scan is due (after a miss or every
+                `full_scan_interval` frames); a tracked position or a due full scan wins.
+        """
+        if self._full_scan_requested or self._frames_since_full_scan >= self.full_scan_interval - 1:
+            return None
+        if not self._rects:
+            return motion_roi
+        frame_h, frame_w = frame_shape[:2]
+        (x, y, w, h) = _union_rect(self._rects)
+
+        # Extrapolate the motion between the last two detections.
+        if len(self._rects) >= 2:
+            (px, py, pw, ph) = self._rects[-2]
+            (lx, ly, lw, lh) = self._rects[-1]
+            x += (lx + lw // 2) - (px + pw // 2)
+            y += (ly + lh // 2) - (py + ph // 2)
+
+        pad_x = int(max(self.min_padding_px, w * self.padding) * self.padding_scale)
+        pad_y = int(max(self.min_padding_px, h * self.padding) * self.padding_scale)
+        x0 = max(0, x - pad_x)
+        y0 = max(0, y - pad_y)
+        x1 = min(frame_w, x + w + pad_x)
+        y1 = min(frame_h, y + h + pad_y)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        # A crop covering most of the frame saves nothing; just scan everything.
+        if (x1 - x0) * (y1 - y0) >= self.max_area_ratio * frame_w * frame_h:
+            return None
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def update(self, barcodes, roi):
+        """Feeds back the decode result for a frame that was scanned with `roi`."""
+        if roi is None:
+            self.full_scans += 1
+            self._frames_since_full_scan = 0
+            self._full_scan_requested = False
+        else:
+            self.roi_scans += 1
+            self._frames_since_full_scan += 1
+
+        if barcodes:
+            self._rects.append(_union_rect([b['rect'] for b in barcodes]))
+        else:
+            if roi is not None:
+                self.roi_misses += 1
+                # Lost a tracked barcode (not just an empty motion region): rescan everything.
+                self._full_scan_requested = bool(self._rects)
+            # Lost the barcode: the next frame gets a full scan.
+            self._rects.clear()
+
+    def process(self, gray_frame):
+        """
+        Drop-in replacement for process_barcodes() that decodes the predicted ROI.
+
+        Returns:
+            tuple: (list_of_barcodes_info, latency) with rects in full-frame coordinates.
+        """
+        roi = self.next_roi(gray_frame.shape)
+        barcodes, latency = process_barcodes_in_roi(gray_frame, roi)
+        self.update(barcodes, roi)
+        return barcodes, latency
+
+    def get_stats(self):
+        """Returns how many frames were scanned in full versus through the ROI."""
+        return {
+            'full_scans': self.full_scans,
+            'roi_scans': self.roi_scans,
+            'roi_misses': self.roi_misses,
+        }
@@ -0,0 +1,126 @@
+import time
+
+import config
+
+
+class _TrackedBarcode:
+    def __init__(self, now):
+        self.first_seen = now
+        self.last_seen = now
+        self.rect = None
+        self.hits = 0              # Decoded frames that contained the barcode
+        self.missing_frames = 0    # Decoded frames in a row that looked at its position without finding it
+        self.missing_since = None  # time of the first of those frames
+        self.emitted = False
+
+
+class ScanDebouncer:
+    """
+    Turns per-frame decode results of one camera into "item entered" events.
+
+    Every barcode is tracked with hysteresis: it is reported once it was decoded in
+    `confirm_frames` frames, and it is only forgotten (so it can be reported again)
+    after it was missing for at least `rearm_seconds` and in at least `confirm_frames`
+    decoded frames. A frame lost to motion blur does not repeat the scan, and a
+    one-frame misread does not trigger a lookup.
+
+    Absence is only counted in frames that actually looked at the barcode's last
+    position: when the decoder only scanned an ROI elsewhere, the barcode is neither
+    present nor missing.
+    """
+    def __init__(self,
+                 confirm_frames=getattr(config, 'SCAN_CONFIRM_FRAMES', 2),
+                 rearm_seconds=getattr(config, 'SCAN_REARM_SECONDS', 1.5)):
+        self.confirm_frames = max(1, confirm_frames)
+        self.rearm_seconds = rearm_seconds
+        self._tracked = {}  # barcode data -> _TrackedBarcode
+        self.frames = 0
+        self.items_entered = 0
+        self.items_left = 0
+        self.detections_suppressed = 0
+        self.candidates_dropped = 0
+
+    def update(self, barcodes, roi=None, now=None):
+        """
+        Feeds the result of one decoded frame.
+
+        Args:
+            barcodes: List of barcode dicts ('data', 'rect') decoded in the frame.
+            roi: (x, y, w, h) region that was decoded, or None for the full frame.
+            now: time.monotonic() of the frame (defaults to the current time).
+
+        Returns:
+            List of barcode data strings that entered the scene with this frame, in frame order.
+        """
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        entered = []
+        present = {}
+        for barcode in barcodes:
+            present.setdefault(barcode['data'], barcode)
+
+        for data, barcode in present.items():
+            tracked = self._tracked.get(data)
+            if (tracked is not None and tracked.missing_frames >= self.confirm_frames
+                    and now - tracked.missing_since >= self.rearm_seconds):
+                # Confirmed missing and gone for the re-arm time, but no later miss expired
+                # it (the frames in between were not decoded): this is a new item. A single
+                # missed frame never re-arms, however long ago it was.
+                del self._tracked[data]
+                if tracked.emitted:
+                    self.items_left += 1
+                else:
+                    self.candidates_dropped += 1
+                tracked = None
+            if tracked is None:
+                tracked = self._tracked[data] = _TrackedBarcode(now)
+            tracked.last_seen = now
+            tracked.rect = barcode.get('rect')
+            tracked.hits += 1
+            tracked.missing_frames = 0
+            tracked.missing_since = None
+            if tracked.emitted:
+                self.detections_suppressed += 1
+            elif tracked.hits >= self.confirm_frames:
+                tracked.emitted = True
+                self.items_entered += 1
+                entered.append(data)
+
+        for data, tracked in list(self._tracked.items()):
+            if data in present or not self._looked_at(tracked.rect, roi):
+                continue
+            if tracked.missing_since is None:
+                tracked.missing_since = now
+            tracked.missing_frames += 1
+            if (tracked.missing_frames >= self.confirm_frames
+                    and now - tracked.missing_since >= self.rearm_seconds):
+                del self._tracked[data]
+                if tracked.emitted:
+                    self.items_left += 1
+                else:
+                    self.candidates_dropped += 1
+        return entered
+
+    @staticmethod
+    def _looked_at(rect, roi):
+        """True if a decode of `roi` covered (part of) the barcode at `rect`."""
+        if roi is None or rect is None:
+            return True
+        x, y, w, h = rect
+        rx, ry, rw, rh = roi
+        return x < rx + rw and rx < x + w and y < ry + rh and ry < y + h
+
+    def active_barcodes(self):
+        """Barcodes that were reported and are still considered in view."""
+        return [data for data, tracked in self._tracked.items() if tracked.emitted]
+
+    def get_stats(self):
+        """Returns event counters and the number of tracked barcodes."""
+        return {
+            'frames': self.frames,
+            'items_entered': self.items_entered,
+            'items_left': self.items_left,
+            'detections_suppressed': self.detections_suppressed,
+            'candidates_dropped': self.candidates_dropped,
+            'tracked': len(self._tracked),
+        }
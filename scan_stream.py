@@ -0,0 +1,180 @@
+import time
+
+import cv2
+import numpy as np
+
+import config
+from camera_handler import BufferPool, CameraHandler
+from roi_tracker import RoiTracker
+from motion_gate import MotionGate
+from scan_debouncer import ScanDebouncer
+
+
+class ScanStream:
+    """
+    Per-camera state of the scan loop: the camera, its motion gate and ROI tracker,
+    the barcodes it decoded last and its own scan debouncer.
+    """
+    def __init__(self, stream_id, camera, window_name=None):
+        self.stream_id = stream_id
+        self.camera = camera
+        self.window_name = window_name or config.WINDOW_NAME
+        self.threaded = False
+        self.ended = False
+        self.roi_tracker = RoiTracker() if getattr(config, 'ROI_TRACKING_ENABLED', False) else None
+        self.motion_gate = MotionGate() if getattr(config, 'MOTION_GATING_ENABLED', False) else None
+        self.last_decoded_barcodes = []
+        self.debouncer = ScanDebouncer()
+        self.frames = 0
+        # Preallocated buffers so the loop does not allocate per frame: gray frames are
+        # borrowed from the pool until they were decoded, the others are reused in place.
+        self.gray_pool = None
+        self._read_buffer = None
+        self._display_buffer = None
+        self.display_fps = 0.0
+        self._fps_frames = 0
+        self._fps_start = time.perf_counter()
+
+    def start_capture(self, frame_ready=None):
+        """Starts background capture; returns True if it is running."""
+        buffer_size = getattr(config, 'CAPTURE_BUFFER_SIZE', 3)
+        if self.camera.gray_only:
+            # Gray frames are decoded straight from the ring, and a frame waiting for the
+            # decode scheduler keeps its slot leased, so the consumer may hold two slots.
+            buffer_size = max(buffer_size, 4)
+        self.threaded = self.camera.start_capture(buffer_size, frame_ready=frame_ready)
+        return self.threaded
+
+    def grab(self, timeout=1.0):
+        """
+        Takes the next frame of this camera without allocating.
+
+        With background capture this leases the newest frame and returns immediately
+        if none is ready (timeout=0). Otherwise it blocks on the camera.
+
+        Returns:
+            tuple: (frame, frame_lease, gray_frame, gray_holder)
+                frame: BGR frame, or None in grayscale capture mode.
+                frame_lease: Release once done with `frame` (None if there is nothing to release).
+                gray_frame: 2D luminance frame for the decoder, or None if no frame was available;
+                    `ended` is set once the camera stopped delivering frames.
+                gray_holder: Release (via .release()) once `gray_frame` was decoded.
+        """
+        if self.threaded:
+            lease = self.camera.get_latest_frame(timeout=timeout)
+            if lease is None:
+                self.ended = self.camera.capture_ended()
+                return None, None, None, None
+            self.frames += 1
+            if self.camera.gray_only:
+                # The ring slot is the gray frame; the decoder reads it in place.
+                return None, None, lease.frame, lease
+            gray_holder = self._borrow_gray(lease.frame.shape[:2])
+            cv2.cvtColor(lease.frame, cv2.COLOR_BGR2GRAY, dst=gray_holder.array)
+            return lease.frame, lease, gray_holder.array, gray_holder
+
+        if self.camera.gray_only:
+            gray_holder = self._borrow_gray((self.camera.height, self.camera.width))
+            if not self.camera.read_gray(gray_holder.array):
+                gray_holder.release()
+                self.ended = True
+                return None, None, None, None
+            self.frames += 1
+            return None, None, gray_holder.array, gray_holder
+        ret, frame = self.camera.read_frame(image=self._read_buffer)
+        if not ret:
+            self.ended = True
+            return None, None, None, None
+        self._read_buffer = frame
+        self.frames += 1
+        gray_holder = self._borrow_gray(frame.shape[:2])
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray_holder.array)
+        return frame, None, gray_holder.array, gray_holder
+
+    def _borrow_gray(self, shape):
+        if self.gray_pool is None or self.gray_pool.shape != tuple(shape):
+            self.gray_pool = BufferPool(shape, size=getattr(config, 'GRAY_BUFFER_POOL_SIZE', 3))
+        return self.gray_pool.acquire()
+
+    def display_copy(self, frame):
+        """Copies `frame` into this stream's reusable display buffer and returns the buffer."""
+        if self._display_buffer is None or self._display_buffer.shape != frame.shape:
+            self._display_buffer = np.empty_like(frame)
+        np.copyto(self._display_buffer, frame)
+        return self._display_buffer
+
+    def tick_fps(self):
+        """Counts a displayed frame and returns the display FPS, updated once per second."""
+        self._fps_frames += 1
+        now = time.perf_counter()
+        elapsed = now - self._fps_start
+        if elapsed >= 1.0:
+            self.display_fps = self._fps_frames / elapsed
+            self._fps_frames = 0
+            self._fps_start = now
+        return self.display_fps
+
+    def print_stats(self, prefix=''):
+        """Prints capture, motion gating, ROI tracking and debouncer statistics of this stream."""
+        if self.threaded:
+            stats = self.camera.get_capture_stats()
+            print(f"{prefix}Capture stats: {stats['frames_captured']} frames captured, {stats['frames_dropped']} dropped.")
+        if self.motion_gate:
+            stats = self.motion_gate.get_stats()
+            print(f"{prefix}Motion gating stats: {stats['frames_decoded']} frames decoded, {stats['frames_skipped']} skipped.")
+        if self.gray_pool is not None and self.gray_pool.extra_allocations:
+            print(f"{prefix}Gray buffer pool ran dry {self.gray_pool.extra_allocations} time(s); "
+                  f"consider raising GRAY_BUFFER_POOL_SIZE.")
+        if self.roi_tracker:
+            stats = self.roi_tracker.get_stats()
+            print(f"{prefix}ROI tracking stats: {stats['roi_scans']} ROI scans ({stats['roi_misses']} misses), "
+                  f"{stats['full_scans']} full scans.")
+        stats = self.debouncer.get_stats()
+        print(f"{prefix}Scan debouncer stats: {stats['items_entered']} items entered, {stats['items_left']} left, "
+              f"{stats['detections_suppressed']} repeat detections suppressed.")
+
+    def release(self):
+        self.camera.release()
+
+
+def camera_sources():
+    """
+    Returns the configured camera sources as a list of dicts with 'stream_id' and 'source'
+    (plus optional 'width'/'height'). Falls back to the single CAMERA_INDEX camera.
+    """
+    sources = getattr(config, 'CAMERA_SOURCES', None)
+    if not sources:
+        return [{'stream_id': 'cam0', 'source': config.CAMERA_INDEX}]
+    normalized = []
+    for index, entry in enumerate(sources):
+        if not isinstance(entry, dict):
+            entry = {'source': entry}
+        normalized.append({**entry, 'stream_id': str(entry.get('stream_id', f"cam{index}"))})
+    stream_ids = [entry['stream_id'] for entry in normalized]
+    if len(set(stream_ids)) != len(stream_ids):
+        raise ValueError(f"Duplicate stream_id in CAMERA_SOURCES: {stream_ids}")
+    return normalized
+
+
+def open_streams(sources=None, gray_only=False):
+    """
+    Opens every configured camera. Cameras that fail to open are skipped with a warning.
+    With gray_only the cameras capture luminance only (no BGR frames for display).
+
+    Returns:
+        List of ScanStreams, in configuration order.
+    """
+    sources = sources if sources is not None else camera_sources()
+    streams = []
+    for entry in sources:
+        stream_id = entry['stream_id']
+        camera = CameraHandler(entry['source'], stream_id=stream_id,
+                               width=entry.get('width', getattr(config, 'REQUESTED_WIDTH', None)),
+                               height=entry.get('height', getattr(config, 'REQUESTED_HEIGHT', None)),
+                               gray_only=gray_only)
+        if not camera.is_opened():
+            print(f"[WARN] Camera '{stream_id}' ({entry['source']}) could not be opened; skipping it.")
+            continue
+        window_name = config.WINDOW_NAME if len(sources) == 1 else f"{config.WINDOW_NAME} [{stream_id}]"
+        streams.append(ScanStream(stream_id, camera, window_name))
+    return streams
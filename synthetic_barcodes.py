@@ -0,0 +1,117 @@
+import cv2
+import numpy as np
+
+import ean13
+
+
+def random_code(rng):
+    """Returns a random valid 13-digit EAN-13 code."""
+    return ean13.with_checksum(''.join(str(d) for d in rng.integers(0, 10, size=12)))
+
+
+def render_ean13(code, module_px=3, bar_height=None):
+    """
+    Renders a clean EAN-13 symbol (bars only, white quiet zones) as a uint8 grayscale image.
+
+    Args:
+        code: 13-digit code with a valid check digit.
+        module_px: Width of one module in pixels.
+        bar_height: Height of the bars in pixels (default: about 0.6x the symbol width).
+    """
+    modules = np.frombuffer(ean13.encode_modules(code).encode('ascii'), dtype=np.uint8) - ord('0')
+    quiet = np.zeros(ean13.QUIET_ZONE_MODULES, dtype=np.uint8)
+    modules = np.concatenate([quiet, modules, quiet])
+    row = np.repeat(np.where(modules == 1, 0, 255).astype(np.uint8), module_px)
+    if bar_height is None:
+        bar_height = int(ean13.TOTAL_MODULES * module_px * 0.6)
+    margin = module_px * 4
+    image = np.full((bar_height + 2 * margin, row.size), 255, dtype=np.uint8)
+    image[margin:margin + bar_height, :] = row
+    return image
+
+
+def rotate(image, angle):
+    """Rotates by `angle` degrees around the center, enlarging the canvas so nothing is cut off."""
+    if not angle:
+        return image
+    h, w = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_w, new_h = int(h * sin + w * cos), int(h * cos + w * sin)
+    matrix[0, 2] += new_w / 2 - w / 2
+    matrix[1, 2] += new_h / 2 - h / 2
+    return cv2.warpAffine(image, matrix, (new_w, new_h), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+def perspective(image, strength, rng):
+    """Moves each corner inwards by up to `strength` x the image size (simulates a tilted product)."""
+    if not strength:
+        return image
+    h, w = image.shape[:2]
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    jitter = rng.uniform(0, strength, size=(4, 2)) * np.float32([w, h])
+    signs = np.float32([[1, 1], [-1, 1], [-1, -1], [1, -1]])
+    dst = (src + jitter * signs).astype(np.float32)
+    matrix = cv2.getPerspectiveTransform(src, dst)
+    return cv2.warpPerspective(image, matrix, (w, h), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+def adjust_contrast(image, contrast, brightness=0.0):
+    """Scales the gray levels around mid-gray by `contrast` (1.0 = unchanged) and adds `brightness`."""
+    if contrast == 1.0 and not brightness:
+        return image
+    out = (image.astype(np.float32) - 128.0) * contrast + 128.0 + brightness
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+def add_noise(image, sigma, rng):
+    """Adds Gaussian sensor noise with standard deviation `sigma` gray levels."""
+    if not sigma:
+        return image
+    noisy = image.astype(np.float32) + rng.normal(0.0, sigma, size=image.shape)
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def blur(image, sigma):
+    """Gaussian blur (defocus / motion softness)."""
+    if not sigma:
+        return image
+    return cv2.GaussianBlur(image, (0, 0), sigma)
+
+
+def make_scene(rng, canvas_size=(640, 480), num_codes=1, module_px=3, angle=0.0,
+               blur_sigma=0.0, noise_sigma=0.0, perspective_strength=0.0, contrast=1.0,
+               background=200):
+    """
+    Builds one synthetic grayscale frame containing `num_codes` EAN-13 symbols.
+
+    Per-symbol transforms (rotation, perspective) are applied before placement; blur,
+    contrast and noise are applied to the whole frame like a camera would.
+
+    Returns:
+        tuple: (gray_frame, expected_codes)
+    """
+    width, height = canvas_size
+    frame = np.full((height, width), background, dtype=np.uint8)
+    codes = []
+    # Place symbols in equal-width columns so they never overlap.
+    cell_w = width // num_codes
+    for index in range(num_codes):
+        code = random_code(rng)
+        symbol = render_ean13(code, module_px=module_px)
+        symbol = perspective(symbol, perspective_strength, rng)
+        symbol = rotate(symbol, angle * rng.choice([-1, 1]) if angle else 0.0)
+        sh, sw = symbol.shape
+        if sw > cell_w or sh > height:
+            scale = min(cell_w / sw, height / sh)
+            symbol = cv2.resize(symbol, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            sh, sw = symbol.shape
+        x = index * cell_w + int(rng.integers(0, cell_w - sw + 1))
+        y = int(rng.integers(0, height - sh + 1))
+        frame[y:y + sh, x:x + sw] = np.minimum(frame[y:y + sh, x:x + sw], symbol)
+        codes.append(code)
+
+    frame = blur(frame, blur_sigma)
+    frame = adjust_contrast(frame, contrast)
+    frame = add_noise(frame, noise_sigma, rng)
+    return frame, codes
@@ -0,0 +1,98 @@
+import struct
+import zlib
+
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('pyzbar')
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')
+
+from fastapi import HTTPException  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import api_server  # noqa: E402
+import config  # noqa: E402
+from api_server import MultipartImageReader  # noqa: E402
+
+BOUNDARY = b'----boundary1234'
+
+
+def _multipart(parts):
+    """parts: list of (field name, filename or None, bytes)."""
+    body = b''
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += (b'--' + BOUNDARY + b'\r\nContent-Disposition: ' + disposition.encode()
+                 + b'\r\nContent-Type: application/octet-stream\r\n\r\n' + data + b'\r\n')
+    return body + b'--' + BOUNDARY + b'--\r\n'
+
+
+def _read(body, chunk_size, max_images=4, max_image_bytes=1000):
+    reader = MultipartImageReader(BOUNDARY, 'files', max_images, max_image_bytes)
+    for start in range(0, len(body), chunk_size):
+        reader.write(body[start:start + chunk_size])
+    reader.finalize()
+    return reader.images
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_reader_collects_files_across_chunk_boundaries(chunk_size):
+    body = _multipart([('files', 'a.png', b'\x00\r\n--' + bytes(range(256))),
+                       ('comment', None, b'ignored'),
+                       ('files', None, b'second')])
+    assert _read(body, chunk_size) == [('a.png', b'\x00\r\n--' + bytes(range(256))), (None, b'second')]
+
+
+def test_reader_limits_the_number_of_images():
+    body = _multipart([('files', f'{i}.png', b'x') for i in range(3)])
+    with pytest.raises(HTTPException) as error:
+        _read(body, 4096, max_images=2)
+    assert error.value.status_code == 413
+
+
+def test_reader_limits_the_image_size_while_streaming():
+    body = _multipart([('files', 'big.png', b'x' * 1001)])
+    with pytest.raises(HTTPException) as error:
+        _read(body, 64, max_image_bytes=1000)
+    assert error.value.status_code == 413
+
+
+def _png_header(width, height):
+    chunk = b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+
+@pytest.fixture
+def client():
+    with TestClient(api_server.create_api_app()) as client:
+        yield client
+
+
+def _post_files(client, parts, **kwargs):
+    return client.post('/decode', content=_multipart(parts),
+                       headers={'Content-Type': f'multipart/form-data; boundary={BOUNDARY.decode()}'}, **kwargs)
+
+
+def test_decode_requires_multipart(client):
+    assert client.post('/decode', content=b'abc', headers={'Content-Type': 'image/png'}).status_code == 415
+
+
+def test_decode_requires_files(client):
+    assert _post_files(client, [('other', None, b'x')]).status_code == 422
+
+
+def test_decode_rejects_oversized_requests(client):
+    limit = getattr(config, 'DECODE_API_MAX_REQUEST_BYTES', 32 * 1024 * 1024)
+    response = client.post('/decode', content=b'x', headers={
+        'Content-Type': f'multipart/form-data; boundary={BOUNDARY.decode()}',
+        'Content-Length': str(limit + 1)})
+    assert response.status_code == 413
+
+
+def test_decode_rejects_too_many_pixels(client):
+    response = _post_files(client, [('files', 'huge.png', _png_header(100000, 100000))])
+    assert response.status_code == 413
+    assert client.post('/decode/raw', content=_png_header(100000, 100000)).status_code == 413
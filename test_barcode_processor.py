@@ -0,0 +1,97 @@
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('pyzbar')
+
+import barcode_processor  # noqa: E402
+from synthetic_barcodes import render_ean13  # noqa: E402
+
+CODE = '4006381333931'
+OTHER = '5901234123457'
+
+
+def _scene(height=480, width=640):
+    rng = np.random.default_rng(0)
+    return np.clip(230 + rng.normal(0, 6, (height, width)), 0, 255).astype(np.uint8)
+
+
+def _paste(frame, image, x, y):
+    frame[y:y + image.shape[0], x:x + image.shape[1]] = image
+    return frame
+
+
+@pytest.fixture
+def decoder():
+    return barcode_processor.ScanlineEAN13Decoder(num_lines=12, min_agreement=2, vertical=True)
+
+
+def test_decodes_and_vouches_for_a_single_code(decoder):
+    frame = _paste(_scene(), render_ean13(CODE), 100, 150)
+    barcodes, complete = decoder.decode(frame)
+    assert [b['data'] for b in barcodes] == [CODE]
+    assert complete
+    x, y, w, h = barcodes[0]['rect']
+    assert x <= 100 + 11 * 3 and x + w >= 100 + 11 * 3 + 95 * 3
+
+
+@pytest.mark.parametrize('transform', [np.transpose, lambda image: image[::-1, ::-1]])
+def test_decodes_rotated_codes(decoder, transform):
+    frame = np.ascontiguousarray(transform(_paste(_scene(), render_ean13(CODE), 100, 150)))
+    barcodes, complete = decoder.decode(frame)
+    assert [b['data'] for b in barcodes] == [CODE]
+    assert complete
+
+
+def test_blank_and_noise_frames(decoder):
+    assert decoder.decode(_scene()) == ([], False)
+    noise = np.random.default_rng(1).integers(0, 256, (480, 640)).astype(np.uint8)
+    assert decoder.decode(noise) == ([], False)
+    assert decoder.decode(np.zeros((0, 0), dtype=np.uint8)) == ([], False)
+
+
+@pytest.mark.parametrize('y', [4, 52])  # outer band above the first line, between two lines
+def test_does_not_vouch_with_an_unread_code_off_the_scanlines(decoder, y):
+    frame = _paste(_scene(), render_ean13(CODE), 100, 150)
+    small = render_ean13(OTHER, module_px=2, bar_height=8)
+    _paste(frame, small, 400, y)
+    barcodes, complete = decoder.decode(frame)
+    assert [b['data'] for b in barcodes] == [CODE]
+    assert not complete
+
+
+def test_does_not_vouch_with_a_second_code_on_the_scanlines(decoder):
+    frame = _paste(_scene(height=600, width=900), render_ean13(CODE), 20, 150)
+    _paste(frame, render_ean13(OTHER, module_px=2)[:, :-60], 500, 150)  # cut off, unreadable
+    barcodes, complete = decoder.decode(frame)
+    assert [b['data'] for b in barcodes] == [CODE]
+    assert not complete
+
+
+def test_stats_are_consistent_across_threads(decoder):
+    frames = [_paste(_scene(), render_ean13(CODE), 100, 150), _scene()]
+
+    def worker(index):
+        for _ in range(20):
+            barcodes, complete = decoder.decode(frames[index % 2])
+            assert complete == bool(barcodes)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = decoder.get_stats()
+    assert stats['calls'] == 80
+    assert stats['hits'] == 40
+    assert stats['complete'] == 40
+
+
+def test_merge_decoder_stats():
+    stats = {'scanline': {'calls': 2, 'hits': 1, 'complete': 1, 'seconds': 0.5}}
+    merged = barcode_processor.merge_decoder_stats([stats, stats])
+    assert merged['scanline']['calls'] == 4
+    assert merged['scanline']['hit_rate'] == 0.5
+    assert merged['scanline']['avg_ms'] == 250.0
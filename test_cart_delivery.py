@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+
+from cart_delivery import CartDeliveryService, DeliveryItem, Outbox  # noqa: E402
+
+
+class _CartServer:
+    """Stub Flutter server: records every POST and answers with queued status codes (200 when empty)."""
+    def __init__(self):
+        self.requests = []  # (Idempotency-Key, parsed body)
+        self.statuses = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server.lock:
+                    server.requests.append((self.headers.get('Idempotency-Key'), body))
+                    status = server.statuses.pop(0) if server.statuses else 200
+                self.send_response(status)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/cart"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def cart_server():
+    server = _CartServer()
+    yield server
+    server.close()
+
+
+def _service(url, **kwargs):
+    kwargs.setdefault('num_workers', 1)
+    kwargs.setdefault('backoff_base', 0.01)
+    kwargs.setdefault('outbox_path', None)
+    return CartDeliveryService(target_url=url, **kwargs)
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def test_retries_with_the_same_idempotency_key(cart_server):
+    cart_server.statuses = [503, 503]
+    service = _service(cart_server.url, max_retries=3)
+    service.start()
+    service.enqueue(json.dumps({'barcode': '4006381333931'}))
+    _wait_for(lambda: service.get_stats()['delivered'] == 1)
+    service.stop()
+
+    keys = [key for key, _ in cart_server.requests]
+    assert len(keys) == 3
+    assert keys[0] and len(set(keys)) == 1
+    assert service.get_stats()['retries'] == 2
+
+
+def test_rejected_payload_is_not_retried(cart_server):
+    cart_server.statuses = [400]
+    service = _service(cart_server.url, max_retries=3)
+    service.start()
+    service.enqueue(json.dumps({'barcode': 'bad'}))
+    _wait_for(lambda: service.get_stats()['failed'] == 1)
+    service.stop()
+    assert len(cart_server.requests) == 1
+
+
+def test_batches_payloads_into_one_array(cart_server):
+    service = _service(cart_server.url, batch_size=3, batch_wait=1.0)
+    for i in range(3):
+        service.enqueue(json.dumps({'n': i}))
+    service.start()
+    _wait_for(lambda: service.get_stats()['delivered'] == 3)
+    service.stop()
+
+    assert len(cart_server.requests) == 1
+    key, body = cart_server.requests[0]
+    assert body == [{'n': 0}, {'n': 1}, {'n': 2}]
+    assert len(key.split(',')) == 3
+
+
+def _write_outbox(path, count):
+    outbox = Outbox(str(path))
+    outbox.load_pending()
+    items = [DeliveryItem(f"id{i}", json.dumps({'n': i})) for i in range(count)]
+    for item in items:
+        outbox.append_add(item)
+    outbox.append_ack(items[0].item_id)
+    outbox.close()
+    return items
+
+
+def _pending_ids(path):
+    outbox = Outbox(str(path))
+    try:
+        return [item.item_id for item in outbox.load_pending()]
+    finally:
+        outbox.close()
+
+
+def test_replays_the_outbox_with_the_original_ids(cart_server, tmp_path):
+    path = tmp_path / 'outbox.jsonl'
+    _write_outbox(path, 3)
+    service = _service(cart_server.url, outbox_path=str(path))
+    service.start()
+    _wait_for(lambda: service.get_stats()['delivered'] == 2)
+    service.stop()
+
+    assert service.get_stats()['replayed'] == 2
+    assert sorted(key for key, _ in cart_server.requests) == ['id1', 'id2']
+    # Everything was acked, so nothing is replayed again.
+    assert _pending_ids(path) == []
+
+
+@pytest.mark.parametrize('policy, kept', [('drop_oldest', ['id3', 'id4']),
+                                          ('drop_newest', ['id1', 'id2']),
+                                          ('block', ['id1', 'id2'])])
+def test_outbox_replay_respects_the_queue_size(cart_server, tmp_path, policy, kept):
+    path = tmp_path / 'outbox.jsonl'
+    _write_outbox(path, 5)
+    service = _service(cart_server.url, outbox_path=str(path), max_queue=2, overflow_policy=policy)
+    service.start()
+    stats = service.get_stats()
+    assert stats['replayed'] == 2
+    assert stats['dropped'] == 2
+    _wait_for(lambda: service.get_stats()['delivered'] == 2)
+    service.stop()
+
+    assert sorted(key for key, _ in cart_server.requests) == kept
+    assert _pending_ids(path) == []
@@ -0,0 +1,110 @@
+import datetime
+import json
+
+import pytest
+
+import catalog_snapshot
+from catalog_snapshot import CatalogSnapshot, SnapshotEntry, barcode_from_key, barcode_key, export_snapshot
+
+
+class _Collection:
+    """In-memory stand-in for a products collection; supports the queries export_snapshot() sends."""
+    def __init__(self, products):
+        self.products = products
+        self.queries = []
+
+    def find(self, query):
+        self.queries.append(query)
+        for product in self.products:
+            if all(product.get(field) is not None and product[field] >= condition['$gte']
+                   for field, condition in query.items()):
+                yield dict(product)
+
+
+@pytest.mark.parametrize('barcode', ['4006381333931', '0012345678905', '00', '1', '9' * 17])
+def test_barcode_key_round_trip(barcode):
+    assert barcode_from_key(barcode_key(barcode)) == barcode
+
+
+def test_barcode_key_keeps_leading_zeros_distinct():
+    assert barcode_key('012') != barcode_key('12')
+    assert sorted([barcode_key('2'), barcode_key('10')]) == [barcode_key('2'), barcode_key('10')]
+
+
+@pytest.mark.parametrize('barcode', ['', 'abc', '12a', '1' * 18, None])
+def test_barcode_key_rejects_unkeyable_codes(barcode):
+    assert barcode_key(barcode) is None
+
+
+def test_entry_round_trip_with_newlines():
+    product = {'name': 'Two\nlines', 'price': '12.5'}
+    entry = SnapshotEntry('{"a": 1}', 'Message\nwith a newline', json.dumps(product))
+    decoded = SnapshotEntry.decode(entry.encode())
+    assert decoded.payload_json == '{"a": 1}'
+    assert decoded.message == 'Message\nwith a newline'
+    assert decoded.product == product
+
+
+def test_entry_without_payload():
+    decoded = SnapshotEntry.decode(SnapshotEntry(None, "missing price", '{}').encode())
+    assert decoded.payload_json is None
+    assert decoded.message == "missing price"
+
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    entries = {
+        '4006381333931': SnapshotEntry.from_product('4006381333931', {'_id': 1, 'ten_san_pham': 'Milk\nfresh', 'gia_ban': '30,000 VND'}),
+        '0012345678905': SnapshotEntry.from_product('0012345678905', {'ten_san_pham': 'Tea', 'gia_ban': '12.5'}),
+        '1' * 18: SnapshotEntry.from_product('1' * 18, {'name': 'Too long', 'price': '1'}),
+    }
+    assert catalog_snapshot.write_snapshot(path, entries) == 2
+
+    snapshot = CatalogSnapshot(path)
+    try:
+        assert snapshot.count == 2
+        milk = snapshot.get('4006381333931')
+        assert milk.product == {'ten_san_pham': 'Milk\nfresh', 'gia_ban': '30,000 VND'}
+        assert json.loads(milk.payload_json) == {'name': 'Milk\nfresh', 'price': 30000.0, 'quantity': 1}
+        assert milk.message == 'Product for Flutter: Milk\nfresh, Price: 30000.0'
+        assert snapshot.get('12345678905') is None  # Same digits without the leading zeros
+        assert snapshot.get('1' * 18) is None
+        assert set(snapshot.get_many(['0012345678905', '4006381333931', '5901234123457'])) == \
+            {'0012345678905', '4006381333931'}
+        assert [barcode for barcode, _ in snapshot.items()] == ['0012345678905', '4006381333931']
+    finally:
+        snapshot.close()
+
+
+def test_rejects_other_versions(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    catalog_snapshot.write_snapshot(path, {})
+    with open(path, 'r+b') as f:
+        f.write(catalog_snapshot.HEADER.pack(catalog_snapshot.MAGIC, catalog_snapshot.VERSION - 1, 0, 0, 0.0, 0.0, 0))
+    assert CatalogSnapshot.open_if_exists(path) is None
+
+
+def test_incremental_refresh_includes_the_marker_instant(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    t0 = datetime.datetime(2026, 1, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+    products = [
+        {'barcode': '4006381333931', 'name': 'Milk', 'price': '1', 'updated_at': t0},
+    ]
+    collection = _Collection(products)
+    assert export_snapshot(collection, path)['products'] == 1
+
+    # Written in the same instant as the newest product of the last refresh.
+    products.append({'barcode': '5901234123457', 'name': 'Tea', 'price': '2', 'updated_at': t0})
+    products.append({'barcode': '0012345678905', 'name': 'Old', 'price': '3',
+                     'updated_at': t0 - datetime.timedelta(days=1)})
+    products[0] = dict(products[0], deleted=True, updated_at=t0 + datetime.timedelta(seconds=1))
+    stats = export_snapshot(collection, path)
+    assert stats['incremental']
+    assert stats['removed'] == 1
+    assert collection.queries[-1] == {'updated_at': {'$gte': t0}}
+
+    snapshot = CatalogSnapshot(path)
+    try:
+        assert [barcode for barcode, _ in snapshot.items()] == ['5901234123457']
+    finally:
+        snapshot.close()
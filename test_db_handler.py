@@ -0,0 +1,99 @@
+import pytest
+
+pytest.importorskip('pymongo')
+
+import db_handler  # noqa: E402
+from db_handler import CircuitBreaker, ProductCache  # noqa: E402
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(db_handler, 'time', clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, base_backoff=1.0, max_backoff=4.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # Resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.seconds_until_retry() == 1.0
+
+
+def test_breaker_half_open_lets_one_trial_call_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=1.0, max_backoff=4.0)
+    breaker.record_failure()
+    clock.now += 1.0
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()  # The trial call is still in flight
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_breaker_backoff_doubles_up_to_the_cap(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=1.0, max_backoff=4.0)
+    breaker.record_failure()
+    delays = []
+    for _ in range(4):
+        delays.append(breaker.seconds_until_retry())
+        clock.now += delays[-1]
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert delays == [1.0, 2.0, 4.0, 4.0]
+    # Success resets the backoff.
+    clock.now += breaker.seconds_until_retry()
+    assert breaker.allow_request()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.seconds_until_retry() == 1.0
+
+
+def test_cache_ttl_negative_entries_and_stale_fallback(clock):
+    cache = ProductCache(max_size=10, ttl=10.0, negative_ttl=2.0)
+    cache.put('1', {'name': 'Milk'})
+    cache.put('2', None)
+    assert cache.get('1') == (True, {'name': 'Milk'})
+    assert cache.get('2') == (True, None)
+    clock.now += 5.0
+    assert cache.get('2') == (False, None)
+    assert cache.get('1') == (True, {'name': 'Milk'})
+    clock.now += 10.0
+    assert cache.get('1') == (False, None)
+    assert cache.get('1', allow_stale=True) == (True, {'name': 'Milk'})
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['negative_hits'], stats['misses'], stats['stale_hits']) == (2, 1, 2, 1)
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = ProductCache(max_size=2, ttl=10.0, negative_ttl=2.0)
+    cache.put('1', {'n': 1})
+    cache.put('2', {'n': 2})
+    cache.get('1')
+    cache.put('3', {'n': 3})
+    assert cache.get('2') == (False, None)
+    assert cache.get('1')[0] and cache.get('3')[0]
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_cache_returns_copies(clock):
+    cache = ProductCache(max_size=2, ttl=10.0, negative_ttl=2.0)
+    cache.put('1', {'n': 1})
+    cache.get('1')[1]['n'] = 2
+    assert cache.get('1') == (True, {'n': 1})
@@ -0,0 +1,111 @@
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('pyzbar')
+
+from decode_pool import DecodePool  # noqa: E402
+
+needs_sigstop = pytest.mark.skipif(not hasattr(signal, 'SIGSTOP'), reason="needs POSIX job control signals")
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**kwargs):
+        kwargs.setdefault('max_frame_shape', (64, 64))
+        pool = DecodePool(**kwargs)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        if hasattr(signal, 'SIGCONT'):
+            for worker in pool._workers:
+                if worker.is_alive():
+                    os.kill(worker.pid, signal.SIGCONT)
+        pool.close()
+
+
+def _frame():
+    return np.zeros((32, 32), dtype=np.uint8)
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.02)
+
+
+def _hold_task(pool, seq):
+    """Pretends the (stopped) worker 0 picked up frame `seq` just now."""
+    pool._task_started[0] = time.monotonic()
+    pool._current_tasks[0] = seq
+
+
+def test_results_keep_submission_order_per_stream(make_pool):
+    pool = make_pool(num_workers=2, num_slots=8)
+    submitted = {'a': [], 'b': []}
+    for i in range(8):
+        stream_id = 'ab'[i % 2]
+        frame_id = pool.submit(_frame(), frame_id=i, timeout=5.0, stream_id=stream_id)
+        submitted[stream_id].append(frame_id)
+
+    results = []
+    while len(results) < 8:
+        result = pool.get_result(timeout=10.0)
+        assert result is not None
+        results.append(result)
+    for stream_id, frame_ids in submitted.items():
+        assert [r.frame_id for r in results if r.stream_id == stream_id] == frame_ids
+    assert all(r.error is None for r in results)
+
+
+@needs_sigstop
+def test_timed_out_frame_keeps_its_slot_until_the_late_result(make_pool):
+    pool = make_pool(num_workers=1, num_slots=1, result_timeout=0.2)
+    worker = pool._workers[0]
+    os.kill(worker.pid, signal.SIGSTOP)
+    assert pool.submit(_frame(), stream_id='a') == 0
+    _hold_task(pool, 0)
+
+    result = pool.get_result(timeout=5.0)
+    assert result.frame_id == 0 and result.error == 'decode result timed out'
+    # The worker could still be reading the slot, so it must not be handed out again.
+    assert pool.get_stats()['free_slots'] == 0
+    assert pool.submit(_frame(), stream_id='a') is None
+
+    os.kill(worker.pid, signal.SIGCONT)
+    _wait_for(lambda: pool.get_stats()['free_slots'] == 1)
+    assert pool.get_result(timeout=0.5) is None  # The late result itself is dropped.
+
+
+@needs_sigstop
+def test_frame_of_a_dead_worker_is_released_once(make_pool):
+    pool = make_pool(num_workers=1, num_slots=2, result_timeout=60.0)
+    worker = pool._workers[0]
+    os.kill(worker.pid, signal.SIGSTOP)
+    assert pool.submit(_frame(), stream_id='a') == 0
+    assert pool.submit(_frame(), stream_id='a') == 1
+    _hold_task(pool, 0)
+    os.kill(worker.pid, signal.SIGKILL)
+
+    result = pool.get_result(timeout=10.0)
+    assert result.frame_id == 0 and result.error == 'decode worker died'
+    # The restarted worker decodes both queued tasks; frame 0's result is ignored.
+    result = pool.get_result(timeout=30.0)
+    assert result.frame_id == 1 and result.error is None
+    _wait_for(lambda: pool.get_stats()['queue_depth'] == 0)
+    stats = pool.get_stats()
+    assert stats['workers_restarted'] == 1
+    assert stats['frames_lost'] == 1
+    _wait_for(lambda: pool._current_tasks[0] == 1)
+    time.sleep(0.3)
+    assert pool.get_stats()['free_slots'] == 2
@@ -0,0 +1,87 @@
+import asyncio
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('pyzbar')
+
+from decode_service import (DecodeService, ImageTooLarge, check_image_pixels,  # noqa: E402
+                            decode_image_bytes, read_image_size)
+
+
+def _png_header(width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    chunk = b'IHDR' + ihdr
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+
+def _bmp_header(width, height):
+    return b'BM' + bytes(12) + struct.pack('<IiiHH', 40, width, -height, 1, 8)
+
+
+def _jpeg_header(width, height, sof=0xC2):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + bytes(9)
+    comment = b'\xff\xfe' + struct.pack('>H', 2 + 300) + bytes(300)
+    frame = bytes([0xFF, sof]) + struct.pack('>HBHHB', 11, 8, height, width, 1) + bytes(3)
+    return b'\xff\xd8' + app0 + comment + frame
+
+
+def _webp_header(width, height, kind):
+    if kind == 'VP8X':
+        body = bytes(4) + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')
+    elif kind == 'VP8L':
+        body = b'\x2f' + struct.pack('<I', (width - 1) | ((height - 1) << 14))
+    else:
+        body = bytes(3) + b'\x9d\x01\x2a' + struct.pack('<HH', width, height)
+    chunk = kind.encode('ascii') + struct.pack('<I', len(body)) + body
+    return b'RIFF' + struct.pack('<I', 4 + len(chunk)) + b'WEBP' + chunk
+
+
+@pytest.mark.parametrize('header', [_png_header, _bmp_header, _jpeg_header,
+                                    lambda w, h: _jpeg_header(w, h, sof=0xC0),
+                                    lambda w, h: _webp_header(w, h, 'VP8 '),
+                                    lambda w, h: _webp_header(w, h, 'VP8L'),
+                                    lambda w, h: _webp_header(w, h, 'VP8X')])
+def test_reads_the_size_from_the_header(header):
+    assert read_image_size(header(1234, 567)) == (1234, 567)
+
+
+@pytest.mark.parametrize('data', [b'', b'GIF89a' + bytes(20), b'\xff\xd8\xff', b'\xff\xd8\xff\xda\x00\x02',
+                                  b'\x89PNG\r\n\x1a\n'])
+def test_unknown_or_damaged_headers(data):
+    assert read_image_size(data) is None
+
+
+@pytest.mark.parametrize('ext', ['.png', '.jpg'])
+def test_reads_the_size_of_encoded_images(ext):
+    ok, encoded = cv2.imencode(ext, np.full((37, 53), 255, dtype=np.uint8))
+    assert ok
+    assert read_image_size(encoded.tobytes()) == (53, 37)
+    result = decode_image_bytes(encoded.tobytes())
+    assert result['ok'] and (result['width'], result['height']) == (53, 37)
+
+
+def test_decode_refuses_unsupported_formats():
+    result = decode_image_bytes(b'GIF89a' + bytes(100))
+    assert not result['ok'] and 'Unsupported' in result['error']
+
+
+def test_pixel_limit():
+    check_image_pixels(_png_header(1000, 1000), 1_000_000)
+    with pytest.raises(ImageTooLarge):
+        check_image_pixels(_png_header(1001, 1000), 1_000_000)
+
+
+def test_service_rejects_the_request_before_decoding():
+    service = DecodeService(max_workers=1, max_pixels=100 * 100)
+    try:
+        with pytest.raises(ImageTooLarge):
+            asyncio.run(service.decode_images([_png_header(10, 10), _png_header(50000, 50000)]))
+        stats = service.get_stats()
+        assert stats['images_too_large'] == 1
+        assert stats['images_decoded'] == 0
+    finally:
+        service.close()
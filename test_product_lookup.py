@@ -0,0 +1,129 @@
+import json
+import threading
+
+import pytest
+
+from product_lookup import ProductLookupService, build_cart_payload
+
+
+class _FakeDB:
+    """DBHandler stand-in: products from a dict, optionally held back until released."""
+    def __init__(self, products, connected=True):
+        self.products = products
+        self.connected = connected
+        self.queries = []
+        self.gates = {}  # barcode -> Event the query waits for
+        self.error = None
+
+    def get_snapshot_entries(self, barcodes):
+        return {}
+
+    def get_products_by_barcodes(self, barcodes):
+        self.queries.append(list(barcodes))
+        for barcode in barcodes:
+            if barcode in self.gates:
+                assert self.gates[barcode].wait(5.0)
+        if self.error:
+            raise self.error
+        return {b: self.products[b] for b in barcodes if b in self.products}
+
+    def is_connected(self):
+        return self.connected
+
+
+class _Sink:
+    def __init__(self, expected):
+        self.results = []
+        self.threads = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, result):
+        self.results.append(result)
+        self.threads.append(threading.current_thread())
+        if len(self.results) >= self.expected:
+            self.done.set()
+
+
+PRODUCTS = {
+    '4006381333931': {'ten_san_pham': 'Milk', 'gia_ban': '30,000 VND'},
+    '5901234123457': {'ten_san_pham': 'Tea'},
+}
+
+
+def test_build_cart_payload():
+    payload_json, message = build_cart_payload('4006381333931', PRODUCTS['4006381333931'])
+    assert json.loads(payload_json) == {'name': 'Milk', 'price': 30000.0, 'quantity': 1}
+    assert build_cart_payload('5901234123457', PRODUCTS['5901234123457'])[0] is None
+
+
+def test_results_arrive_in_scan_order_on_pool_threads():
+    db = _FakeDB(PRODUCTS)
+    db.gates['4006381333931'] = threading.Event()
+    sink = _Sink(expected=3)
+    service = ProductLookupService(db, sinks=[sink], max_workers=2)
+    try:
+        seqs = [service.submit('4006381333931'), service.submit('5901234123457'), service.submit('0000000000000')]
+        # The later lookups finish first but wait for the slow one.
+        assert not sink.done.wait(0.2)
+        assert sink.results == []
+        db.gates['4006381333931'].set()
+        assert sink.done.wait(5.0)
+    finally:
+        service.close()
+    assert [r.seq for r in sink.results] == seqs
+    assert [r.status for r in sink.results] == ['success', 'invalid_product', 'not_found']
+    assert all(thread is not threading.current_thread() for thread in sink.threads)
+    assert service.get_stats()['pending'] == 0
+
+
+def test_scans_of_an_in_flight_barcode_share_its_lookup():
+    db = _FakeDB(PRODUCTS)
+    db.gates['4006381333931'] = threading.Event()
+    sink = _Sink(expected=3)
+    service = ProductLookupService(db, sinks=[sink], max_workers=2)
+    try:
+        service.submit_many(['4006381333931', '4006381333931'], stream_id='cam0')
+        service.submit('4006381333931', stream_id='cam1')
+        db.gates['4006381333931'].set()
+        assert sink.done.wait(5.0)
+    finally:
+        service.close()
+    assert db.queries == [['4006381333931']]
+    assert [r.stream_id for r in sink.results] == ['cam0', 'cam0', 'cam1']
+    stats = service.get_stats()
+    assert stats['lookups_started'] == 1
+    assert stats['lookups_coalesced'] == 1
+
+
+def test_lookup_errors_become_db_error_results():
+    db = _FakeDB(PRODUCTS)
+    db.error = RuntimeError("boom")
+    sink = _Sink(expected=1)
+    failing_sink_calls = []
+
+    def failing_sink(result):
+        failing_sink_calls.append(result)
+        raise ValueError("sink failed")
+
+    service = ProductLookupService(db, sinks=[failing_sink, sink], max_workers=1)
+    try:
+        service.submit('4006381333931')
+        assert sink.done.wait(5.0)
+    finally:
+        service.close()
+    assert sink.results[0].status == 'db_error'
+    assert 'boom' in sink.results[0].message
+    assert len(failing_sink_calls) == 1
+
+
+@pytest.mark.parametrize('connected, status', [(True, 'not_found'), (False, 'db_error')])
+def test_missing_products(connected, status):
+    sink = _Sink(expected=1)
+    service = ProductLookupService(_FakeDB({}, connected=connected), sinks=[sink], max_workers=1)
+    try:
+        service.submit('4006381333931')
+        assert sink.done.wait(5.0)
+    finally:
+        service.close()
+    assert sink.results[0].status == status
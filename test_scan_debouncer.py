@@ -0,0 +1,64 @@
+from scan_debouncer import ScanDebouncer
+
+CODE = '4006381333931'
+
+
+def _seen(rect=(10, 10, 50, 20)):
+    return [{'data': CODE, 'rect': rect}]
+
+
+def test_reported_after_confirm_frames():
+    debouncer = ScanDebouncer(confirm_frames=2, rearm_seconds=1.5)
+    assert debouncer.update(_seen(), now=0.0) == []
+    assert debouncer.update(_seen(), now=0.1) == [CODE]
+    assert debouncer.update(_seen(), now=0.2) == []
+    assert debouncer.get_stats()['detections_suppressed'] == 1
+
+
+def test_single_misread_is_not_reported():
+    debouncer = ScanDebouncer(confirm_frames=2, rearm_seconds=1.5)
+    debouncer.update(_seen(), now=0.0)
+    for now in (0.1, 0.2, 2.0):
+        assert debouncer.update([], now=now) == []
+    stats = debouncer.get_stats()
+    assert stats['items_entered'] == 0
+    assert stats['candidates_dropped'] == 1
+
+
+def test_single_missed_frame_does_not_rescan():
+    # One decoded frame without the barcode followed by long gaps (e.g. motion gating)
+    # must not count as the barcode leaving the scene.
+    debouncer = ScanDebouncer(confirm_frames=2, rearm_seconds=1.5)
+    for now in (0.0, 0.1):
+        debouncer.update(_seen(), now=now)
+    debouncer.update([], now=2.1)
+    debouncer.update(_seen(), now=4.1)
+    debouncer.update(_seen(), now=6.1)
+    stats = debouncer.get_stats()
+    assert stats['items_entered'] == 1
+    assert stats['items_left'] == 0
+
+
+def test_rescan_after_confirmed_absence():
+    debouncer = ScanDebouncer(confirm_frames=2, rearm_seconds=1.5)
+    for now in (0.0, 0.1):
+        debouncer.update(_seen(), now=now)
+    debouncer.update([], now=0.2)
+    debouncer.update([], now=0.3)
+    assert debouncer.active_barcodes() == [CODE]
+    # Reappears after the re-arm time without a decoded frame in between.
+    debouncer.update(_seen(), now=2.0)
+    assert debouncer.update(_seen(), now=2.1) == [CODE]
+    stats = debouncer.get_stats()
+    assert stats['items_entered'] == 2
+    assert stats['items_left'] == 1
+
+
+def test_misses_outside_the_decoded_roi_are_ignored():
+    debouncer = ScanDebouncer(confirm_frames=2, rearm_seconds=1.5)
+    for now in (0.0, 0.1):
+        debouncer.update(_seen(), now=now)
+    for now in (1.0, 2.0, 3.0):
+        debouncer.update([], roi=(300, 300, 100, 100), now=now)
+    assert debouncer.active_barcodes() == [CODE]
+    assert debouncer.update(_seen(), now=3.1) == []